@@ -5,11 +5,16 @@ import base64
 import urllib.parse
 import atexit  # 添加atexit模块
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # 配置日誌系統
 def setup_logging():
-    """配置日誌系統"""
+    """配置日誌系統
+
+    所有日誌先寫入內存隊列，由 QueueListener 在後台線程寫入文件和控制台，
+    請求線程不再做同步磁碟 I/O。訪問日誌另外寫入 access.log。
+    """
     # 創建 logs 目錄
     log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
     os.makedirs(log_dir, exist_ok=True)
@@ -32,15 +37,37 @@ def setup_logging():
         encoding='utf-8'
     )
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
     
     # 配置控制台處理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
     
-    # 設置 Werkzeug 日誌級別
-    logging.getLogger('werkzeug').setLevel(logging.INFO)
+    # 配置訪問日誌處理器，每行一個 JSON
+    access_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'access.log'),
+        maxBytes=50*1024*1024,  # 50MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    access_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%Y-%m-%dT%H:%M:%S'))
+    access_handler.addFilter(lambda record: record.name == 'access')
+    
+    # 應用日誌不重複寫入訪問日誌
+    file_handler.addFilter(lambda record: record.name != 'access')
+    console_handler.addFilter(lambda record: record.name != 'access')
+    
+    # 隊列處理器：請求線程只做入隊，寫盤由監聽線程完成
+    log_queue = queue.Queue(-1)
+    root_logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(
+        log_queue, file_handler, console_handler, access_handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    
+    # 設置 Werkzeug 日誌級別，訪問記錄由 access 日誌負責
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
     
     return root_logger
 
@@ -53,7 +80,7 @@ load_dotenv()
 # 將專案根目錄添加到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, request, session, send_from_directory
+from flask import Flask, request, session, send_from_directory, g, Response
 from flask_cors import CORS
 from backend.routes.product_routes import product_bp, UPLOAD_FOLDER
 from backend.routes.auth_routes import auth_bp
@@ -63,8 +90,18 @@ from backend.routes.order_routes import order_bp
 from backend.routes.line_bot_routes import line_bot_bp
 from backend.routes.log_routes import log_bp
 from backend.routes.order_check_routes import order_check_bp
-from backend.config.database import get_db_connection
+from backend.services.file_metadata_service import (
+    lookup_original_filename, is_unique_stored_name, IMMUTABLE_CACHE_CONTROL
+)
 from backend.utils.scheduler import initialize_scheduler, shutdown_scheduler  # 導入調度器函數  
+from backend.utils.access_log import start_access_log, write_access_log
+from backend.utils.request_stats import get_request_stats, get_request_latency
+from backend.utils.metrics import REGISTRY, observe_request
+from backend.utils.query_inspector import finish_query_inspection
+from backend.utils.token_utils import (
+    load_request_token, get_token_admin_id, decode_permissions,
+    USER_TYPE_ADMIN, USER_TYPE_CUSTOMER
+)
 
 # 定義從雙軌文件名中提取原始文件名的函數
 def extract_original_filename(dual_filename):
@@ -94,73 +131,84 @@ app.config.update(
     SESSION_COOKIE_NAME=os.getenv('SESSION_COOKIE_NAME', 'erp_session')
 )
 
+# 設置後抓取 /metrics 需攜帶 X-Metrics-Token 頭部
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 # CORS 配置
 ALLOWED_ORIGINS = [origin.strip() for origin in os.getenv('ALLOWED_ORIGINS').split(',')]
 CORS(app, 
      supports_credentials=True,
      origins=ALLOWED_ORIGINS,
-     allow_headers=['Content-Type', 'Authorization', 'X-Customer-ID', 'X-Company-Name', 'X-Requested-With'],
-     expose_headers=['Set-Cookie'],
+     allow_headers=['Content-Type', 'Authorization', 'X-Customer-ID', 'X-Company-Name', 'X-Requested-With', 'Idempotency-Key'],
+     expose_headers=['Set-Cookie', 'Idempotent-Replayed'],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
 
 # 在每個請求前檢查 session 和 Authorization
 @app.before_request
 def before_request():
+    start_access_log()
+
     if request.method == 'OPTIONS':
         return
 
-    logger.info("當前 session: %s", dict(session))
-    logger.info("請求路徑: %s", request.path)
-    logger.info("請求方法: %s", request.method)
-    logger.info("Cookie: %s", request.cookies)
-    logger.info("Origin: %s", request.headers.get('Origin'))
-    logger.info("Authorization: %s", request.headers.get('Authorization'))
-    
-    # 記錄前端傳遞的自定義頭部
-    customer_id = request.headers.get('X-Customer-ID')
+    # 將解碼後的公司名稱存儲在請求環境中，供後續使用
     company_name = request.headers.get('X-Company-Name')
-    if customer_id:
-        logger.info("X-Customer-ID: %s", customer_id)
     if company_name:
         try:
-            # 解碼公司名稱
-            decoded_company_name = urllib.parse.unquote(company_name)
-            logger.info("X-Company-Name (decoded): %s", decoded_company_name)
-            # 將解碼後的公司名稱存儲在請求環境中，供後續使用
-            request.environ['decoded_company_name'] = decoded_company_name
+            request.environ['decoded_company_name'] = urllib.parse.unquote(company_name)
         except Exception as e:
             logger.error("解碼公司名稱時出錯: %s", str(e))
     
-    # 處理 Authorization header
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        admin_id = auth_header.split(' ')[1]
-        try:
-            admin_id = int(admin_id)
-            session['admin_id'] = admin_id
-            session.modified = True
-        except ValueError:
-            logger.error("Invalid admin_id format: %s", admin_id)
+    # 處理 Authorization header：驗證 JWT 簽名，無需查詢資料庫
+    claims = load_request_token()
+    if claims:
+        if claims['utp'] == USER_TYPE_ADMIN:
+            session['admin_id'] = get_token_admin_id()
+            if 'perm' in claims:
+                session['permissions'] = decode_permissions(claims['perm'])
+            else:
+                # 舊格式 token 不攜帶權限，交由 require_permission 查詢資料庫
+                session.pop('permissions', None)
+        elif claims['utp'] == USER_TYPE_CUSTOMER:
+            session['customer_id'] = int(claims['sub'])
+            if claims.get('cmp'):
+                session['company_name'] = claims['cmp']
+        session.modified = True
+    elif g.token_error:
+        logger.debug("Authorization token 無效: %s", g.token_error)
 
 # 設置響應頭
 @app.after_request
 def after_request(response):
     origin = request.headers.get('Origin')
-    logger.info("请求Origin: '%s'", origin)
-    logger.info("允许的Origins: %s", ALLOWED_ORIGINS)
     
     if origin in ALLOWED_ORIGINS:
         response.headers.update({
             'Access-Control-Allow-Origin': origin,
             'Access-Control-Allow-Credentials': 'true',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Customer-ID, X-Company-Name, X-Requested-With',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Customer-ID, X-Company-Name, X-Requested-With, Idempotency-Key',
             'Access-Control-Allow-Methods': 'GET, PUT, POST, DELETE, OPTIONS',
             'Access-Control-Max-Age': '3600',
             'Vary': 'Origin'
         })
-    else:
+    elif origin:
         logger.warning("Origin不匹配: '%s' 不在允许列表中", origin)
-    return response
+    
+    # 記錄請求耗時與資料庫指標
+    latency = get_request_latency()
+    if latency is not None:
+        stats = get_request_stats()
+        observe_request(request.endpoint, request.method, response.status_code, latency, stats)
+        finish_query_inspection(app, stats['db_queries'])
+    return write_access_log(response)
+
+# Prometheus 指標接口
+@app.route('/metrics')
+def metrics():
+    """輸出 Prometheus 文本格式的指標"""
+    if METRICS_TOKEN and request.headers.get('X-Metrics-Token') != METRICS_TOKEN:
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 # 前端靜態文件路由
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -169,68 +217,43 @@ def serve_static_files(path):
     static_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'seatic', 'dist')
     
     if path and os.path.exists(os.path.join(static_folder, path)):
-        return send_from_directory(static_folder, path)
+        response = send_from_directory(static_folder, path)
+        # Vite 打包產物文件名帶內容哈希，可長期緩存
+        if path.startswith('assets/'):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
     else:
-        return send_from_directory(static_folder, 'index.html')
+        response = send_from_directory(static_folder, 'index.html')
+        # index.html 引用最新的打包產物，每次都需向服務器驗證
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
 # 添加靜態文件路由，用於訪問上傳的文件
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
     """提供靜態文件訪問"""
+    response = send_from_directory(UPLOAD_FOLDER, filename)
     try:
-        logger.info("请求上传文件: %s", filename)
-        logger.info("完整路径: %s", os.path.join(UPLOAD_FOLDER, filename))
+        logger.debug("请求上传文件: %s", filename)
         
         # 獲取文件的基本名稱(不含路徑)
         basename = os.path.basename(filename)
         
-        # 嘗試從資料庫中獲取原始文件名
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 嘗試查找匹配的圖片
-            cursor.execute("SELECT image_original_filename FROM products WHERE image_url LIKE %s", (f'%{basename}%',))
-            result = cursor.fetchone()
-            
-            if result and result[0]:
-                original_filename = result[0]
-                response = send_from_directory(UPLOAD_FOLDER, filename)
-                # 使用RFC 5987編碼格式
-                encoded_filename = urllib.parse.quote(original_filename)
-                response.headers["Content-Disposition"] = f"inline; filename=\"{encoded_filename}\"; filename*=UTF-8''{encoded_filename}"
-                logger.info("從資料庫獲取圖片原始文件名: %s", original_filename)
-                return response
-                
-            # 嘗試查找匹配的文件
-            cursor.execute("SELECT dm_original_filename FROM products WHERE dm_url LIKE %s", (f'%{basename}%',))
-            result = cursor.fetchone()
-            
-            if result and result[0]:
-                original_filename = result[0]
-                response = send_from_directory(UPLOAD_FOLDER, filename)
-                # 使用RFC 5987編碼格式
-                encoded_filename = urllib.parse.quote(original_filename)
-                response.headers["Content-Disposition"] = f"inline; filename=\"{encoded_filename}\"; filename*=UTF-8''{encoded_filename}"
-                logger.info("從資料庫獲取文件原始文件名: %s", original_filename)
-                return response
-        
-        # 如果資料庫中沒有找到，嘗試從文件名中提取
-        original_filename = extract_original_filename(basename)
+        # 按存儲文件名查詢原始文件名（唯一索引 + 進程內緩存），未記錄時從文件名中提取
+        original_filename = lookup_original_filename(basename) or extract_original_filename(basename)
         
         if original_filename and original_filename != basename:
-            response = send_from_directory(UPLOAD_FOLDER, filename)
             # 使用RFC 5987編碼格式
             encoded_filename = urllib.parse.quote(original_filename)
             response.headers["Content-Disposition"] = f"inline; filename=\"{encoded_filename}\"; filename*=UTF-8''{encoded_filename}"
-            logger.info("從文件名提取原始文件名: %s", original_filename)
-            return response
-            
-        # 如果都沒有找到，直接返回文件
-        return send_from_directory(UPLOAD_FOLDER, filename)
+        
+        # 帶 UUID 的存儲文件名不會被覆蓋，允許瀏覽器與 CDN 長期緩存
+        if is_unique_stored_name(basename):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
         
     except Exception as e:
         logger.error("處理文件訪問出錯: %s", str(e))
-        return send_from_directory(UPLOAD_FOLDER, filename)
+    return response
 
 # 註冊藍圖
 app.register_blueprint(product_bp, url_prefix='/api')
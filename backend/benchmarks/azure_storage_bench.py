@@ -0,0 +1,110 @@
+"""Azure Blob 客戶端基準測試（針對本地 Azurite 模擬器）
+
+比較每次調用都新建客戶端並檢查容器（舊做法）與進程內共用客戶端、
+容器檢查只做一次（現做法）在小文件上傳與大文件分塊上傳時的耗時。
+
+先啟動 Azurite::
+
+    docker run -p 10000:10000 mcr.microsoft.com/azure-storage/azurite azurite-blob --blobHost 0.0.0.0
+
+再執行::
+
+    python -m backend.benchmarks.azure_storage_bench [--count 50] [--large-mb 32]
+
+未設置 AZURE_STORAGE_CONNECTION_STRING 時使用 Azurite 默認帳戶。
+"""
+import os
+import io
+import sys
+import time
+import uuid
+import argparse
+import statistics
+
+AZURITE_CONNECTION_STRING = (
+    'DefaultEndpointsProtocol=http;'
+    'AccountName=devstoreaccount1;'
+    'AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;'
+    'BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;'
+)
+
+os.environ.setdefault('AZURE_STORAGE_CONNECTION_STRING', AZURITE_CONNECTION_STRING)
+os.environ.setdefault('AZURE_STORAGE_CONTAINER', 'bench-uploads')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+from backend.utils import azure_storage
+
+def _legacy_upload(data, blob_path):
+    """舊做法：每次新建客戶端，每次上傳前檢查容器"""
+    client = BlobServiceClient.from_connection_string(azure_storage.connection_string)
+    container_client = client.get_container_client(azure_storage.container_name)
+    try:
+        container_client.get_container_properties()
+    except ResourceNotFoundError:
+        try:
+            container_client.create_container()
+        except ResourceExistsError:
+            pass
+    client = BlobServiceClient.from_connection_string(azure_storage.connection_string)
+    blob_client = client.get_blob_client(container=azure_storage.container_name, blob=blob_path)
+    blob_client.upload_blob(io.BytesIO(data), overwrite=True)
+
+def _shared_upload(data, blob_path):
+    """現做法：共用客戶端，容器只檢查一次，大文件並發分塊上傳"""
+    azure_storage.ensure_container_exists()
+    client = azure_storage.get_blob_service_client()
+    blob_client = client.get_blob_client(container=azure_storage.container_name, blob=blob_path)
+    blob_client.upload_blob(
+        io.BytesIO(data),
+        overwrite=True,
+        max_concurrency=azure_storage.AZURE_UPLOAD_MAX_CONCURRENCY
+    )
+
+def _run(label, upload, data, count):
+    timings = []
+    for _ in range(count):
+        blob_path = f"bench/{uuid.uuid4()}.bin"
+        started = time.perf_counter()
+        upload(data, blob_path)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{label:<28} n={count:<4} 平均 {statistics.mean(timings):8.1f}ms  "
+          f"中位數 {statistics.median(timings):8.1f}ms  p95 {p95:8.1f}ms")
+
+def _cleanup():
+    client = azure_storage.get_blob_service_client()
+    container_client = client.get_container_client(azure_storage.container_name)
+    for blob in container_client.list_blobs(name_starts_with='bench/'):
+        container_client.delete_blob(blob.name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Azure Blob 客戶端基準測試')
+    parser.add_argument('--count', type=int, default=50, help='小文件上傳次數')
+    parser.add_argument('--small-kb', type=int, default=64, help='小文件大小（KB）')
+    parser.add_argument('--large-count', type=int, default=3, help='大文件上傳次數')
+    parser.add_argument('--large-mb', type=int, default=32, help='大文件大小（MB）')
+    args = parser.parse_args(argv)
+
+    small = os.urandom(args.small_kb * 1024)
+    large = os.urandom(args.large_mb * 1024 * 1024)
+
+    print(f"容器: {azure_storage.container_name}, 塊大小: {azure_storage.AZURE_MAX_BLOCK_SIZE} 字節, "
+          f"上傳並發: {azure_storage.AZURE_UPLOAD_MAX_CONCURRENCY}, 連接池: {azure_storage.AZURE_HTTP_POOL_SIZE}")
+
+    # 預熱：創建容器並建立連接
+    _shared_upload(small, f"bench/{uuid.uuid4()}.bin")
+
+    try:
+        _run(f'舊做法 {args.small_kb}KB', _legacy_upload, small, args.count)
+        _run(f'共用客戶端 {args.small_kb}KB', _shared_upload, small, args.count)
+        _run(f'舊做法 {args.large_mb}MB', _legacy_upload, large, args.large_count)
+        _run(f'共用客戶端 {args.large_mb}MB', _shared_upload, large, args.large_count)
+    finally:
+        _cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""瀏覽器直傳流程檢查（針對本地 Azurite 模擬器）
+
+依次調用 /api/upload/sas 申請寫入 SAS、用 SDK 並發分塊上傳到 SAS URL
+（與前端 @azure/storage-blob 的 uploadData 行為一致）、再調用
+/api/upload/commit 提交，最後校驗 blob 內容與大小。
+
+啟動 Azurite 後執行::
+
+    python -m backend.benchmarks.direct_upload_check [--size-mb 20]
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+
+from backend.benchmarks.azure_storage_bench import AZURITE_CONNECTION_STRING
+
+os.environ.setdefault('AZURE_STORAGE_CONNECTION_STRING', AZURITE_CONNECTION_STRING)
+os.environ.setdefault('AZURE_STORAGE_CONTAINER', 'bench-uploads')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from azure.storage.blob import BlobClient
+from backend.app import app
+from backend.utils.token_utils import create_access_token, USER_TYPE_ADMIN
+from backend.utils.azure_storage import (
+    get_blob_properties, get_blob_service_client, delete_blob, container_name
+)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='瀏覽器直傳流程檢查')
+    parser.add_argument('--size-mb', type=int, default=20, help='測試文件大小（MB）')
+    parser.add_argument('--product', default='bench-product', help='產品名稱')
+    args = parser.parse_args(argv)
+
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    token = create_access_token(1, USER_TYPE_ADMIN, {'can_add_product': True})
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    response = client.post('/api/upload/sas', headers=headers, json={
+        'productName': args.product,
+        'filename': '測試文件.pdf',
+        'fileType': 'document',
+        'size': len(data)
+    })
+    payload = response.get_json()
+    assert response.status_code == 200 and payload['data']['direct'], payload
+    grant = payload['data']
+    print(f"SAS 已簽發: {grant['blob_url']}（{grant['expires_in']} 秒）")
+
+    started = time.perf_counter()
+    BlobClient.from_blob_url(grant['upload_url'], max_block_size=grant['block_size']).upload_blob(
+        data,
+        max_concurrency=grant['max_concurrency'],
+        content_type=grant['content_type']
+    )
+    elapsed = time.perf_counter() - started
+    print(f"直傳 {args.size_mb}MB 耗時 {elapsed:.2f}s（{args.size_mb / elapsed:.1f} MB/s）")
+
+    response = client.post('/api/upload/commit', headers=headers, json={'uploadTicket': grant['upload_ticket']})
+    payload = response.get_json()
+    assert response.status_code == 200, payload
+    print(f"提交成功: {payload['data']}")
+
+    blob_path = grant['blob_url'].split(f"/{container_name}/", 1)[1]
+    properties = get_blob_properties(container_name, blob_path)
+    assert properties.size == len(data), properties.size
+    blob_client = get_blob_service_client().get_blob_client(container=container_name, blob=blob_path)
+    digest = hashlib.sha256(blob_client.download_blob().readall()).hexdigest()
+    assert digest == hashlib.sha256(data).hexdigest(), '內容不一致'
+    print(f"校驗通過: 大小 {properties.size}，Content-Type {properties.content_settings.content_type}，"
+          f"SHA-256 {digest[:16]}")
+
+    delete_blob(blob_path)
+
+if __name__ == '__main__':
+    main()
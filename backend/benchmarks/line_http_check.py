@@ -0,0 +1,108 @@
+"""LINE API 共享會話檢查（使用本地替身服務）
+
+替身服務模擬 OAuth 令牌、用戶資料與 push 接口，並記錄每個請求的客戶端端口：
+
+- 多次調用應復用少量連接（端口數不超過連接池大小）
+- OAuth 令牌接口第一次返回 503，應自動重試成功
+- push 返回 500 時不重試，避免重複發送
+
+    python -m backend.benchmarks.line_http_check [--requests 50]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+from backend.utils.line_http import line_request, LineSessionHttpClient, LINE_HTTP_POOL_SIZE
+from backend.utils.metrics import REGISTRY
+
+class LineStandIn(BaseHTTPRequestHandler):
+    """記錄請求路徑與客戶端端口，按腳本返回錯誤"""
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+    calls = []
+    failures = {}  # 路徑 -> 剩餘需要返回錯誤的次數
+    lock = threading.Lock()
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        path = self.path.split('?', 1)[0]
+        with self.lock:
+            self.calls.append((path, self.client_address[1]))
+            failing = self.failures.get(path, (0, 0))
+            if failing[0] > 0:
+                self.failures[path] = (failing[0] - 1, failing[1])
+                return self._reply(failing[1], {'message': 'unavailable'})
+        if path == '/oauth2/v2.1/token':
+            return self._reply(200, {'access_token': 'bench-access-token', 'expires_in': 2592000})
+        if path == '/v2/profile':
+            return self._reply(200, {'userId': 'U' + '0' * 32, 'displayName': '測試用戶'})
+        return self._reply(200, {})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='LINE API 共享會話檢查')
+    parser.add_argument('--requests', type=int, default=50, help='每種調用的次數')
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LineStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+
+    LineStandIn.failures['/oauth2/v2.1/token'] = (1, 503)
+    response = line_request('POST', f'{endpoint}/oauth2/v2.1/token', retry_on_5xx=True,
+                            data={'grant_type': 'authorization_code', 'code': 'bench'})
+    assert response.status_code == 200, response.status_code
+    print("OAuth 令牌接口 503 後重試成功")
+
+    api = LineBotApi('bench-token', endpoint=endpoint, http_client=LineSessionHttpClient)
+    LineStandIn.failures['/v2/bot/message/push'] = (1, 500)
+    before = len(LineStandIn.calls)
+    try:
+        api.push_message('U' + '1' * 32, TextSendMessage(text='test'))
+        raise AssertionError('push 返回 500 時應拋出異常')
+    except LineBotApiError:
+        pass
+    assert len(LineStandIn.calls) - before == 1, 'push 被重試'
+    print("push 返回 500 時未重試")
+
+    LineStandIn.calls.clear()
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        line_request('GET', f'{endpoint}/v2/profile', headers={'Authorization': 'Bearer bench'})
+        api.push_message('U' + '1' * 32, TextSendMessage(text='test'))
+    elapsed = time.perf_counter() - started
+
+    ports = {port for _, port in LineStandIn.calls}
+    print(f"{len(LineStandIn.calls)} 個請求耗時 {elapsed:.2f}s，使用 {len(ports)} 個連接")
+    assert len(ports) <= LINE_HTTP_POOL_SIZE, '連接未被復用'
+
+    for line in REGISTRY.render().splitlines():
+        if line.startswith('line_http_requests_total'):
+            print(line)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""LINE webhook 流程檢查（使用本地模擬的 LINE API）
+
+啟動一個記錄請求的模擬 LINE Messaging API，把 LINE_API_ENDPOINT 指向它，
+然後向 /api/line/callback 發送已簽名的事件：
+
+- callback 的響應時間應與事件處理耗時無關
+- 重新投遞同一 webhookEventId 的事件只處理一次
+
+需要可用的資料庫（line_webhook_events 表）::
+
+    python -m backend.benchmarks.line_webhook_check [--events 50]
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHANNEL_SECRET = 'bench-channel-secret'
+
+class FakeLineApi(BaseHTTPRequestHandler):
+    """記錄 reply/push 請求並返回成功"""
+    requests = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            self.requests.append((self.path, json.loads(body or b'{}')))
+        self._reply({})
+
+    def do_GET(self):
+        # 群組資訊等查詢
+        self._reply({'groupId': 'bench-group', 'groupName': '測試群組', 'pictureUrl': ''})
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_line_api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLineApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def text_event(user_id, text, event_id=None, redelivery=False):
+    return {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': event_id or uuid.uuid4().hex.upper()[:26],
+        'deliveryContext': {'isRedelivery': redelivery},
+        'replyToken': uuid.uuid4().hex,
+        'message': {'id': uuid.uuid4().hex[:16], 'type': 'text', 'text': text}
+    }
+
+def sign(body):
+    digest = hmac.new(CHANNEL_SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='LINE webhook 流程檢查')
+    parser.add_argument('--events', type=int, default=50, help='發送的事件數')
+    args = parser.parse_args(argv)
+
+    server, endpoint = start_fake_line_api()
+    os.environ['LINE_API_ENDPOINT'] = endpoint
+    os.environ['LINE_CHANNEL_SECRET'] = CHANNEL_SECRET
+    os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'bench-token')
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from backend.app import app
+    from backend.routes.line_bot_routes import line_event_dispatcher
+
+    client = app.test_client()
+    latencies = []
+    events = [text_event(f'bench-user-{i % 5}', '已完成訂單') for i in range(args.events)]
+    for event in events:
+        body = json.dumps({'destination': 'bench', 'events': [event]})
+        started = time.perf_counter()
+        response = client.post('/api/line/callback', data=body, content_type='application/json',
+                               headers={'X-Line-Signature': sign(body)})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+
+    # 重新投遞第一條事件
+    body = json.dumps({'destination': 'bench', 'events': [dict(events[0], deliveryContext={'isRedelivery': True})]})
+    client.post('/api/line/callback', data=body, content_type='application/json',
+                headers={'X-Line-Signature': sign(body)})
+
+    response = client.post('/api/line/callback', data=body, content_type='application/json',
+                           headers={'X-Line-Signature': 'invalid'})
+    assert response.status_code == 400, response.status_code
+
+    assert line_event_dispatcher.join(timeout=60), '事件未在 60 秒內處理完'
+    replies = [path for path, _ in FakeLineApi.requests if path.endswith('/message/reply')]
+    latencies.sort()
+    print(f"callback 延遲: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms，"
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+    print(f"發送 {len(events)} 個事件（另重新投遞 1 個），模擬 API 收到 {len(replies)} 次回覆")
+    assert len(replies) == len(events), '重新投遞的事件被重複處理或有事件丟失'
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""訂單變更 SSE 推送基準測試（針對運行中的服務）
+
+打開多個 /api/orders/stream 連接，對一個訂單明細執行一次更新，統計從提交到
+每個連接收到事件的延遲，並確認資料庫中的監聽連接數只與 worker 數相關、與訂閱數無關。
+
+SSE 連接會長時間佔用一個處理線程，gunicorn 需使用 gthread 或 gevent worker，例如::
+
+    gunicorn -k gthread --threads 250 -w 2 backend.app:app
+
+再執行::
+
+    python -m backend.benchmarks.order_stream_bench --url http://127.0.0.1:8000 [--clients 200]
+
+未指定 --detail-id 時更新最新的一個訂單明細（只改 updated_at，不影響業務數據）。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config.database import get_db_connection
+from backend.utils.token_utils import create_access_token, USER_TYPE_ADMIN
+
+class StreamClient(threading.Thread):
+    """讀取 SSE 流，記錄目標事件的到達時間"""
+
+    def __init__(self, url, token, detail_id, ready):
+        super().__init__(daemon=True)
+        self.url = url
+        self.token = token
+        self.detail_id = detail_id
+        self.ready = ready
+        self.received_at = None
+        self.error = None
+
+    def run(self):
+        try:
+            with requests.get(f'{self.url}/api/orders/stream', params={'access_token': self.token},
+                              stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('retry:'):
+                        self.ready.release()
+                    elif line.startswith('data:'):
+                        event = json.loads(line[5:])
+                        if event.get('detail_id') == self.detail_id:
+                            self.received_at = time.perf_counter()
+                            return
+        except Exception as e:
+            self.error = str(e)
+            self.ready.release()
+
+def count_listeners():
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity WHERE query ILIKE %s AND datname = current_database()",
+            ('LISTEN order_changes%',)
+        )
+        return cursor.fetchone()[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='訂單變更 SSE 推送基準測試')
+    parser.add_argument('--url', required=True, help='服務地址')
+    parser.add_argument('--clients', type=int, default=200, help='並發訂閱數')
+    parser.add_argument('--admin-id', type=int, default=1, help='簽發 token 使用的管理員 ID')
+    parser.add_argument('--detail-id', type=int, help='要更新的訂單明細 ID')
+    args = parser.parse_args(argv)
+
+    token = create_access_token(args.admin_id, USER_TYPE_ADMIN)
+    detail_id = args.detail_id
+    if detail_id is None:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM order_details ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+            if not row:
+                raise SystemExit('沒有可用的訂單明細')
+            detail_id = row[0]
+
+    ready = threading.Semaphore(0)
+    clients = [StreamClient(args.url, token, detail_id, ready) for _ in range(args.clients)]
+    for client in clients:
+        client.start()
+    for _ in clients:
+        ready.acquire()
+    failed = [client for client in clients if client.error]
+    if failed:
+        print(f"{len(failed)} 個連接失敗，例如: {failed[0].error}")
+    print(f"{len(clients) - len(failed)} 個連接已建立，資料庫監聽連接數: {count_listeners()}")
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE order_details SET updated_at = NOW() WHERE id = %s", (detail_id,))
+        conn.commit()
+    committed = time.perf_counter()
+
+    for client in clients:
+        client.join(timeout=30)
+    latencies = [(client.received_at - committed) * 1000 for client in clients if client.received_at]
+    missing = len(clients) - len(failed) - len(latencies)
+    if latencies:
+        latencies.sort()
+        print(f"收到事件: {len(latencies)}，未收到: {missing}")
+        print(f"延遲 p50 {statistics.median(latencies):.1f}ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}ms, max {latencies[-1]:.1f}ms")
+    else:
+        print("沒有連接收到事件")
+
+if __name__ == '__main__':
+    main()
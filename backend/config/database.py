@@ -2,6 +2,9 @@ import psycopg2
 from psycopg2 import pool
 from contextlib import contextmanager
 import logging
+import time
+from backend.utils.request_stats import record_query, record_rows, record_pool_wait
+from backend.utils.metrics import REGISTRY, DB_POOL_CHECKOUTS, DB_POOL_WAIT
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +28,126 @@ connection_pool = pool.SimpleConnectionPool(
     keepalives_count=5
 )
 
+def create_dedicated_connection(**overrides):
+    """建立不經過連接池的獨立連接，參數與連接池相同
+
+    用於 advisory lock、LISTEN 等需要長期持有會話的場景，避免長期佔用連接池。
+    """
+    kwargs = dict(connection_pool._kwargs, **overrides)
+    return psycopg2.connect(*connection_pool._args, **kwargs)
+
+# 連接池使用情況
+REGISTRY.gauge('db_pool_in_use', '已借出的連接數', callback=lambda: len(connection_pool._used))
+REGISTRY.gauge('db_pool_idle', '連接池中空閒的連接數', callback=lambda: len(connection_pool._pool))
+
+# SQL 執行監聽器，供 N+1 檢測等調試工具註冊，簽名為 listener(cursor, query, vars, duration)
+_query_listeners = []
+
+def register_query_listener(listener):
+    """註冊 SQL 執行監聽器，重複註冊會被忽略"""
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+
+def unregister_query_listener(listener):
+    """移除 SQL 執行監聽器"""
+    if listener in _query_listeners:
+        _query_listeners.remove(listener)
+
+def _notify_listeners(cursor, query, vars, duration):
+    for listener in list(_query_listeners):
+        try:
+            listener(cursor, query, vars, duration)
+        except Exception as e:
+            logger.error(f"SQL 監聽器執行錯誤: {e}")
+
+class InstrumentedCursor:
+    """游標代理，統計每次執行的耗時與返回行數，其餘屬性直接轉發給原始游標"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, vars)
+        finally:
+            duration = time.perf_counter() - start
+            record_query(duration)
+            if _query_listeners:
+                _notify_listeners(self._cursor, query, vars, duration)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, vars_list)
+        finally:
+            duration = time.perf_counter() - start
+            record_query(duration)
+            if _query_listeners:
+                _notify_listeners(self._cursor, query, None, duration)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            record_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        record_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            record_rows(1)
+            yield row
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._cursor.__exit__(exc_type, exc_value, traceback)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # itersize、arraysize 等需要設置在原始游標上
+        setattr(self._cursor, name, value)
+
+class InstrumentedConnection:
+    """連接代理，確保 get_db_connection 交出的所有游標都經過統計"""
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # autocommit、isolation_level 等屬性需要設置在原始連接上
+        setattr(self._conn, name, value)
+
+def _getconn():
+    """從連接池獲取連接並記錄等待時間"""
+    start = time.perf_counter()
+    try:
+        return connection_pool.getconn()
+    finally:
+        waited = time.perf_counter() - start
+        record_pool_wait(waited)
+        DB_POOL_CHECKOUTS.inc()
+        DB_POOL_WAIT.observe(waited)
+
 @contextmanager
 def get_db_connection():
     conn = None
@@ -33,19 +156,19 @@ def get_db_connection():
     
     while retries < max_retries:
         try:
-            conn = connection_pool.getconn()
+            conn = _getconn()
             # 檢查連接是否有效
             if conn.closed:
                 logger.warning("檢測到已關閉的連接，嘗試重新獲取")
                 connection_pool.putconn(conn)
-                conn = connection_pool.getconn()
+                conn = _getconn()
             
             # 測試連接是否真的可用
             cursor = conn.cursor()
             cursor.execute('SELECT 1')
             cursor.close()
             
-            yield conn
+            yield InstrumentedConnection(conn)
             break  # 如果成功獲取連接，跳出重試循環
             
         except psycopg2.OperationalError as e:
@@ -70,7 +193,7 @@ def get_db_connection():
                     connection_pool.putconn(conn)
                 except Exception:
                     pass
-            conn = connection_pool.getconn()  # 重新獲取連接
+            conn = _getconn()  # 重新獲取連接
             retries += 1
             if retries >= max_retries:
                 raise
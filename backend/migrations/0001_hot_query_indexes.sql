@@ -0,0 +1,60 @@
+-- migrate:no-transaction
+-- 熱點查詢索引，依據各路由實際使用的查詢條件建立。
+-- 使用 CONCURRENTLY 建立，不阻塞線上讀寫，因此不能在事務中執行。
+
+-- 訂單明細：關聯主訂單（幾乎所有訂單查詢都 JOIN order_details ON o.id = od.order_id）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_details_order_id
+    ON order_details (order_id);
+
+-- /orders/pending：WHERE od.order_status = '待確認'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_details_pending
+    ON order_details (order_id)
+    WHERE order_status = '待確認';
+
+-- /orders/check-recent：od.product_id = ? 並回連 orders
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_details_product_order
+    ON order_details (product_id, order_id);
+
+-- /orders/list、check_recent_order、LINE 訂單查詢：o.customer_id = ? ORDER BY / 篩選 created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_created
+    ON orders (customer_id, created_at DESC);
+
+-- /orders/all、/orders/today 按建立時間排序
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_created_at
+    ON orders (created_at DESC);
+
+-- 按訂單編號查詢（取消、確認、出貨、批量更新）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_order_number
+    ON orders (order_number);
+
+-- LINE webhook 身份查詢
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_line_users_line_user_id
+    ON line_users (line_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_line_users_customer_id
+    ON line_users (customer_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_line_groups_line_group_id
+    ON line_groups (line_group_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_line_groups_customer_id
+    ON line_groups (customer_id);
+
+-- 產品列表：WHERE status = 'active' ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_status_created
+    ON products (status, created_at DESC);
+
+-- 日誌查詢：按表名篩選並按時間倒序分頁
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_table_created
+    ON logs (table_name, created_at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_created_at
+    ON logs (created_at DESC);
+
+-- update_order_status 合併最近日誌：table_name + record_id + created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_logs_table_record_created
+    ON logs (table_name, record_id, created_at DESC);
+
+-- 鎖定日期查詢與清理
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_locked_dates_locked_date
+    ON locked_dates (locked_date);
+
+-- 客戶登入與 LINE 綁定：WHERE username = ? AND status = 'active'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_customers_username
+    ON customers (username);
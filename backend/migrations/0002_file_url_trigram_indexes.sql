@@ -0,0 +1,12 @@
+-- migrate:no-transaction
+-- 文件下載按 image_url / dm_url LIKE '%basename%' 查詢原始文件名，
+-- 前後都帶通配符的 LIKE 只能使用 trigram 索引。
+-- Azure Database for PostgreSQL 需要先在 azure.extensions 中允許 pg_trgm。
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_image_url_trgm
+    ON products USING gin (image_url gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_dm_url_trgm
+    ON products USING gin (dm_url gin_trgm_ops);
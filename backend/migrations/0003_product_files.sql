@@ -0,0 +1,26 @@
+-- 存儲文件名與原始文件名的對照表，供 /uploads 與 /api/file 下載時一次索引查詢
+CREATE TABLE IF NOT EXISTS product_files (
+    id SERIAL PRIMARY KEY,
+    stored_name VARCHAR(255) NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    file_url TEXT NOT NULL,
+    file_type VARCHAR(16) NOT NULL,
+    product_name VARCHAR(255),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT uq_product_files_stored_name UNIQUE (stored_name)
+);
+
+-- 回填現有產品的圖片與 DM
+INSERT INTO product_files (stored_name, original_filename, file_url, file_type, product_name)
+SELECT regexp_replace(image_url, '^.*/', ''), image_original_filename, image_url, 'image', name
+FROM products
+WHERE image_url IS NOT NULL AND image_url <> ''
+  AND image_original_filename IS NOT NULL AND image_original_filename <> ''
+ON CONFLICT (stored_name) DO NOTHING;
+
+INSERT INTO product_files (stored_name, original_filename, file_url, file_type, product_name)
+SELECT regexp_replace(dm_url, '^.*/', ''), dm_original_filename, dm_url, 'document', name
+FROM products
+WHERE dm_url IS NOT NULL AND dm_url <> ''
+  AND dm_original_filename IS NOT NULL AND dm_original_filename <> ''
+ON CONFLICT (stored_name) DO NOTHING;
@@ -0,0 +1,2 @@
+-- 圖片衍生圖（縮略圖/卡片/大圖，WebP 與 JPEG）映射，由後台任務寫入
+ALTER TABLE product_files ADD COLUMN IF NOT EXISTS derivatives JSONB;
@@ -0,0 +1,17 @@
+-- 延後執行的文件刪除：請求中只登記，由調度任務批量刪除並在失敗時重試
+CREATE TABLE IF NOT EXISTS pending_file_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    storage VARCHAR(16) NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    target TEXT NOT NULL,
+    file_kind VARCHAR(16),
+    keep_name VARCHAR(255),
+    -- 以 UTC 記錄，與 blob 的 last_modified 比較
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_pending_file_deletions_due
+    ON pending_file_deletions (next_attempt_at);
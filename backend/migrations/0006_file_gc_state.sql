@@ -0,0 +1,6 @@
+-- 孤立文件回收的掃描斷點，每種存儲一行
+CREATE TABLE IF NOT EXISTS file_gc_state (
+    storage VARCHAR(16) PRIMARY KEY,
+    last_path TEXT NOT NULL DEFAULT '',
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
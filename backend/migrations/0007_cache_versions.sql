@@ -0,0 +1,24 @@
+-- 進程內緩存的版本號：數據表變更時由觸發器遞增，各 worker 據此判斷緩存是否過期
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_cache_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO cache_versions (name, version, updated_at)
+    VALUES (TG_ARGV[0], 1, NOW())
+    ON CONFLICT (name) DO UPDATE
+    SET version = cache_versions.version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO cache_versions (name, version) VALUES ('locked_dates', 1)
+ON CONFLICT (name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_locked_dates_cache_version ON locked_dates;
+CREATE TRIGGER trg_locked_dates_cache_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON locked_dates
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_cache_version('locked_dates');
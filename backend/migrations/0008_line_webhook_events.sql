@@ -0,0 +1,15 @@
+-- 已接收的 LINE webhook 事件：按 webhookEventId 去重，記錄重新投遞與處理結果
+CREATE TABLE IF NOT EXISTS line_webhook_events (
+    webhook_event_id VARCHAR(64) PRIMARY KEY,
+    event_type VARCHAR(32) NOT NULL,
+    source_id VARCHAR(64),
+    status VARCHAR(16) NOT NULL DEFAULT 'processing',
+    deliveries INT NOT NULL DEFAULT 1,
+    is_redelivery BOOLEAN NOT NULL DEFAULT FALSE,
+    received_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMP,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_line_webhook_events_received_at
+    ON line_webhook_events (received_at);
@@ -0,0 +1,19 @@
+-- LINE 用戶/群組到客戶的綁定緩存版本：綁定、解綁或客戶狀態變更時遞增
+INSERT INTO cache_versions (name, version) VALUES ('line_bindings', 1)
+ON CONFLICT (name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_line_users_cache_version ON line_users;
+CREATE TRIGGER trg_line_users_cache_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON line_users
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_cache_version('line_bindings');
+
+DROP TRIGGER IF EXISTS trg_line_groups_cache_version ON line_groups;
+CREATE TRIGGER trg_line_groups_cache_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON line_groups
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_cache_version('line_bindings');
+
+-- 緩存中保存公司名稱，且只解析 active 客戶
+DROP TRIGGER IF EXISTS trg_customers_line_bindings_cache_version ON customers;
+CREATE TRIGGER trg_customers_line_bindings_cache_version
+    AFTER UPDATE OF status, company_name OR DELETE ON customers
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_cache_version('line_bindings');
@@ -0,0 +1,158 @@
+-- 每個客戶按狀態分組的訂單摘要：訂單數與最近 N 筆訂單（含商品明細文本）
+-- bucket: all（全部，用於近兩週訂單）、pending（待確認）、confirmed（已確認未出貨）、shipped（已出貨）
+-- 由 orders / order_details 上的語句級觸發器維護，每條語句只重算受影響的客戶一次
+CREATE TABLE IF NOT EXISTS customer_order_summary (
+    customer_id INT NOT NULL,
+    bucket VARCHAR(16) NOT NULL,
+    order_count INT NOT NULL DEFAULT 0,
+    latest_orders JSONB NOT NULL DEFAULT '[]'::jsonb,
+    last_order_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (customer_id, bucket)
+);
+
+CREATE OR REPLACE FUNCTION refresh_customer_order_summary(p_customer_ids INT[], p_limit INT DEFAULT 10)
+RETURNS void AS $$
+BEGIN
+    IF p_customer_ids IS NULL OR cardinality(p_customer_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- 按客戶 ID 順序加事務級鎖，並發修改同一客戶的訂單時依次重算，避免主鍵衝突與死鎖
+    PERFORM pg_advisory_xact_lock(72450002, id) FROM unnest(p_customer_ids) AS id ORDER BY id;
+
+    DELETE FROM customer_order_summary WHERE customer_id = ANY(p_customer_ids);
+
+    INSERT INTO customer_order_summary (customer_id, bucket, order_count, latest_orders, last_order_at, updated_at)
+    SELECT r.customer_id,
+           r.bucket,
+           max(r.bucket_count),
+           COALESCE(
+               jsonb_agg(jsonb_build_object(
+                   'order_number', r.order_number,
+                   'created_at', r.created_at,
+                   'status', CASE
+                       WHEN r.order_shipped THEN '已出貨'
+                       WHEN r.order_confirmed THEN '已確認'
+                       ELSE '待確認'
+                   END,
+                   'product_details', d.product_details
+               ) ORDER BY r.rn) FILTER (WHERE r.rn <= p_limit),
+               '[]'::jsonb
+           ),
+           max(r.created_at),
+           NOW()
+    FROM (
+        SELECT o.id, o.customer_id, o.order_number, o.created_at, o.order_confirmed, o.order_shipped,
+               b.bucket,
+               row_number() OVER w AS rn,
+               count(*) OVER (PARTITION BY o.customer_id, b.bucket) AS bucket_count
+        FROM orders o
+        CROSS JOIN LATERAL (VALUES
+            ('all'),
+            (CASE
+                WHEN o.order_shipped THEN 'shipped'
+                WHEN o.order_confirmed THEN 'confirmed'
+                ELSE 'pending'
+            END)
+        ) AS b(bucket)
+        WHERE o.customer_id = ANY(p_customer_ids)
+        WINDOW w AS (PARTITION BY o.customer_id, b.bucket ORDER BY o.created_at DESC, o.id DESC)
+    ) r
+    LEFT JOIN LATERAL (
+        SELECT string_agg(
+                   p.name || ' x' || od.product_quantity || od.product_unit ||
+                   ' (' || od.order_status || ')' ||
+                   CASE
+                       WHEN od.remark IS NOT NULL AND od.remark != ''
+                       THEN E'\n客戶備註: ' || od.remark
+                       ELSE ''
+                   END ||
+                   CASE
+                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != ''
+                       THEN E'\n供應商備註: ' || od.supplier_note
+                       ELSE ''
+                   END,
+                   E'\n' ORDER BY od.id
+               ) AS product_details
+        FROM order_details od
+        JOIN products p ON od.product_id = p.id
+        WHERE od.order_id = r.id
+    ) d ON r.rn <= p_limit
+    GROUP BY r.customer_id, r.bucket;
+END;
+$$ LANGUAGE plpgsql;
+
+-- orders 變更：新舊行的客戶都需要重算
+CREATE OR REPLACE FUNCTION orders_refresh_customer_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT DISTINCT customer_id FROM new_rows WHERE customer_id IS NOT NULL));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT customer_id FROM new_rows WHERE customer_id IS NOT NULL
+            UNION
+            SELECT customer_id FROM old_rows WHERE customer_id IS NOT NULL));
+    ELSE
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT DISTINCT customer_id FROM old_rows WHERE customer_id IS NOT NULL));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- order_details 變更：經主訂單找到客戶（主訂單已刪除時由 orders 的觸發器處理）
+CREATE OR REPLACE FUNCTION order_details_refresh_customer_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT DISTINCT o.customer_id FROM orders o
+            WHERE o.id IN (SELECT order_id FROM new_rows) AND o.customer_id IS NOT NULL));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT DISTINCT o.customer_id FROM orders o
+            WHERE o.id IN (SELECT order_id FROM new_rows UNION SELECT order_id FROM old_rows)
+              AND o.customer_id IS NOT NULL));
+    ELSE
+        PERFORM refresh_customer_order_summary(ARRAY(
+            SELECT DISTINCT o.customer_id FROM orders o
+            WHERE o.id IN (SELECT order_id FROM old_rows) AND o.customer_id IS NOT NULL));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 使用過渡表的觸發器只能對應一種事件，因此每種事件各建一個
+DROP TRIGGER IF EXISTS trg_orders_summary_insert ON orders;
+CREATE TRIGGER trg_orders_summary_insert
+    AFTER INSERT ON orders REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE orders_refresh_customer_summary();
+
+DROP TRIGGER IF EXISTS trg_orders_summary_update ON orders;
+CREATE TRIGGER trg_orders_summary_update
+    AFTER UPDATE ON orders REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE orders_refresh_customer_summary();
+
+DROP TRIGGER IF EXISTS trg_orders_summary_delete ON orders;
+CREATE TRIGGER trg_orders_summary_delete
+    AFTER DELETE ON orders REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE orders_refresh_customer_summary();
+
+DROP TRIGGER IF EXISTS trg_order_details_summary_insert ON order_details;
+CREATE TRIGGER trg_order_details_summary_insert
+    AFTER INSERT ON order_details REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_customer_summary();
+
+DROP TRIGGER IF EXISTS trg_order_details_summary_update ON order_details;
+CREATE TRIGGER trg_order_details_summary_update
+    AFTER UPDATE ON order_details REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_customer_summary();
+
+DROP TRIGGER IF EXISTS trg_order_details_summary_delete ON order_details;
+CREATE TRIGGER trg_order_details_summary_delete
+    AFTER DELETE ON order_details REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_customer_summary();
+
+-- 回填現有客戶
+SELECT refresh_customer_order_summary(ARRAY(SELECT DISTINCT customer_id FROM orders WHERE customer_id IS NOT NULL));
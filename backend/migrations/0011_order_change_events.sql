@@ -0,0 +1,72 @@
+-- 訂單變更日誌：orders / order_details 每行變更記錄一條，提交時通過 NOTIFY order_changes 廣播事件 ID
+-- 用於管理後台的 SSE 增量推送與斷線後按 Last-Event-ID 續傳
+CREATE TABLE IF NOT EXISTS order_change_events (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(16) NOT NULL,
+    op VARCHAR(8) NOT NULL,
+    order_id INT NOT NULL,
+    order_number TEXT,
+    detail_id INT,
+    customer_id INT,
+    changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_change_events_changed_at
+    ON order_change_events (changed_at);
+
+CREATE OR REPLACE FUNCTION record_order_change() RETURNS trigger AS $$
+DECLARE
+    rec RECORD;
+    v_order_id INT;
+    v_detail_id INT;
+    v_order_number TEXT;
+    v_customer_id INT;
+    v_event_id BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'orders' THEN
+        v_order_id := rec.id;
+        v_order_number := rec.order_number;
+        v_customer_id := rec.customer_id;
+    ELSE
+        v_order_id := rec.order_id;
+        v_detail_id := rec.id;
+        -- 主訂單已刪除時為空，刪除事件由 orders 的記錄攜帶訂單編號
+        SELECT order_number, customer_id INTO v_order_number, v_customer_id
+        FROM orders WHERE id = rec.order_id;
+    END IF;
+
+    INSERT INTO order_change_events (table_name, op, order_id, order_number, detail_id, customer_id)
+    VALUES (TG_TABLE_NAME, TG_OP, v_order_id, v_order_number, v_detail_id, v_customer_id)
+    RETURNING id INTO v_event_id;
+
+    PERFORM pg_notify('order_changes', v_event_id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_change_events ON orders;
+CREATE TRIGGER trg_orders_change_events
+    AFTER INSERT OR DELETE ON orders
+    FOR EACH ROW EXECUTE PROCEDURE record_order_change();
+
+-- 只記錄實際有變化的更新
+DROP TRIGGER IF EXISTS trg_orders_change_events_update ON orders;
+CREATE TRIGGER trg_orders_change_events_update
+    AFTER UPDATE ON orders
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE record_order_change();
+
+DROP TRIGGER IF EXISTS trg_order_details_change_events ON order_details;
+CREATE TRIGGER trg_order_details_change_events
+    AFTER INSERT OR DELETE ON order_details
+    FOR EACH ROW EXECUTE PROCEDURE record_order_change();
+
+DROP TRIGGER IF EXISTS trg_order_details_change_events_update ON order_details;
+CREATE TRIGGER trg_order_details_change_events_update
+    AFTER UPDATE ON order_details
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE record_order_change();
@@ -0,0 +1,19 @@
+-- 訂單增量同步：為變更日誌記錄寫入事務的 txid，同步令牌為快照的 xmin
+-- 令牌 t1 到 t2 之間返回 t1 <= txid < t2 的事件：小於 xmin 的事務都已結束，每個事件恰好落在一個區間內
+ALTER TABLE order_change_events ADD COLUMN IF NOT EXISTS txid BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE order_change_events ALTER COLUMN txid SET DEFAULT txid_current();
+
+CREATE INDEX IF NOT EXISTS idx_order_change_events_txid
+    ON order_change_events (txid);
+CREATE INDEX IF NOT EXISTS idx_order_change_events_customer_txid
+    ON order_change_events (customer_id, txid);
+
+-- 已清理事件的最大 txid，早於此值的令牌需要客戶端全量重新加載
+CREATE TABLE IF NOT EXISTS order_sync_state (
+    name VARCHAR(64) PRIMARY KEY,
+    purged_txid BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO order_sync_state (name, purged_txid) VALUES ('order_change_events', 0)
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,8 @@
+-- 客戶重複下單限制天數的緩存版本：限制天數或客戶狀態變更、刪除客戶時遞增
+INSERT INTO cache_versions (name, version) VALUES ('customer_reorder_limits', 1)
+ON CONFLICT (name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_customers_reorder_limits_cache_version ON customers;
+CREATE TRIGGER trg_customers_reorder_limits_cache_version
+    AFTER UPDATE OF reorder_limit_days, status OR DELETE ON customers
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_cache_version('customer_reorder_limits');
@@ -0,0 +1,15 @@
+-- 下單請求的冪等鍵：同一客戶同一鍵只創建一次訂單，重試時返回保存的響應
+-- request_hash 用於識別以同一個鍵提交了不同內容的請求
+CREATE TABLE IF NOT EXISTS order_idempotency_keys (
+    customer_id INT NOT NULL,
+    idempotency_key VARCHAR(128) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    order_id INT,
+    response_status INT,
+    response_body JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (customer_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_idempotency_keys_created_at
+    ON order_idempotency_keys (created_at);
@@ -0,0 +1,11 @@
+-- migrate:no-transaction
+-- 訂單編號唯一約束：並發提交同一訂單編號時由資料庫拒絕，不再依賴先查詢後插入
+-- 執行前需清理已有的重複訂單編號，否則建索引失敗並留下無效索引
+-- 上次失敗留下的無效索引會讓 IF NOT EXISTS 直接跳過，重試時先刪除再重建
+DROP INDEX CONCURRENTLY IF EXISTS uq_orders_order_number;
+
+CREATE UNIQUE INDEX CONCURRENTLY uq_orders_order_number
+    ON orders (order_number);
+
+-- 唯一索引已覆蓋按訂單編號的查詢
+DROP INDEX CONCURRENTLY IF EXISTS idx_orders_order_number;
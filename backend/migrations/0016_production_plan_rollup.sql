@@ -0,0 +1,151 @@
+-- 生產計劃匯總：已確認的訂單明細按出貨日、商品、單位匯總數量
+-- 由 order_details / orders 上的語句級觸發器維護，每條語句只重算受影響的 (出貨日, 商品, 單位)
+-- 未安排出貨日的明細不計入
+CREATE TABLE IF NOT EXISTS production_plan_rollup (
+    shipping_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    product_unit TEXT NOT NULL,
+    total_quantity NUMERIC NOT NULL DEFAULT 0,
+    unshipped_quantity NUMERIC NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    order_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (shipping_date, product_id, product_unit)
+);
+
+CREATE OR REPLACE FUNCTION refresh_production_plan(p_dates DATE[], p_product_ids INT[], p_units TEXT[])
+RETURNS void AS $$
+BEGIN
+    IF p_dates IS NULL OR cardinality(p_dates) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- 按鍵的哈希順序加事務級鎖，並發修改同一組合時依次重算，避免主鍵衝突與死鎖
+    PERFORM pg_advisory_xact_lock(72450005, h)
+    FROM (
+        SELECT DISTINCT hashtext(d::text || ':' || p || ':' || u) AS h
+        FROM unnest(p_dates, p_product_ids, p_units) AS k(d, p, u)
+    ) locks
+    ORDER BY h;
+
+    DELETE FROM production_plan_rollup r
+    USING unnest(p_dates, p_product_ids, p_units) AS k(d, p, u)
+    WHERE r.shipping_date = k.d AND r.product_id = k.p AND r.product_unit = k.u;
+
+    INSERT INTO production_plan_rollup (
+        shipping_date, product_id, product_unit,
+        total_quantity, unshipped_quantity, line_count, order_count, updated_at
+    )
+    SELECT od.shipping_date::date,
+           od.product_id,
+           COALESCE(od.product_unit, ''),
+           sum(od.product_quantity),
+           COALESCE(sum(od.product_quantity) FILTER (WHERE NOT o.order_shipped), 0),
+           count(*),
+           count(DISTINCT od.order_id),
+           NOW()
+    FROM order_details od
+    JOIN orders o ON o.id = od.order_id
+    WHERE od.order_status = '已確認'
+      AND od.product_id = ANY(p_product_ids)
+      AND (od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '')) IN (
+          SELECT d, p, u FROM unnest(p_dates, p_product_ids, p_units) AS k(d, p, u))
+    GROUP BY od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '');
+END;
+$$ LANGUAGE plpgsql;
+
+-- order_details 變更：新舊行的 (出貨日, 商品, 單位) 都需要重算
+CREATE OR REPLACE FUNCTION order_details_refresh_production_plan() RETURNS trigger AS $$
+DECLARE
+    v_dates DATE[];
+    v_product_ids INT[];
+    v_units TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT DISTINCT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM new_rows WHERE shipping_date IS NOT NULL AND order_status = '已確認'
+        ) k;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM new_rows WHERE shipping_date IS NOT NULL
+            UNION
+            SELECT shipping_date::date, product_id, COALESCE(product_unit, '')
+            FROM old_rows WHERE shipping_date IS NOT NULL
+        ) k;
+    ELSE
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT DISTINCT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM old_rows WHERE shipping_date IS NOT NULL AND order_status = '已確認'
+        ) k;
+    END IF;
+    PERFORM refresh_production_plan(v_dates, v_product_ids, v_units);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- orders 變更：出貨狀態改變時重算該訂單明細所在的組合
+-- （刪除訂單前明細已刪除或被級聯刪除，由 order_details 的觸發器處理）
+CREATE OR REPLACE FUNCTION orders_refresh_production_plan() RETURNS trigger AS $$
+DECLARE
+    v_dates DATE[];
+    v_product_ids INT[];
+    v_units TEXT[];
+BEGIN
+    SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+    FROM (
+        SELECT DISTINCT od.shipping_date::date AS d, od.product_id AS p, COALESCE(od.product_unit, '') AS u
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN order_details od ON od.order_id = n.id
+        WHERE n.order_shipped IS DISTINCT FROM o.order_shipped
+          AND od.shipping_date IS NOT NULL
+          AND od.order_status = '已確認'
+    ) k;
+    PERFORM refresh_production_plan(v_dates, v_product_ids, v_units);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_order_details_production_plan_insert ON order_details;
+CREATE TRIGGER trg_order_details_production_plan_insert
+    AFTER INSERT ON order_details REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_production_plan();
+
+DROP TRIGGER IF EXISTS trg_order_details_production_plan_update ON order_details;
+CREATE TRIGGER trg_order_details_production_plan_update
+    AFTER UPDATE ON order_details REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_production_plan();
+
+DROP TRIGGER IF EXISTS trg_order_details_production_plan_delete ON order_details;
+CREATE TRIGGER trg_order_details_production_plan_delete
+    AFTER DELETE ON order_details REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE order_details_refresh_production_plan();
+
+DROP TRIGGER IF EXISTS trg_orders_production_plan_update ON orders;
+CREATE TRIGGER trg_orders_production_plan_update
+    AFTER UPDATE ON orders REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE orders_refresh_production_plan();
+
+-- 回填現有數據
+INSERT INTO production_plan_rollup (
+    shipping_date, product_id, product_unit,
+    total_quantity, unshipped_quantity, line_count, order_count, updated_at
+)
+SELECT od.shipping_date::date,
+       od.product_id,
+       COALESCE(od.product_unit, ''),
+       sum(od.product_quantity),
+       COALESCE(sum(od.product_quantity) FILTER (WHERE NOT o.order_shipped), 0),
+       count(*),
+       count(DISTINCT od.order_id),
+       NOW()
+FROM order_details od
+JOIN orders o ON o.id = od.order_id
+WHERE od.order_status = '已確認' AND od.shipping_date IS NOT NULL
+GROUP BY od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '')
+ON CONFLICT (shipping_date, product_id, product_unit) DO NOTHING;
@@ -0,0 +1,102 @@
+-- 訂單摘要修正：
+-- 1. 沒有明細的訂單不計入摘要（與原來的內連接查詢一致）
+-- 2. 新建訂單時主訂單先於明細插入，此時訂單不影響摘要，去掉 orders 的 INSERT 觸發器，
+--    下單只在插入明細後重算一次
+-- 3. 商品改名後重算訂購過該商品的客戶，摘要中的商品名稱保持最新
+CREATE OR REPLACE FUNCTION refresh_customer_order_summary(p_customer_ids INT[], p_limit INT DEFAULT 10)
+RETURNS void AS $$
+BEGIN
+    IF p_customer_ids IS NULL OR cardinality(p_customer_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- 按客戶 ID 順序加事務級鎖，並發修改同一客戶的訂單時依次重算，避免主鍵衝突與死鎖
+    PERFORM pg_advisory_xact_lock(72450002, id) FROM unnest(p_customer_ids) AS id ORDER BY id;
+
+    DELETE FROM customer_order_summary WHERE customer_id = ANY(p_customer_ids);
+
+    INSERT INTO customer_order_summary (customer_id, bucket, order_count, latest_orders, last_order_at, updated_at)
+    SELECT r.customer_id,
+           r.bucket,
+           max(r.bucket_count),
+           COALESCE(
+               jsonb_agg(jsonb_build_object(
+                   'order_number', r.order_number,
+                   'created_at', r.created_at,
+                   'status', CASE
+                       WHEN r.order_shipped THEN '已出貨'
+                       WHEN r.order_confirmed THEN '已確認'
+                       ELSE '待確認'
+                   END,
+                   'product_details', d.product_details
+               ) ORDER BY r.rn) FILTER (WHERE r.rn <= p_limit),
+               '[]'::jsonb
+           ),
+           max(r.created_at),
+           NOW()
+    FROM (
+        SELECT o.id, o.customer_id, o.order_number, o.created_at, o.order_confirmed, o.order_shipped,
+               b.bucket,
+               row_number() OVER w AS rn,
+               count(*) OVER (PARTITION BY o.customer_id, b.bucket) AS bucket_count
+        FROM orders o
+        CROSS JOIN LATERAL (VALUES
+            ('all'),
+            (CASE
+                WHEN o.order_shipped THEN 'shipped'
+                WHEN o.order_confirmed THEN 'confirmed'
+                ELSE 'pending'
+            END)
+        ) AS b(bucket)
+        WHERE o.customer_id = ANY(p_customer_ids)
+          AND EXISTS (SELECT 1 FROM order_details od WHERE od.order_id = o.id)
+        WINDOW w AS (PARTITION BY o.customer_id, b.bucket ORDER BY o.created_at DESC, o.id DESC)
+    ) r
+    LEFT JOIN LATERAL (
+        SELECT string_agg(
+                   p.name || ' x' || od.product_quantity || od.product_unit ||
+                   ' (' || od.order_status || ')' ||
+                   CASE
+                       WHEN od.remark IS NOT NULL AND od.remark != ''
+                       THEN E'\n客戶備註: ' || od.remark
+                       ELSE ''
+                   END ||
+                   CASE
+                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != ''
+                       THEN E'\n供應商備註: ' || od.supplier_note
+                       ELSE ''
+                   END,
+                   E'\n' ORDER BY od.id
+               ) AS product_details
+        FROM order_details od
+        JOIN products p ON od.product_id = p.id
+        WHERE od.order_id = r.id
+    ) d ON r.rn <= p_limit
+    GROUP BY r.customer_id, r.bucket;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_summary_insert ON orders;
+
+-- products 改名：重算訂購過這些商品的客戶
+CREATE OR REPLACE FUNCTION products_refresh_customer_summary() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_customer_order_summary(ARRAY(
+        SELECT DISTINCT o.customer_id
+        FROM new_rows n
+        JOIN old_rows ol ON ol.id = n.id
+        JOIN order_details od ON od.product_id = n.id
+        JOIN orders o ON o.id = od.order_id
+        WHERE n.name IS DISTINCT FROM ol.name AND o.customer_id IS NOT NULL));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 使用過渡表的觸發器不能指定列（UPDATE OF name），改名判斷在函數中完成
+DROP TRIGGER IF EXISTS trg_products_summary_update ON products;
+CREATE TRIGGER trg_products_summary_update
+    AFTER UPDATE ON products REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE products_refresh_customer_summary();
+
+-- 按新規則重新回填
+SELECT refresh_customer_order_summary(ARRAY(SELECT DISTINCT customer_id FROM orders WHERE customer_id IS NOT NULL));
@@ -0,0 +1,98 @@
+-- 生產計劃按明細狀態匯總：
+-- 出貨以訂單明細的 order_status 為準（'已確認' 改為 '已出貨'），orders.order_shipped 只在整張訂單出貨後才設置。
+-- 總數量包括已確認與已出貨的明細，未出貨數量只計已確認的明細；
+-- 明細狀態變更由 order_details 的觸發器處理，不再需要 orders 上的觸發器
+CREATE OR REPLACE FUNCTION refresh_production_plan(p_dates DATE[], p_product_ids INT[], p_units TEXT[])
+RETURNS void AS $$
+BEGIN
+    IF p_dates IS NULL OR cardinality(p_dates) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- 按鍵的哈希順序加事務級鎖，並發修改同一組合時依次重算，避免主鍵衝突與死鎖
+    PERFORM pg_advisory_xact_lock(72450005, h)
+    FROM (
+        SELECT DISTINCT hashtext(d::text || ':' || p || ':' || u) AS h
+        FROM unnest(p_dates, p_product_ids, p_units) AS k(d, p, u)
+    ) locks
+    ORDER BY h;
+
+    DELETE FROM production_plan_rollup r
+    USING unnest(p_dates, p_product_ids, p_units) AS k(d, p, u)
+    WHERE r.shipping_date = k.d AND r.product_id = k.p AND r.product_unit = k.u;
+
+    INSERT INTO production_plan_rollup (
+        shipping_date, product_id, product_unit,
+        total_quantity, unshipped_quantity, line_count, order_count, updated_at
+    )
+    SELECT od.shipping_date::date,
+           od.product_id,
+           COALESCE(od.product_unit, ''),
+           sum(od.product_quantity),
+           COALESCE(sum(od.product_quantity) FILTER (WHERE od.order_status = '已確認'), 0),
+           count(*),
+           count(DISTINCT od.order_id),
+           NOW()
+    FROM order_details od
+    WHERE od.order_status IN ('已確認', '已出貨')
+      AND od.product_id = ANY(p_product_ids)
+      AND (od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '')) IN (
+          SELECT d, p, u FROM unnest(p_dates, p_product_ids, p_units) AS k(d, p, u))
+    GROUP BY od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '');
+END;
+$$ LANGUAGE plpgsql;
+
+-- order_details 變更：新舊行的 (出貨日, 商品, 單位) 都需要重算
+CREATE OR REPLACE FUNCTION order_details_refresh_production_plan() RETURNS trigger AS $$
+DECLARE
+    v_dates DATE[];
+    v_product_ids INT[];
+    v_units TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT DISTINCT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM new_rows WHERE shipping_date IS NOT NULL AND order_status IN ('已確認', '已出貨')
+        ) k;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM new_rows WHERE shipping_date IS NOT NULL
+            UNION
+            SELECT shipping_date::date, product_id, COALESCE(product_unit, '')
+            FROM old_rows WHERE shipping_date IS NOT NULL
+        ) k;
+    ELSE
+        SELECT array_agg(d), array_agg(p), array_agg(u) INTO v_dates, v_product_ids, v_units
+        FROM (
+            SELECT DISTINCT shipping_date::date AS d, product_id AS p, COALESCE(product_unit, '') AS u
+            FROM old_rows WHERE shipping_date IS NOT NULL AND order_status IN ('已確認', '已出貨')
+        ) k;
+    END IF;
+    PERFORM refresh_production_plan(v_dates, v_product_ids, v_units);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_production_plan_update ON orders;
+DROP FUNCTION IF EXISTS orders_refresh_production_plan();
+
+-- 按新規則重新回填
+TRUNCATE production_plan_rollup;
+INSERT INTO production_plan_rollup (
+    shipping_date, product_id, product_unit,
+    total_quantity, unshipped_quantity, line_count, order_count, updated_at
+)
+SELECT od.shipping_date::date,
+       od.product_id,
+       COALESCE(od.product_unit, ''),
+       sum(od.product_quantity),
+       COALESCE(sum(od.product_quantity) FILTER (WHERE od.order_status = '已確認'), 0),
+       count(*),
+       count(DISTINCT od.order_id),
+       NOW()
+FROM order_details od
+WHERE od.order_status IN ('已確認', '已出貨') AND od.shipping_date IS NOT NULL
+GROUP BY od.shipping_date::date, od.product_id, COALESCE(od.product_unit, '');
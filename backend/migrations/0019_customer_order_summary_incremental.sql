@@ -0,0 +1,192 @@
+-- 訂單摘要改為增量維護：
+-- 1. customer_order_summary_orders 記錄每個計入摘要的訂單（有明細且有客戶）所在的分組，
+--    觸發器只對比受影響訂單的新舊狀態，按差值增減各分組的訂單數，不再重算客戶的全部歷史
+-- 2. 只有成員變化的 (客戶, 分組) 重新取最新 N 筆訂單，走索引 LIMIT N
+-- 3. 摘要不再保存商品明細文本，讀取時按訂單 ID 查詢，商品改名與明細變更不需要更新摘要
+CREATE TABLE IF NOT EXISTS customer_order_summary_orders (
+    order_id INT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    bucket VARCHAR(16) NOT NULL,
+    order_number TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_customer_order_summary_orders_latest
+    ON customer_order_summary_orders (customer_id, created_at DESC, order_id DESC);
+CREATE INDEX IF NOT EXISTS idx_customer_order_summary_orders_bucket_latest
+    ON customer_order_summary_orders (customer_id, bucket, created_at DESC, order_id DESC);
+
+-- 訂單當前應有的摘要成員狀態；沒有明細、沒有客戶或已刪除的訂單不返回
+CREATE OR REPLACE FUNCTION customer_order_summary_state(p_order_ids INT[])
+RETURNS TABLE (order_id INT, customer_id INT, bucket VARCHAR(16), order_number TEXT, created_at TIMESTAMP) AS $$
+    SELECT o.id,
+           o.customer_id,
+           (CASE
+               WHEN o.order_shipped THEN 'shipped'
+               WHEN o.order_confirmed THEN 'confirmed'
+               ELSE 'pending'
+           END)::VARCHAR(16),
+           o.order_number::TEXT,
+           o.created_at::TIMESTAMP
+    FROM orders o
+    WHERE o.id = ANY(p_order_ids)
+      AND o.customer_id IS NOT NULL
+      AND EXISTS (SELECT 1 FROM order_details od WHERE od.order_id = o.id)
+$$ LANGUAGE sql STABLE;
+
+-- 重新取指定 (客戶, 分組) 的最新 N 筆訂單
+CREATE OR REPLACE FUNCTION refresh_customer_order_summary_latest(
+    p_customer_ids INT[], p_buckets TEXT[], p_limit INT DEFAULT 10)
+RETURNS void AS $$
+BEGIN
+    UPDATE customer_order_summary s
+    SET latest_orders = l.latest_orders,
+        last_order_at = l.last_order_at,
+        updated_at = NOW()
+    FROM unnest(p_customer_ids, p_buckets) AS k(customer_id, bucket)
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                   'order_id', t.order_id,
+                   'order_number', t.order_number,
+                   'created_at', t.created_at,
+                   'status', CASE t.bucket
+                       WHEN 'shipped' THEN '已出貨'
+                       WHEN 'confirmed' THEN '已確認'
+                       ELSE '待確認'
+                   END
+               ) ORDER BY t.created_at DESC, t.order_id DESC), '[]'::jsonb) AS latest_orders,
+               max(t.created_at) AS last_order_at
+        FROM (
+            (SELECT m.order_id, m.bucket, m.order_number, m.created_at
+             FROM customer_order_summary_orders m
+             WHERE k.bucket = 'all' AND m.customer_id = k.customer_id
+             ORDER BY m.created_at DESC, m.order_id DESC
+             LIMIT p_limit)
+            UNION ALL
+            (SELECT m.order_id, m.bucket, m.order_number, m.created_at
+             FROM customer_order_summary_orders m
+             WHERE m.customer_id = k.customer_id AND m.bucket = k.bucket
+             ORDER BY m.created_at DESC, m.order_id DESC
+             LIMIT p_limit)
+        ) t
+    ) l
+    WHERE s.customer_id = k.customer_id AND s.bucket = k.bucket;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 同步受影響訂單的摘要成員狀態，按差值更新訂單數並刷新變化分組的最新訂單
+CREATE OR REPLACE FUNCTION sync_customer_order_summary(p_order_ids INT[], p_limit INT DEFAULT 10)
+RETURNS void AS $$
+DECLARE
+    v_changed INT[];
+    v_customer_ids INT[];
+    v_buckets TEXT[];
+BEGIN
+    IF p_order_ids IS NULL OR cardinality(p_order_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- 按訂單 ID 順序加事務級鎖，並發修改同一訂單時依次對比，差值不會重複計算
+    PERFORM pg_advisory_xact_lock(72450002, id) FROM unnest(p_order_ids) AS id ORDER BY id;
+
+    SELECT array_agg(DISTINCT d.order_id) INTO v_changed
+    FROM (
+        (SELECT * FROM customer_order_summary_state(p_order_ids)
+         EXCEPT
+         SELECT m.order_id, m.customer_id, m.bucket, m.order_number, m.created_at
+         FROM customer_order_summary_orders m WHERE m.order_id = ANY(p_order_ids))
+        UNION ALL
+        (SELECT m.order_id, m.customer_id, m.bucket, m.order_number, m.created_at
+         FROM customer_order_summary_orders m WHERE m.order_id = ANY(p_order_ids)
+         EXCEPT
+         SELECT * FROM customer_order_summary_state(p_order_ids))
+    ) d;
+    IF v_changed IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- 舊成員減一、新成員加一；同時鎖定受影響的摘要行，之後刷新最新訂單時可看到先提交的修改
+    WITH deltas AS (
+        SELECT m.customer_id, m.bucket, -1 AS delta
+        FROM customer_order_summary_orders m WHERE m.order_id = ANY(v_changed)
+        UNION ALL
+        SELECT s.customer_id, s.bucket, 1
+        FROM customer_order_summary_state(v_changed) s
+    ), bucket_deltas AS (
+        SELECT d.customer_id, b.bucket, sum(d.delta) AS delta
+        FROM deltas d
+        CROSS JOIN LATERAL (VALUES ('all'), (d.bucket)) AS b(bucket)
+        GROUP BY d.customer_id, b.bucket
+    ), upserted AS (
+        INSERT INTO customer_order_summary (customer_id, bucket, order_count, updated_at)
+        SELECT customer_id, bucket, delta, NOW()
+        FROM bucket_deltas
+        ORDER BY customer_id, bucket
+        ON CONFLICT (customer_id, bucket) DO UPDATE
+        SET order_count = customer_order_summary.order_count + EXCLUDED.order_count,
+            updated_at = NOW()
+        RETURNING customer_id, bucket
+    )
+    SELECT array_agg(customer_id), array_agg(bucket) INTO v_customer_ids, v_buckets FROM upserted;
+
+    DELETE FROM customer_order_summary_orders WHERE order_id = ANY(v_changed);
+    INSERT INTO customer_order_summary_orders (order_id, customer_id, bucket, order_number, created_at)
+    SELECT * FROM customer_order_summary_state(v_changed);
+
+    PERFORM refresh_customer_order_summary_latest(v_customer_ids, v_buckets, p_limit);
+END;
+$$ LANGUAGE plpgsql;
+
+-- orders 變更：客戶、狀態、訂單編號或時間變化的訂單（刪除的訂單全部）
+CREATE OR REPLACE FUNCTION orders_refresh_customer_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM sync_customer_order_summary(ARRAY(
+            SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (n.customer_id, n.order_confirmed, n.order_shipped, n.order_number, n.created_at)
+                  IS DISTINCT FROM (o.customer_id, o.order_confirmed, o.order_shipped, o.order_number, o.created_at)));
+    ELSE
+        PERFORM sync_customer_order_summary(ARRAY(SELECT id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- order_details 變更：只影響訂單是否有明細；數量、狀態等字段在讀取時查詢
+CREATE OR REPLACE FUNCTION order_details_refresh_customer_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM sync_customer_order_summary(ARRAY(SELECT DISTINCT order_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM sync_customer_order_summary(ARRAY(
+            SELECT n.order_id FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE n.order_id <> o.order_id
+            UNION
+            SELECT o.order_id FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE n.order_id <> o.order_id));
+    ELSE
+        PERFORM sync_customer_order_summary(ARRAY(SELECT DISTINCT order_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 商品名稱在讀取時查詢，不再需要商品改名觸發器與整體重算函數
+DROP TRIGGER IF EXISTS trg_products_summary_update ON products;
+DROP FUNCTION IF EXISTS products_refresh_customer_summary();
+DROP FUNCTION IF EXISTS refresh_customer_order_summary(INT[], INT);
+
+-- 回填：成員表、各分組訂單數與最新訂單
+TRUNCATE customer_order_summary;
+TRUNCATE customer_order_summary_orders;
+
+INSERT INTO customer_order_summary_orders (order_id, customer_id, bucket, order_number, created_at)
+SELECT * FROM customer_order_summary_state(ARRAY(SELECT id FROM orders));
+
+INSERT INTO customer_order_summary (customer_id, bucket, order_count, updated_at)
+SELECT m.customer_id, b.bucket, count(*), NOW()
+FROM customer_order_summary_orders m
+CROSS JOIN LATERAL (VALUES ('all'), (m.bucket)) AS b(bucket)
+GROUP BY m.customer_id, b.bucket;
+
+SELECT refresh_customer_order_summary_latest(
+    ARRAY(SELECT customer_id FROM customer_order_summary ORDER BY customer_id, bucket),
+    ARRAY(SELECT bucket::TEXT FROM customer_order_summary ORDER BY customer_id, bucket));
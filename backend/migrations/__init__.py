@@ -0,0 +1 @@
+# 資料庫遷移腳本目錄
@@ -0,0 +1,161 @@
+"""資料庫遷移執行器
+
+遷移文件放在本目錄，命名為 ``NNNN_說明.sql``，按版本號順序執行，
+已執行的版本記錄在 ``schema_migrations`` 表中。
+
+文件首行寫 ``-- migrate:no-transaction`` 時，逐條語句以 autocommit 執行，
+用於 ``CREATE INDEX CONCURRENTLY`` 等不能放在事務中的語句；
+此模式按分號拆分語句，文件中不要包含函數體等帶分號的語句塊。
+
+用法::
+
+    python -m backend.migrations.runner status
+    python -m backend.migrations.runner up [--dry-run]
+"""
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_([\w\-]+)\.sql$')
+NO_TRANSACTION_DIRECTIVE = '-- migrate:no-transaction'
+
+class Migration:
+    """單個遷移文件"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+
+    @property
+    def transactional(self):
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_DIRECTIVE)
+
+    def statements(self):
+        """拆分為單條語句，去除註釋行"""
+        lines = [line for line in self.sql.splitlines() if not line.strip().startswith('--')]
+        return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+def load_migrations():
+    """按版本號讀取所有遷移文件"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("遷移版本號重複")
+    return migrations
+
+def ensure_migrations_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(16) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            checksum CHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    conn.commit()
+
+def get_applied(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+def apply_migration(conn, migration):
+    """執行單個遷移並記錄版本"""
+    cursor = conn.cursor()
+    if migration.transactional:
+        try:
+            cursor.execute(migration.sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (migration.version, migration.name, migration.checksum)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return
+
+    # 非事務模式：逐條 autocommit 執行，語句需自行保證可重入（IF NOT EXISTS）
+    # 切換 autocommit 前先結束當前事務
+    conn.commit()
+    conn.autocommit = True
+    try:
+        for statement in migration.statements():
+            logger.info("執行: %s", statement.splitlines()[0])
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+            (migration.version, migration.name, migration.checksum)
+        )
+    finally:
+        conn.autocommit = False
+
+def status():
+    migrations = load_migrations()
+    with get_db_connection() as conn:
+        ensure_migrations_table(conn)
+        applied = get_applied(conn)
+    for migration in migrations:
+        if migration.version not in applied:
+            state = '待執行'
+        elif applied[migration.version] != migration.checksum:
+            state = '已執行（文件已修改）'
+        else:
+            state = '已執行'
+        print(f"{migration.version}_{migration.name}: {state}")
+
+def upgrade(dry_run=False):
+    """執行所有未執行的遷移"""
+    migrations = load_migrations()
+    with get_db_connection() as conn:
+        ensure_migrations_table(conn)
+        applied = get_applied(conn)
+
+        for migration in migrations:
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    logger.warning("遷移 %s 在執行後被修改過", migration.version)
+                continue
+
+            if dry_run:
+                print(f"-- {migration.version}_{migration.name} ({'事務' if migration.transactional else '非事務'})")
+                print(migration.sql)
+                continue
+
+            logger.info("開始執行遷移 %s_%s", migration.version, migration.name)
+            apply_migration(conn, migration)
+            logger.info("遷移 %s 完成", migration.version)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='資料庫遷移工具')
+    parser.add_argument('command', choices=['status', 'up'])
+    parser.add_argument('--dry-run', action='store_true', help='只輸出將要執行的 SQL')
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        status()
+    else:
+        upgrade(dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
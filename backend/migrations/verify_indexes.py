@@ -0,0 +1,167 @@
+"""驗證熱點查詢能走索引
+
+對每條熱點查詢執行 EXPLAIN (FORMAT JSON)，檢查計劃中是否使用了預期的索引。
+小表上規劃器通常會選擇順序掃描，因此在事務內 SET LOCAL enable_seqscan = off，
+驗證的是「索引可用」而不是「當前數據量下一定會選用」。
+
+用法::
+
+    python -m backend.migrations.verify_indexes
+"""
+import os
+import sys
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config.database import get_db_connection
+
+# (說明, SQL, 參數, 預期索引之一)
+HOT_QUERIES = [
+    (
+        '/orders/pending 待確認訂單',
+        """
+        SELECT o.id FROM orders o
+        JOIN order_details od ON o.id = od.order_id
+        WHERE od.order_status = '待確認'
+        """,
+        (),
+        ('idx_order_details_pending',)
+    ),
+    (
+        '/orders/list 客戶訂單',
+        """
+        SELECT o.id FROM orders o
+        WHERE o.customer_id = %s
+        ORDER BY o.created_at DESC
+        """,
+        (1,),
+        ('idx_orders_customer_created',)
+    ),
+    (
+        'check_recent_order 重複下單檢查',
+        """
+        SELECT od.id FROM orders o
+        JOIN order_details od ON o.id = od.order_id
+        WHERE o.customer_id = %s AND od.product_id = %s
+          AND o.created_at >= CURRENT_DATE - INTERVAL '7 DAY'
+        LIMIT 1
+        """,
+        (1, 1),
+        ('idx_orders_customer_created', 'idx_order_details_product_order')
+    ),
+    (
+        '按訂單編號查詢',
+        "SELECT id FROM orders WHERE order_number = %s",
+        ('verify',),
+        ('uq_orders_order_number',)
+    ),
+    (
+        'LINE 用戶身份查詢',
+        "SELECT customer_id FROM line_users WHERE line_user_id = %s",
+        ('verify',),
+        ('idx_line_users_line_user_id',)
+    ),
+    (
+        'LINE 群組身份查詢',
+        "SELECT customer_id FROM line_groups WHERE line_group_id = %s",
+        ('verify',),
+        ('idx_line_groups_line_group_id',)
+    ),
+    (
+        '產品列表',
+        """
+        SELECT id FROM products WHERE status = 'active'
+        ORDER BY created_at DESC LIMIT 100
+        """,
+        (),
+        ('idx_products_status_created',)
+    ),
+    (
+        '日誌按表名分頁',
+        """
+        SELECT id FROM logs WHERE table_name = %s
+        ORDER BY created_at DESC LIMIT 10
+        """,
+        ('orders',),
+        ('idx_logs_table_created',)
+    ),
+    (
+        '日誌全部分頁',
+        "SELECT id FROM logs ORDER BY created_at DESC LIMIT 10",
+        (),
+        ('idx_logs_created_at',)
+    ),
+    (
+        '鎖定日期清理',
+        "SELECT id FROM locked_dates WHERE locked_date < %s::date",
+        ('2000-01-01',),
+        ('idx_locked_dates_locked_date',)
+    ),
+    (
+        '上傳文件原始文件名查詢',
+        "SELECT original_filename FROM product_files WHERE stored_name = %s",
+        ('verify',),
+        ('uq_product_files_stored_name',)
+    ),
+    (
+        '文件名 LIKE 查詢（需要 pg_trgm）',
+        "SELECT image_original_filename FROM products WHERE image_url LIKE %s",
+        ('%verify%',),
+        ('idx_products_image_url_trgm',)
+    ),
+]
+
+def _collect_index_names(plan, names):
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        _collect_index_names(child, names)
+    return names
+
+def find_invalid_indexes(cursor):
+    """找出 CONCURRENTLY 建立失敗後殘留的無效索引"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def verify():
+    failures = 0
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        invalid = find_invalid_indexes(cursor)
+        if invalid:
+            failures += 1
+            print(f"FAIL 無效索引（需 DROP INDEX 後重新執行遷移）: {', '.join(invalid)}")
+
+        for description, sql, params, expected in HOT_QUERIES:
+            try:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = _collect_index_names(plan[0]['Plan'], set())
+            except Exception as e:
+                conn.rollback()
+                failures += 1
+                print(f"FAIL {description}: {e}")
+                continue
+
+            if used & set(expected):
+                print(f"OK   {description}: {', '.join(sorted(used))}")
+            else:
+                failures += 1
+                print(f"FAIL {description}: 預期 {', '.join(expected)}，實際 {', '.join(sorted(used)) or '順序掃描'}")
+
+        conn.rollback()
+
+    return failures
+
+if __name__ == '__main__':
+    sys.exit(1 if verify() else 0)
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, session
 from backend.config.database import get_db_connection
 from backend.models.admin import Admin
 from backend.utils.auth_utils import require_permission
+from backend.utils.token_utils import get_token_admin_id
 from hash_password import verify_password, hash_password
 import psycopg2.extras
 import logging
@@ -58,9 +59,7 @@ def add_admin():
         # 获取当前管理员ID
         admin_id = session.get('admin_id')
         if not admin_id:
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                admin_id = auth_header.split(' ')[1]
+            admin_id = get_token_admin_id()
         
         if not admin_id:
             return jsonify({
@@ -194,9 +193,7 @@ def update_admin():
             # 获取当前管理员ID（操作者）
             current_admin_id = session.get('admin_id')
             if not current_admin_id:
-                auth_header = request.headers.get('Authorization')
-                if auth_header and auth_header.startswith('Bearer '):
-                    current_admin_id = auth_header.split(' ')[1]
+                current_admin_id = get_token_admin_id()
             
             if not current_admin_id:
                 return jsonify({
@@ -343,9 +340,7 @@ def delete_admin():
         # 获取当前管理员ID
         current_admin_id = session.get('admin_id')
         if not current_admin_id:
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                current_admin_id = auth_header.split(' ')[1]
+            current_admin_id = get_token_admin_id()
         
         if not current_admin_id:
             return jsonify({
@@ -449,12 +444,9 @@ def get_admin_info():
         # 首先从 session 中获取当前登录的管理员ID
         current_admin_id = session.get('admin_id')
         
-        # 如果 session 中没有，则尝试从 Authorization header 中获取
+        # 如果 session 中没有，则尝试从已驗證的 access token 中获取
         if not current_admin_id:
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                current_admin_id = auth_header.split(' ')[1]
-                session['admin_id'] = current_admin_id
+            current_admin_id = get_token_admin_id()
         
         logger.debug("當前管理員 ID: %s", current_admin_id)
         logger.debug("目標管理員 ID: %s", target_admin_id)
@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify, session
 import bcrypt
+import jwt
 from backend.config.database import get_db_connection
+from backend.models.admin import Admin
+from backend.utils.token_utils import (
+    issue_token_pair, decode_token, USER_TYPE_ADMIN, USER_TYPE_CUSTOMER
+)
 import logging
 
 # 獲取 logger
@@ -67,12 +72,19 @@ def customer_login():
                     session['company_name'] = customer_dict['company_name']
                     session.modified = True
                     
+                    # 簽發 access/refresh token
+                    tokens = issue_token_pair(
+                        customer_dict['id'], USER_TYPE_CUSTOMER,
+                        company_name=customer_dict['company_name']
+                    )
+                    
                     return jsonify({
                         'status': 'success',
                         'message': '登入成功',
                         'data': {
                             'customer_id': customer_dict['id'],
-                            'company_name': customer_dict['company_name']
+                            'company_name': customer_dict['company_name'],
+                            **tokens
                         }
                     })
                 else:
@@ -94,7 +106,7 @@ def admin_login():
             logger.warning("管理員登入請求缺少必要參數")
             return jsonify({'status': 'error', 'message': '請提供用戶名和密碼'})
 
-        logger.debug("接收到的登入數據: %s", data)
+        logger.debug("接收到的登入帳號: %s", data['admin_account'])
 
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -160,11 +172,13 @@ def admin_login():
                         'admin_name': admin_data['admin_name'],
                         'staff_no': admin_data['staff_no'],
                         'permission_level_id': admin_data['permission_level_id'],
-                        'permissions': permissions
+                        'permissions': permissions,
+                        # 簽發 access/refresh token，權限以位元集嵌入 access token
+                        **issue_token_pair(admin_data['id'], USER_TYPE_ADMIN, permissions)
                     }
                 }
                 
-                logger.debug("返回的數據: %s", response_data)
+                logger.debug("管理員登入成功: %s", admin_data['admin_account'])
                 return jsonify(response_data)
             else:
                 return jsonify({'status': 'error', 'message': '密碼錯誤'})
@@ -172,6 +186,54 @@ def admin_login():
         logger.error("管理員登入錯誤: %s", str(e))
         return jsonify({'status': 'error', 'message': '登入失敗'})
 
+@auth_bp.route('/token/refresh', methods=['POST'])
+def refresh_token():
+    """使用 refresh token 換取新的 access token
+
+    刷新時重新讀取帳號狀態與權限，權限變更在下次刷新後生效。
+    """
+    try:
+        data = request.get_json() or {}
+        token = data.get('refresh_token')
+        if not token:
+            return jsonify({'status': 'error', 'message': '缺少 refresh token'}), 400
+
+        try:
+            claims = decode_token(token, expected_type='refresh')
+        except jwt.ExpiredSignatureError:
+            return jsonify({'status': 'error', 'code': 'token_expired', 'message': '登入已過期，請重新登入'}), 401
+        except jwt.InvalidTokenError as e:
+            logger.warning("無效的 refresh token: %s", str(e))
+            return jsonify({'status': 'error', 'code': 'token_invalid', 'message': '無效的憑證'}), 401
+
+        user_id = int(claims['sub'])
+
+        if claims.get('utp') == USER_TYPE_ADMIN:
+            admin = Admin.get_by_id(user_id)
+            if not admin:
+                return jsonify({'status': 'error', 'message': '帳號不存在或已停用'}), 401
+            tokens = issue_token_pair(user_id, USER_TYPE_ADMIN, admin['permissions'])
+            return jsonify({
+                'status': 'success',
+                'data': dict(tokens, permissions=admin['permissions'])
+            })
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT company_name FROM customers WHERE id = %s AND status = 'active'",
+                (user_id,)
+            )
+            customer = cursor.fetchone()
+
+        if not customer:
+            return jsonify({'status': 'error', 'message': '帳號不存在或已停用'}), 401
+        tokens = issue_token_pair(user_id, USER_TYPE_CUSTOMER, company_name=customer[0])
+        return jsonify({'status': 'success', 'data': tokens})
+    except Exception as e:
+        logger.error("刷新憑證錯誤: %s", str(e))
+        return jsonify({'status': 'error', 'message': '刷新憑證失敗'}), 500
+
 @auth_bp.route('/reset-password', methods=['POST'])
 def reset_password():
     try:
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, session
 from backend.config.database import get_db_connection
+from backend.utils.line_identity_cache import line_identity_cache
+from backend.utils.reorder_limit import reorder_limit_cache
+from backend.utils.query_inspector import query_budget
 from hash_password import verify_password, hash_password
 import datetime
 from typing import Dict, Any
@@ -12,6 +15,7 @@ from urllib.parse import quote
 customer_bp = Blueprint('customer', __name__)
 
 @customer_bp.route('/customer/list', methods=['POST'])
+@query_budget(3)
 def get_customer_list():
     try:
         with get_db_connection() as conn:
@@ -29,26 +33,34 @@ def get_customer_list():
             print("数据库列名:", columns)  # 打印列名
             customers = [dict(zip(columns, row)) for row in cursor.fetchall()]
             
-            # 获取每个客户的LINE用户和群组
-            for customer in customers:
-                # 查询LINE用户
+            # 一次获取所有客户的LINE用户和群组
+            customer_ids = [customer['id'] for customer in customers]
+            line_users_by_customer = {}
+            line_groups_by_customer = {}
+            if customer_ids:
                 cursor.execute("""
-                    SELECT id, line_user_id, user_name
+                    SELECT customer_id, id, line_user_id, user_name
                     FROM line_users
-                    WHERE customer_id = %s
-                """, (customer['id'],))
-                line_users = [dict(zip(['id', 'line_user_id', 'user_name'], row)) for row in cursor.fetchall()]
-                customer['line_users'] = line_users
+                    WHERE customer_id = ANY(%s)
+                    ORDER BY id
+                """, (customer_ids,))
+                for customer_id, user_id, line_user_id, user_name in cursor.fetchall():
+                    line_users_by_customer.setdefault(customer_id, []).append(
+                        {'id': user_id, 'line_user_id': line_user_id, 'user_name': user_name})
                 
-                # 查询LINE群组
                 cursor.execute("""
-                    SELECT id, line_group_id, group_name
+                    SELECT customer_id, id, line_group_id, group_name
                     FROM line_groups
-                    WHERE customer_id = %s
-                """, (customer['id'],))
-                line_groups = [dict(zip(['id', 'line_group_id', 'group_name'], row)) for row in cursor.fetchall()]
-                customer['line_groups'] = line_groups
-                
+                    WHERE customer_id = ANY(%s)
+                    ORDER BY id
+                """, (customer_ids,))
+                for customer_id, group_id, line_group_id, group_name in cursor.fetchall():
+                    line_groups_by_customer.setdefault(customer_id, []).append(
+                        {'id': group_id, 'line_group_id': line_group_id, 'group_name': group_name})
+            
+            for customer in customers:
+                customer['line_users'] = line_users_by_customer.get(customer['id'], [])
+                customer['line_groups'] = line_groups_by_customer.get(customer['id'], [])
                 # 为向后兼容，添加空的line_account字段
                 customer['line_account'] = ''
             
@@ -121,6 +133,7 @@ def add_customer():
                 }), 400
             
             conn.commit()
+            _invalidate_line_identities(customer_id, data)
             
             return jsonify({
                 "status": "success",
@@ -136,6 +149,7 @@ def add_customer():
         }), 500
 
 @customer_bp.route('/customer/update', methods=['POST', 'PUT'])
+@query_budget(20)
 def update_customer():
     """更新客户信息"""
     try:
@@ -166,6 +180,8 @@ def update_customer():
                 }), 400
             
             conn.commit()
+            _invalidate_line_identities(customer_id, data)
+            reorder_limit_cache.invalidate(customer_id)  # 限制天數或客戶狀態可能已變更
             
             return jsonify({
                 "status": "success",
@@ -250,6 +266,8 @@ def delete_customer():
             cursor.execute("DELETE FROM line_groups WHERE customer_id = %s", (data['id'],))
             
             conn.commit()
+            _invalidate_line_identities(data['id'])
+            reorder_limit_cache.invalidate(data['id'])  # 限制天數或客戶狀態可能已變更
             
             # 記錄刪除操作的日誌
             try:
@@ -587,6 +605,8 @@ def update_customer_self():
                 print(f"Error logging customer update: {str(log_error)}")
             
             conn.commit()
+            _invalidate_line_identities(customer_id)
+            reorder_limit_cache.invalidate(customer_id)  # 限制天數或客戶狀態可能已變更
             
             return jsonify({
                 "status": "success",
@@ -600,6 +620,15 @@ def update_customer_self():
             "message": str(e)
         }), 500
 
+def _invalidate_line_identities(customer_id, customer_data=None):
+    """提交後移除該客戶及請求中 LINE 身份的綁定緩存"""
+    customer_data = customer_data or {}
+    line_identity_cache.invalidate_customer(
+        customer_id,
+        line_user_ids=[user.get('line_user_id') for user in customer_data.get('line_users') or []],
+        line_group_ids=[group.get('line_group_id') for group in customer_data.get('line_groups') or []]
+    )
+
 def _process_create(customer_data, cursor, conn):
     """处理客户创建逻辑"""
     try:
@@ -1177,6 +1206,7 @@ def unbind_line_user():
                 }), 404
 
             conn.commit()
+            _invalidate_line_identities(customer_id)
             
             # 准备新客户数据用于日志记录
             new_customer_data = old_customer_data.copy()
@@ -1317,6 +1347,7 @@ def unbind_line_group():
                 }), 404
 
             conn.commit()
+            _invalidate_line_identities(customer_id)
             
             # 准备新客户数据用于日志记录
             new_customer_data = old_customer_data.copy()
@@ -1542,6 +1573,11 @@ def bind_line():
             new_line_groups = [dict(zip(['id', 'line_group_id', 'group_name'], row)) for row in cursor.fetchall()]
             
             conn.commit()
+            line_identity_cache.invalidate_customer(
+                customer_id,
+                line_user_ids=[line_user_id] if line_user_id else (),
+                line_group_ids=[line_group_id] if line_group_id else ()
+            )
             
             # 准备新客户数据用于日志记录
             new_customer_data = old_customer_data.copy()
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, abort, jsonify, session, redirect
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage,
@@ -10,10 +10,15 @@ import os
 from dotenv import load_dotenv
 from backend.config.database import get_db_connection
 from urllib.parse import quote
-import requests
 from flask_cors import CORS
 import psycopg2.extras
 import logging
+from backend.utils.line_webhook_queue import LineEventDispatcher
+from backend.utils.line_identity_cache import line_identity_cache, KIND_USER, KIND_GROUP
+from backend.services.order_summary_service import (
+    OrderSummaryService, BUCKET_PENDING, BUCKET_CONFIRMED, BUCKET_SHIPPED
+)
+from backend.utils.line_http import line_request, line_bot_api, LINE_API_ENDPOINT
 
 # 獲取 logger
 logger = logging.getLogger(__name__)
@@ -22,7 +27,6 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # 从环境变量获取配置
-LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
 LINE_CHANNEL_ID = os.getenv('LINE_CHANNEL_ID')
 LINE_LIFF_ID = os.getenv('LINE_LIFF_ID')
@@ -35,8 +39,24 @@ ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS').split(',')
 line_bot_bp = Blueprint('line_bot', __name__)
 CORS(line_bot_bp, supports_credentials=True, origins=ALLOWED_ORIGINS)
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
+# webhook 事件在後台線程中處理，callback 立即返回
+line_event_dispatcher = LineEventDispatcher(handler)
+
+# 機器人支持的訂單查詢指令
+ORDER_COMMANDS = ('近兩週訂單', '待確認訂單', '已確認訂單', '已完成訂單')
+# 指令對應的訂單摘要分組（近兩週訂單取全部分組再按時間過濾）
+ORDER_COMMAND_BUCKETS = {
+    '待確認訂單': BUCKET_PENDING,
+    '已確認訂單': BUCKET_CONFIRMED,
+    '已完成訂單': BUCKET_SHIPPED
+}
+ORDER_COMMAND_EMPTY_REPLIES = {
+    '近兩週訂單': "近兩週內沒有訂單記錄。",
+    '待確認訂單': "目前沒有待確認的訂單。",
+    '已確認訂單': "目前沒有已確認的訂單。",
+    '已完成訂單': "目前沒有已完成的訂單。"
+}
 
 @line_bot_bp.after_request
 def after_request(response):
@@ -93,7 +113,9 @@ def generate_bind_url():
 @line_bot_bp.route("/callback", methods=['POST'])
 def callback():
     # 获取 X-Line-Signature 头部值
-    signature = request.headers['X-Line-Signature']
+    signature = request.headers.get('X-Line-Signature')
+    if not signature:
+        abort(400)
 
     # 获取请求体内容
     body = request.get_data(as_text=True)
@@ -104,12 +126,17 @@ def callback():
         logger.debug("Headers: %s", dict(request.headers))
         logger.debug("Body: %s", body)
         
-        # 验证签名
-        handler.handle(body, signature)
+        # 验证签名并解析事件
+        payload = handler.parser.parse(body, signature, as_payload=True)
     except InvalidSignatureError:
         logger.warning("Invalid signature error")
         abort(400)
 
+    # 事件放入隊列後立即返回，處理函數中的資料庫查詢與回覆不再阻塞 webhook
+    if not line_event_dispatcher.submit(payload):
+        # 隊列已滿，返回錯誤讓 LINE 稍後重新投遞（已入隊的事件會按 webhookEventId 去重）
+        return 'Busy', 503
+
     return 'OK'
 
 @line_bot_bp.route("/line-binding", methods=['GET', 'POST', 'OPTIONS'])
@@ -145,7 +172,7 @@ def line_login_callback():
             }), 400
 
         # 使用授權碼獲取訪問令牌
-        token_url = "https://api.line.me/oauth2/v2.1/token"
+        token_url = f"{LINE_API_ENDPOINT}/oauth2/v2.1/token"
         token_data = {
             "grant_type": "authorization_code",
             "code": code,
@@ -156,7 +183,8 @@ def line_login_callback():
         
         logger.debug("Token request data: %s", token_data)
         
-        token_response = requests.post(token_url, data=token_data)
+        # 授權碼在服務端出錯時未被消耗，5xx 可以重試
+        token_response = line_request('POST', token_url, retry_on_5xx=True, data=token_data)
         token_json = token_response.json()
         
         logger.debug("Token response: %s", token_json)
@@ -170,14 +198,14 @@ def line_login_callback():
             }), 400
 
         # 使用訪問令牌獲取用戶信息
-        profile_url = "https://api.line.me/v2/profile"
+        profile_url = f"{LINE_API_ENDPOINT}/v2/profile"
         headers = {
             "Authorization": f"Bearer {token_json['access_token']}"
         }
         
         logger.debug("Profile request headers: %s", headers)
         
-        profile_response = requests.get(profile_url, headers=headers)
+        profile_response = line_request('GET', profile_url, headers=headers)
         profile_json = profile_response.json()
         
         logger.debug("Profile response: %s", profile_json)
@@ -277,6 +305,7 @@ def line_login_callback():
                     """, (customer_id, profile_json['userId'], profile_json.get('displayName', '')))
                 
                 conn.commit()
+                line_identity_cache.invalidate(KIND_USER, profile_json['userId'])
                 
                 # 获取更新后的LINE用户列表
                 cursor.execute("""
@@ -444,6 +473,7 @@ def bind():
                     """, (customer_id, line_user_id, data.get('user_name', '')))
                 
                 conn.commit()
+                line_identity_cache.invalidate(KIND_USER, line_user_id)
                 
                 # 获取更新后的LINE用户列表
                 cursor.execute("""
@@ -559,8 +589,28 @@ def handle_join(event):
         except:
             pass
 
+def _classify_command(user_message, is_group_message):
+    """判斷消息是否為機器人指令，非指令的消息不需要任何資料庫查詢
+
+    Returns:
+        指令類型 'order'、'bind'、'help'，非指令時為 None
+    """
+    command = user_message.strip()
+    if command in ORDER_COMMANDS:
+        return 'order'
+    if not is_group_message:
+        # 私聊消息：只處理訂單指令
+        return None
+    # 群組消息：另外處理綁定指令和功能指令
+    if command == '功能':
+        return 'help'
+    if user_message.startswith('綁定帳號') and len(user_message.split()) >= 2:
+        return 'bind'
+    return None
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
+    command_type = None
     try:
         user_message = event.message.text
         user_id = event.source.user_id
@@ -573,27 +623,16 @@ def handle_message(event):
             is_group_message = True
             group_id = event.source.group_id
         
-        # 定義訂單相關指令和群組特定指令
-        order_commands = ['近兩週訂單', '待確認訂單', '已確認訂單', '已完成訂單']
-        group_specific_commands = ['功能', '綁定帳號']
-        
-        # 檢查消息是否是各類指令
-        is_order_command = user_message.strip() in order_commands
-        is_bind_command = user_message.startswith('綁定帳號') and len(user_message.split()) >= 2
-        is_help_command = user_message.strip() == '功能'
-        
-        # 決定當前消息是否需要處理
-        if is_group_message:
-            # 群組消息：只處理訂單指令、綁定指令和功能指令
-            should_process = is_order_command or is_bind_command or is_help_command
-        else:
-            # 私聊消息：只處理訂單指令
-            should_process = is_order_command
-        
-        # 如果不需要處理這個消息，直接退出
-        if not should_process:
+        # 在任何資料庫查詢之前過濾掉非指令消息（群組閒聊）
+        command_type = _classify_command(user_message, is_group_message)
+        if command_type is None:
             return
         
+        command = user_message.strip()
+        is_order_command = command_type == 'order'
+        is_bind_command = command_type == 'bind'
+        is_help_command = command_type == 'help'
+        
         # 處理"功能"指令 (只在群組中回應)
         if is_group_message and is_help_command:
             feature_text = (
@@ -719,6 +758,7 @@ def handle_message(event):
                     """, (customer_id, group_id, group_name))
                     
                     conn.commit()
+                    line_identity_cache.invalidate(KIND_GROUP, group_id)
                     
                     # 獲取更新後的LINE群組列表
                     cursor.execute("""
@@ -781,221 +821,58 @@ def handle_message(event):
                 
                 return
             
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 檢查對應的綁定情況
+        # 檢查對應的綁定情況（進程內緩存，群組中的連續指令不重複查詢）
+        if is_group_message:
+            customer = line_identity_cache.resolve(KIND_GROUP, group_id)
+        else:
+            customer = line_identity_cache.resolve(KIND_USER, user_id)
+        
+        # 如果未綁定，提示用戶需要綁定
+        if not customer:
             if is_group_message:
-                # 群組消息：檢查群組綁定
-                cursor.execute("""
-                    SELECT c.id, c.company_name 
-                    FROM customers c
-                    JOIN line_groups lg ON c.id = lg.customer_id
-                    WHERE lg.line_group_id = %s AND c.status = 'active'
-                """, (group_id,))
+                reply_text = "此群組尚未綁定帳號，請先完成帳號綁定。\n\n您可以輸入「功能」查看如何綁定帳號。"
             else:
-                # 私聊消息：檢查用戶綁定
-                cursor.execute("""
-                    SELECT c.id, c.company_name 
-                    FROM customers c
-                    JOIN line_users lu ON c.id = lu.customer_id
-                    WHERE lu.line_user_id = %s AND c.status = 'active'
-                """, (user_id,))
+                reply_text = "您尚未綁定帳號，請先完成帳號綁定。"
             
-            customer = cursor.fetchone()
+            line_bot_api.reply_message(
+                event.reply_token,
+                TextSendMessage(text=reply_text)
+            )
+            return
+        
+        # 處理訂單相關指令：讀取觸發器維護的訂單摘要，單行查詢
+        if is_order_command:
+            customer_id, company_name = customer
             
-            # 如果未綁定，提示用戶需要綁定
-            if not customer:
-                if is_group_message:
-                    reply_text = "此群組尚未綁定帳號，請先完成帳號綁定。\n\n您可以輸入「功能」查看如何綁定帳號。"
+            with get_db_connection() as conn:
+                summary_service = OrderSummaryService(conn)
+                if command == '近兩週訂單':
+                    orders = summary_service.get_recent_orders(customer_id, days=14)
                 else:
-                    reply_text = "您尚未綁定帳號，請先完成帳號綁定。"
-                
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text=reply_text)
-                )
-                return
+                    orders = summary_service.get_bucket(customer_id, ORDER_COMMAND_BUCKETS[command])['latest_orders']
             
-            # 處理訂單相關指令
-            if is_order_command:
-                customer_id, company_name = customer
-                
-                if user_message == '近兩週訂單':
-                    cursor.execute("""
-                        SELECT DISTINCT o.order_number, o.created_at, 
-                               CASE 
-                                   WHEN o.order_shipped THEN '已出貨'
-                                   WHEN o.order_confirmed THEN '已確認'
-                                   ELSE '待確認'
-                               END as status,
-                               string_agg(
-                                   p.name || ' x' || od.product_quantity || od.product_unit || 
-                                   ' (' || od.order_status || ')' ||
-                                   CASE 
-                                       WHEN od.remark IS NOT NULL AND od.remark != '' 
-                                       THEN E'\n客戶備註: ' || od.remark
-                                       ELSE ''
-                                   END ||
-                                   CASE 
-                                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != '' 
-                                       THEN E'\n供應商備註: ' || od.supplier_note
-                                       ELSE ''
-                                   END,
-                                   E'\n'
-                               ) as product_details
-                        FROM orders o
-                        JOIN order_details od ON o.id = od.order_id
-                        JOIN products p ON od.product_id = p.id
-                        WHERE o.customer_id = %s 
-                        AND o.created_at >= NOW() - INTERVAL '14 days'
-                        GROUP BY o.id, o.order_number, o.created_at, o.order_confirmed, o.order_shipped
-                        ORDER BY o.created_at DESC
-                        LIMIT 10
-                    """, (customer_id,))
-                    
-                    orders = cursor.fetchall()
-                    if orders:
-                        reply_text = f"您好 {company_name}，以下為最新的10筆近兩週訂單：\n\n"
-                        for order in orders:
-                            reply_text += f"訂單編號：{order[0]}\n"
-                            reply_text += f"建立時間：{order[1].strftime('%Y-%m-%d')}\n"
-                            reply_text += f"狀態：{order[2]}\n"
-                            reply_text += f"訂購商品：\n{order[3]}\n"
-                            reply_text += "-------------------\n"
-                    else:
-                        reply_text = "近兩週內沒有訂單記錄。"
-
-                elif user_message == '待確認訂單':
-                    cursor.execute("""
-                        SELECT DISTINCT o.order_number, o.created_at,
-                               string_agg(
-                                   p.name || ' x' || od.product_quantity || od.product_unit || 
-                                   ' (' || od.order_status || ')' ||
-                                   CASE 
-                                       WHEN od.remark IS NOT NULL AND od.remark != '' 
-                                       THEN E'\n客戶備註: ' || od.remark
-                                       ELSE ''
-                                   END ||
-                                   CASE 
-                                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != '' 
-                                       THEN E'\n供應商備註: ' || od.supplier_note
-                                       ELSE ''
-                                   END,
-                                   E'\n'
-                               ) as product_details
-                        FROM orders o
-                        JOIN order_details od ON o.id = od.order_id
-                        JOIN products p ON od.product_id = p.id
-                        WHERE o.customer_id = %s 
-                        AND NOT o.order_confirmed 
-                        AND NOT o.order_shipped
-                        GROUP BY o.id, o.order_number, o.created_at
-                        ORDER BY o.created_at DESC
-                        LIMIT 10
-                    """, (customer_id,))
-                    
-                    orders = cursor.fetchall()
-                    if orders:
-                        reply_text = f"您好 {company_name}，以下為最新的10筆待確認訂單：\n\n"
-                        for order in orders:
-                            reply_text += f"訂單編號：{order[0]}\n"
-                            reply_text += f"建立時間：{order[1].strftime('%Y-%m-%d')}\n"
-                            reply_text += f"訂購商品：\n{order[2]}\n"
-                            reply_text += "-------------------\n"
-                    else:
-                        reply_text = "目前沒有待確認的訂單。"
-
-                elif user_message == '已確認訂單':
-                    cursor.execute("""
-                        SELECT DISTINCT o.order_number, o.created_at,
-                               string_agg(
-                                   p.name || ' x' || od.product_quantity || od.product_unit || 
-                                   ' (' || od.order_status || ')' ||
-                                   CASE 
-                                       WHEN od.remark IS NOT NULL AND od.remark != '' 
-                                       THEN E'\n客戶備註: ' || od.remark
-                                       ELSE ''
-                                   END ||
-                                   CASE 
-                                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != '' 
-                                       THEN E'\n供應商備註: ' || od.supplier_note
-                                       ELSE ''
-                                   END,
-                                   E'\n'
-                               ) as product_details
-                        FROM orders o
-                        JOIN order_details od ON o.id = od.order_id
-                        JOIN products p ON od.product_id = p.id
-                        WHERE o.customer_id = %s 
-                        AND o.order_confirmed 
-                        AND NOT o.order_shipped
-                        GROUP BY o.id, o.order_number, o.created_at
-                        ORDER BY o.created_at DESC
-                        LIMIT 10
-                    """, (customer_id,))
-                    
-                    orders = cursor.fetchall()
-                    if orders:
-                        reply_text = f"您好 {company_name}，以下為最新的10筆已確認訂單：\n\n"
-                        for order in orders:
-                            reply_text += f"訂單編號：{order[0]}\n"
-                            reply_text += f"建立時間：{order[1].strftime('%Y-%m-%d')}\n"
-                            reply_text += f"訂購商品：\n{order[2]}\n"
-                            reply_text += "-------------------\n"
-                    else:
-                        reply_text = "目前沒有已確認的訂單。"
-
-                elif user_message == '已完成訂單':
-                    cursor.execute("""
-                        SELECT DISTINCT o.order_number, o.created_at,
-                               string_agg(
-                                   p.name || ' x' || od.product_quantity || od.product_unit || 
-                                   ' (' || od.order_status || ')' ||
-                                   CASE 
-                                       WHEN od.remark IS NOT NULL AND od.remark != '' 
-                                       THEN E'\n客戶備註: ' || od.remark
-                                       ELSE ''
-                                   END ||
-                                   CASE 
-                                       WHEN od.supplier_note IS NOT NULL AND od.supplier_note != '' 
-                                       THEN E'\n供應商備註: ' || od.supplier_note
-                                       ELSE ''
-                                   END,
-                                   E'\n'
-                               ) as product_details
-                        FROM orders o
-                        JOIN order_details od ON o.id = od.order_id
-                        JOIN products p ON od.product_id = p.id
-                        WHERE o.customer_id = %s 
-                        AND o.order_shipped
-                        GROUP BY o.id, o.order_number, o.created_at
-                        ORDER BY o.created_at DESC
-                        LIMIT 10
-                    """, (customer_id,))
-                    
-                    orders = cursor.fetchall()
-                    if orders:
-                        reply_text = f"您好 {company_name}，以下為最新的10筆已完成訂單：\n\n"
-                        for order in orders:
-                            reply_text += f"訂單編號：{order[0]}\n"
-                            reply_text += f"建立時間：{order[1].strftime('%Y-%m-%d')}\n"
-                            reply_text += f"訂購商品：\n{order[2]}\n"
-                            reply_text += "-------------------\n"
-                    else:
-                        reply_text = "目前沒有已完成的訂單。"
-                
-                # 回覆訂單查詢結果
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text=reply_text)
-                )
+            if orders:
+                reply_text = f"您好 {company_name}，以下為最新的10筆{command}：\n\n"
+                for order in orders:
+                    reply_text += f"訂單編號：{order['order_number']}\n"
+                    reply_text += f"建立時間：{order['created_at'][:10]}\n"
+                    if command == '近兩週訂單':
+                        reply_text += f"狀態：{order['status']}\n"
+                    reply_text += f"訂購商品：\n{order['product_details'] or ''}\n"
+                    reply_text += "-------------------\n"
+            else:
+                reply_text = ORDER_COMMAND_EMPTY_REPLIES[command]
+            
+            # 回覆訂單查詢結果
+            line_bot_api.reply_message(
+                event.reply_token,
+                TextSendMessage(text=reply_text)
+            )
             
     except Exception as e:
         logger.error("Error handling message: %s", str(e))
         # 只在特定命令出錯時才發送錯誤訊息
-        order_commands = ['近兩週訂單', '待確認訂單', '已確認訂單', '已完成訂單']
-        if (user_message.strip() in order_commands) or (is_group_message and (user_message.strip() == '功能' or user_message.startswith('綁定帳號'))):
+        if command_type is not None:
             line_bot_api.reply_message(
                 event.reply_token,
                 TextSendMessage(text="抱歉，系統發生錯誤，請稍後再試。")
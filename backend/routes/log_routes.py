@@ -6,6 +6,11 @@ from flask_cors import CORS, cross_origin
 import os
 import json
 from backend.services.log_service_registry import LogServiceRegistry
+from backend.utils.token_utils import get_token_admin_id, get_token_permissions
+from backend.utils.slow_query_log import (
+    get_slow_queries, clear_slow_queries,
+    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+)
 import logging
 
 # 獲取 logger
@@ -40,33 +45,14 @@ def after_request(response):
 def get_admin_id():
     """获取管理员ID"""
     logger.debug("當前 session: %s", dict(session))
-    logger.debug("Authorization 頭部: %s", request.headers.get('Authorization'))
     
-    # 首先尝试从 Authorization header 获取
-    auth_header = request.headers.get('Authorization')
-    if auth_header:
-        logger.debug("找到 Authorization 頭部: %s", auth_header)
-        # 支持 Bearer token 格式
-        if auth_header.startswith('Bearer '):
-            try:
-                admin_id = int(auth_header.split(' ')[1])
-                logger.debug("從 Bearer token 獲取到 admin_id: %s", admin_id)
-                # 将 admin_id 存入 session
-                session['admin_id'] = admin_id
-                return admin_id
-            except (IndexError, ValueError) as e:
-                logger.warning("Bearer token 格式無效: %s", str(e))
-        # 直接支持纯数字格式
-        else:
-            try:
-                admin_id = int(auth_header)
-                logger.debug("從純數字 Authorization 獲取到 admin_id: %s", admin_id)
-                session['admin_id'] = admin_id
-                return admin_id
-            except ValueError as e:
-                logger.warning("Authorization 頭部不是有效的數字: %s", str(e))
+    # 首先尝试从已驗證的 access token 获取（簽名已在 before_request 中驗證）
+    admin_id = get_token_admin_id()
+    if admin_id:
+        logger.debug("從 access token 獲取到 admin_id: %s", admin_id)
+        return admin_id
             
-    # 如果没有 Authorization header，尝试从 session 获取
+    # 如果没有有效的 token，尝试从 session 获取
     admin_id = session.get('admin_id')
     if admin_id:
         try:
@@ -89,8 +75,8 @@ def check_view_log_permission():
             logger.warning("No admin_id found in session or header")
             return False
         
-        # 直接從會話中獲取權限信息
-        permissions = session.get('permissions', {})
+        # 優先使用 token 中嵌入的權限，否則從會話中獲取
+        permissions = get_token_permissions() or session.get('permissions', {})
         is_active = True  # 假設管理員是活躍的，因為他們能夠登錄
         
         logger.debug("Admin %s permission check:", admin_id)
@@ -285,4 +271,26 @@ def get_log_stats():
         return jsonify({
             "status": "error",
             "message": str(e)
-        }), 500 
\ No newline at end of file
+        }), 500 
+@log_bp.route("/slow-queries", methods=['POST', 'OPTIONS'])
+@admin_required
+def get_slow_query_log():
+    """獲取當前 worker 記錄的慢查詢及其執行計劃"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('clear'):
+            clear_slow_queries()
+            return jsonify({"status": "success", "data": []})
+
+        return jsonify({
+            "status": "success",
+            "data": get_slow_queries(data.get('limit')),
+            "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+            "explain_sample_rate": SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+        })
+    except Exception as e:
+        logger.error("獲取慢查詢記錄時發生錯誤: %s", str(e))
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session
 from ..config.database import get_db_connection
+from ..utils.reorder_limit import reorder_limit_cache, find_recent_orders
 import psycopg2.extras
 from datetime import datetime, timedelta
 import logging
@@ -26,21 +27,14 @@ def check_recent_order():
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # 获取客户的重复下单限制天数
-            cursor.execute("""
-                SELECT reorder_limit_days FROM customers 
-                WHERE id = %s AND status = 'active'
-            """, (customer_id,))
-            
-            result = cursor.fetchone()
-            if not result:
+            # 客户的重复下单限制天数（进程内缓存）
+            limit_days = reorder_limit_cache.get(customer_id, cursor)
+            if limit_days is None:
                 return jsonify({
                     "status": "error",
                     "message": "找不到客户信息"
                 }), 404
             
-            limit_days = result[0] or 0
-            
             # 如果限制天数为0，表示无限制
             if limit_days <= 0:
                 return jsonify({
@@ -52,20 +46,9 @@ def check_recent_order():
                 })
             
             # 查询客户在限制日期内是否订购过该产品
-            cursor.execute("""
-                SELECT od.id 
-                FROM orders o
-                JOIN order_details od ON o.id = od.order_id
-                WHERE o.customer_id = %s
-                  AND od.product_id = %s
-                  AND (od.order_status IS NULL OR od.order_status NOT IN ('已取消'))
-                  AND o.created_at >= CURRENT_DATE - INTERVAL '%s DAY'
-                LIMIT 1
-            """, (customer_id, product_id, limit_days))
-            
-            recent_order = cursor.fetchone()
+            recent_orders = find_recent_orders(cursor, customer_id, [int(product_id)], limit_days)
             
-            if recent_order:
+            if recent_orders:
                 # 找到了最近的订单，不允许下单
                 logger.info("找到最近订单: 客户ID=%s, 产品ID=%s, 限制天数=%s", customer_id, product_id, limit_days)
                 return jsonify({
@@ -92,4 +75,67 @@ def check_recent_order():
         return jsonify({
             "status": "error",
             "message": str(e)
-        }), 500 
\ No newline at end of file
+        }), 500
+
+@order_check_bp.route('/orders/check-recent-batch', methods=['POST'])
+def check_recent_orders_batch():
+    """一次检查购物车中多个产品是否在限制天数内订购过"""
+    try:
+        data = request.json or {}
+        customer_id = data.get('customer_id')
+        product_ids = data.get('product_ids')
+        
+        if not customer_id or not isinstance(product_ids, list) or not product_ids:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数"
+            }), 400
+        
+        try:
+            product_ids = list(dict.fromkeys(int(product_id) for product_id in product_ids))
+        except (TypeError, ValueError):
+            return jsonify({
+                "status": "error",
+                "message": "产品ID无效"
+            }), 400
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            
+            limit_days = reorder_limit_cache.get(customer_id, cursor)
+            if limit_days is None:
+                return jsonify({
+                    "status": "error",
+                    "message": "找不到客户信息"
+                }), 404
+            
+            recent_orders = find_recent_orders(cursor, customer_id, product_ids, limit_days)
+            
+            results = {}
+            for product_id in product_ids:
+                if product_id in recent_orders:
+                    order_number, created_at = recent_orders[product_id]
+                    results[str(product_id)] = {
+                        "can_order": False,
+                        "last_order_number": order_number,
+                        "last_order_date": created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None,
+                        "message": f"您在{limit_days}天内已经订购过此产品"
+                    }
+                else:
+                    results[str(product_id)] = {"can_order": True}
+            
+            return jsonify({
+                "status": "success",
+                "data": {
+                    "limit_days": limit_days,
+                    "can_order": not recent_orders,
+                    "products": results
+                }
+            })
+            
+    except Exception as e:
+        logger.error("Error in check_recent_orders_batch: %s", str(e))
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
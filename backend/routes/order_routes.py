@@ -1,11 +1,26 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from backend.config.database import get_db_connection
 from datetime import datetime
 from backend.utils.email_utils import EmailSender
 import threading
 from backend.services.log_service import LogService
+from backend.utils.token_utils import get_token_admin_id, decode_token, USER_TYPE_ADMIN
+from backend.utils.order_events import order_event_broadcaster, RESET
+from backend.utils.line_notifier import notify_order_status
+from backend.utils.reorder_limit import reorder_limit_cache, find_recent_orders
+from backend.utils import order_idempotency
+from backend.utils.order_idempotency import IdempotencyConflict
+from backend.utils.query_inspector import query_budget
+from backend.services.order_summary_service import OrderSummaryService
+from backend.services.order_sync_service import OrderSyncService, InvalidSyncToken
+from backend.services.production_plan_service import ProductionPlanService, PRODUCTION_PLAN_COLUMNS
 from functools import wraps
 import requests
+import psycopg2.errors
+import psycopg2.extras
+import io
+import os
+import csv
 import json
 import logging
 
@@ -14,6 +29,15 @@ logger = logging.getLogger(__name__)
 
 order_bp = Blueprint('order', __name__, url_prefix='/api')
 
+# SSE 心跳間隔（秒），防止代理因連接空閒而斷開
+ORDER_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('ORDER_EVENTS_HEARTBEAT_SECONDS', 15))
+# 客戶端斷線後的重連間隔（毫秒）
+ORDER_EVENTS_RETRY_MS = int(os.getenv('ORDER_EVENTS_RETRY_MS', 5000))
+# 下單時重複下單檢查的 advisory lock 鍵
+REORDER_LIMIT_LOCK_KEY = 72450003
+# 生產計劃單次查詢的最大天數
+PRODUCTION_PLAN_MAX_DAYS = int(os.getenv('PRODUCTION_PLAN_MAX_DAYS', 366))
+
 # 通用的郵件發送函數
 def send_email_async(email_func, recipient_email, order_data):
     """異步發送郵件"""
@@ -47,6 +71,13 @@ ORDER_DETAIL_SQL = """
     GROUP BY o.order_number, o.created_at, o.updated_at, c.email
 """
 
+def replay_response(status_code, body):
+    """返回冪等鍵保存的響應"""
+    response = jsonify(body)
+    response.status_code = status_code
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
 # 通用的錯誤響應函數
 def error_response(message, status_code=400):
     """返回錯誤響應"""
@@ -168,8 +199,32 @@ def create_order():
         if not data or 'order_number' not in data or 'customer_id' not in data or 'products' not in data:
             return error_response('缺少必要參數')
 
+        # 客戶端重試時帶上相同的冪等鍵，直接返回第一次的結果
+        idempotency_key = request.headers.get(order_idempotency.IDEMPOTENCY_KEY_HEADER)
+        if idempotency_key is not None:
+            idempotency_key = idempotency_key.strip()
+            if not idempotency_key or len(idempotency_key) > order_idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+                return error_response('無效的冪等鍵')
+            req_hash = order_idempotency.request_hash(data)
+            try:
+                cached = order_idempotency.get_cached_response(customer_id, idempotency_key, req_hash)
+            except IdempotencyConflict as e:
+                return error_response(e.message, e.status_code)
+            if cached:
+                return replay_response(*cached)
+
         with get_db_connection() as conn:
             cursor = conn.cursor()
+
+            if idempotency_key:
+                try:
+                    stored = order_idempotency.claim(cursor, customer_id, idempotency_key, req_hash)
+                except IdempotencyConflict as e:
+                    conn.rollback()
+                    return error_response(e.message, e.status_code)
+                if stored:
+                    conn.rollback()
+                    return replay_response(*stored)
             
             # 檢查訂單編號是否已存在
             cursor.execute("""
@@ -179,23 +234,41 @@ def create_order():
             if cursor.fetchone():
                 return error_response('訂單編號已存在')
 
-            # 創建訂單
-            cursor.execute("""
-                INSERT INTO orders (
-                    order_number, customer_id,
-                    order_confirmed, order_shipped,
-                    created_at, updated_at
-                ) VALUES (
-                    %s, %s, false, false, NOW(), NOW()
-                ) RETURNING id
-            """, (
-                data['order_number'],
-                data['customer_id']
-            ))
+            # 服務端檢查重複下單限制；按客戶加事務級鎖，避免並發下單同時通過檢查
+            limit_days = reorder_limit_cache.get(data['customer_id'], cursor)
+            if limit_days:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                               (REORDER_LIMIT_LOCK_KEY, int(data['customer_id'])))
+                product_ids = [int(product['product_id']) for product in data['products']]
+                recent_orders = find_recent_orders(cursor, data['customer_id'], product_ids, limit_days)
+                if recent_orders:
+                    cursor.execute("SELECT id, name FROM products WHERE id = ANY(%s)", (list(recent_orders),))
+                    names = [name for _, name in sorted(cursor.fetchall())]
+                    conn.rollback()
+                    return error_response(f"您在{limit_days}天內已經訂購過: {', '.join(names)}")
+
+            # 創建訂單；並發提交同一訂單編號時由唯一約束拒絕
+            try:
+                cursor.execute("""
+                    INSERT INTO orders (
+                        order_number, customer_id,
+                        order_confirmed, order_shipped,
+                        created_at, updated_at
+                    ) VALUES (
+                        %s, %s, false, false, NOW(), NOW()
+                    ) RETURNING id
+                """, (
+                    data['order_number'],
+                    data['customer_id']
+                ))
+            except psycopg2.errors.UniqueViolation:
+                conn.rollback()
+                return error_response('訂單編號已存在')
             
             order_id = cursor.fetchone()[0]
             
-            # 創建訂單項目
+            # 創建訂單項目；一條語句插入全部明細，訂單摘要等語句級觸發器只執行一次
+            detail_rows = []
             for product in data['products']:
                 # 確保數量是有效的數值
                 try:
@@ -203,15 +276,7 @@ def create_order():
                 except (ValueError, TypeError):
                     return error_response(f'產品 {product.get("product_id")} 的數量無效')
 
-                cursor.execute("""
-                    INSERT INTO order_details (
-                        order_id, product_id, product_quantity,
-                        product_unit, order_status, shipping_date,
-                        remark, supplier_note, created_at, updated_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
-                    )
-                """, (
+                detail_rows.append((
                     order_id,
                     product['product_id'],
                     product_quantity,
@@ -221,6 +286,15 @@ def create_order():
                     product.get('remark', ''),
                     product.get('supplier_note', ''),
                 ))
+
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO order_details (
+                    order_id, product_id, product_quantity,
+                    product_unit, order_status, shipping_date,
+                    remark, supplier_note, created_at, updated_at
+                ) VALUES %s
+            """, detail_rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())",
+                page_size=max(len(detail_rows), 1))
             
             # 獲取訂單詳細信息用於發送郵件
             cursor.execute(ORDER_DETAIL_SQL, (data['order_number'],))
@@ -283,7 +357,12 @@ def create_order():
                 user_type='客戶'
             )
             
+            response_body = {'status': 'success', 'message': '訂單創建成功'}
+            if idempotency_key:
+                order_idempotency.complete(cursor, customer_id, idempotency_key, order_id, 200, response_body)
             conn.commit()
+            if idempotency_key:
+                order_idempotency.remember(customer_id, idempotency_key, req_hash, 200, response_body)
             return success_response(message='訂單創建成功')
             
     except Exception as e:
@@ -299,6 +378,8 @@ def get_orders():
 
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            # 查詢前獲取同步令牌，之後的變更可通過 /orders/changes 增量獲取
+            sync_token = OrderSyncService(conn).current_token()
             
             # 查詢訂單和訂單詳情數據
             sql = """
@@ -354,12 +435,61 @@ def get_orders():
                     'supplier_note': row['supplier_note'] or ''
                 })
             
-            return success_response(data=list(orders.values()))
+            return jsonify({
+                'status': 'success',
+                'data': list(orders.values()),
+                'sync_token': sync_token
+            })
             
     except Exception as e:
         print(f"Error in get_orders: {str(e)}")
         return error_response(str(e), 500)
 
+@order_bp.route('/orders/summary', methods=['POST'])
+def get_order_summary():
+    """客戶訂單概況：各狀態的訂單數與最近訂單，讀取預先維護的摘要表"""
+    try:
+        data = request.json
+        if not data or 'customer_id' not in data:
+            return error_response('缺少客戶ID')
+
+        with get_db_connection() as conn:
+            summary = OrderSummaryService(conn).get_summary(data['customer_id'])
+            return success_response(data=summary)
+
+    except Exception as e:
+        print(f"Error in get_order_summary: {str(e)}")
+        return error_response(str(e), 500)
+
+@order_bp.route('/orders/changes', methods=['POST'])
+def get_order_changes():
+    """訂單增量同步：返回同步令牌之後新增、修改或刪除的訂單行
+
+    請求帶 customer_id 時返回該客戶的變更（/orders/list 的商品格式），否則返回所有訂單的變更
+    （/orders/all 的行格式）。令牌來自 /orders/list、/orders/all 或上一次調用；
+    返回 reset 為 true 時令牌已過期，客戶端需全量重新加載。
+    """
+    try:
+        data = request.json
+        if not data or not data.get('since'):
+            return error_response('缺少同步令牌')
+
+        customer_id = data.get('customer_id')
+        # 所有客戶的變更只對管理員開放
+        if customer_id is None and not (session.get('admin_id') or get_token_admin_id()):
+            logger.warning("未登入或登入已過期")
+            return error_response("未登入或登入已過期", 401)
+
+        with get_db_connection() as conn:
+            result = OrderSyncService(conn).get_changes(data['since'], customer_id)
+            return jsonify({'status': 'success', 'data': result})
+
+    except InvalidSyncToken as e:
+        return error_response(str(e))
+    except Exception as e:
+        print(f"Error in get_order_changes: {str(e)}")
+        return error_response(str(e), 500)
+
 @order_bp.route('/orders/cancel', methods=['POST'])
 def cancel_order():
     try:
@@ -563,13 +693,8 @@ def update_order_status():
         # 驗證管理員身份
         admin_id = session.get('admin_id')
         if not admin_id:
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                try:
-                    admin_id = int(auth_header.split(' ')[1])
-                except (IndexError, ValueError):
-                    return error_response('未授權的訪問', 401)
-            else:
+            admin_id = get_token_admin_id()
+            if not admin_id:
                 return error_response('未授權的訪問', 401)
 
         detail_id = data.get('order_id')
@@ -840,11 +965,85 @@ def get_pending_orders():
             'message': str(e)
         }), 500
 
+def _stream_admin_id():
+    """SSE 連接的管理員身份：EventSource 不能設置 header，額外支持 access_token 查詢參數"""
+    admin_id = get_token_admin_id() or session.get('admin_id')
+    if admin_id:
+        return admin_id
+    token = request.args.get('access_token')
+    if not token:
+        return None
+    try:
+        claims = decode_token(token)
+    except Exception as e:
+        logger.warning("訂單推送 access token 無效: %s", str(e))
+        return None
+    if claims.get('utp') != USER_TYPE_ADMIN:
+        return None
+    return claims.get('sub')
+
+def _sse_message(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+@order_bp.route('/orders/stream', methods=['GET'])
+def stream_order_changes():
+    """訂單變更的 SSE 推送
+
+    每條事件為一個訂單行的最新內容（字段與 /orders/pending 一致），deleted 為 true 時表示該行已刪除。
+    事件的 id 是續傳游標（與 sync_token 格式相同），斷線重連時瀏覽器自動帶上 Last-Event-ID，
+    服務端補發之後的事件；同一事件可能重複送出，客戶端按數據中的 id 忽略。
+    收到 reset 事件時客戶端應重新加載完整列表。
+    """
+    if not _stream_admin_id():
+        return error_response('請先登入', 401)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        since_txid = OrderSyncService.parse_token(last_event_id) if last_event_id else None
+    except InvalidSyncToken:
+        return error_response('無效的 Last-Event-ID')
+
+    try:
+        subscription, backlog = order_event_broadcaster.subscribe(since_txid)
+    except Exception as e:
+        logger.error("訂閱訂單變更失敗: %s", str(e))
+        return error_response(str(e), 500)
+
+    def generate():
+        try:
+            yield f"retry: {ORDER_EVENTS_RETRY_MS}\n\n"
+            pending = list(backlog)
+            while True:
+                event = pending.pop(0) if pending else subscription.get(ORDER_EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                elif event is RESET:
+                    # 帶上當前游標，重連時不再補發已由重新加載覆蓋的事件
+                    yield _sse_message('reset', {'message': '事件過多，請重新加載訂單列表'},
+                                       subscription.reset_token)
+                    return
+                else:
+                    yield _sse_message('order_change', event, event['sync_token'])
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 關閉 nginx 的響應緩衝，事件立即送達
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @order_bp.route('/orders/all', methods=['POST'])
 def get_all_orders():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            sync_token = OrderSyncService(conn).current_token()
             
             # 查詢所有訂單
             sql = """
@@ -885,7 +1084,8 @@ def get_all_orders():
             
             return jsonify({
                 'status': 'success',
-                'data': results
+                'data': results,
+                'sync_token': sync_token
             })
             
     except Exception as e:
@@ -895,6 +1095,75 @@ def get_all_orders():
             'message': str(e)
         }), 500
 
+@order_bp.route('/orders/production-plan', methods=['GET'])
+@admin_required
+def get_production_plan():
+    """生產計劃：已確認與已出貨的訂單明細按出貨日、商品、單位匯總的數量
+
+    查詢參數：start_date、end_date（YYYY-MM-DD，含首尾），可選 product_id，
+    format 為 csv 或 json（默認）。結果從預先維護的匯總表讀取，序列化時流式輸出。
+    """
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return error_response('請提供有效的 start_date 與 end_date（YYYY-MM-DD）')
+    if end_date < start_date:
+        return error_response('結束日期不能早於起始日期')
+    if (end_date - start_date).days >= PRODUCTION_PLAN_MAX_DAYS:
+        return error_response(f'查詢範圍不能超過 {PRODUCTION_PLAN_MAX_DAYS} 天')
+
+    product_id = request.args.get('product_id')
+    if product_id:
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            return error_response('無效的產品ID')
+    else:
+        product_id = None
+
+    output_format = request.args.get('format', 'json').lower()
+    if output_format not in ('csv', 'json'):
+        return error_response('format 只支持 csv 或 json')
+
+    # 查詢範圍受 PRODUCTION_PLAN_MAX_DAYS 限制，結果較小：在請求內讀完並歸還連接，只流式輸出序列化結果
+    try:
+        with get_db_connection() as conn:
+            rows = list(ProductionPlanService(conn).iter_rows(start_date, end_date, product_id))
+    except Exception as e:
+        logger.error("查詢生產計劃失敗: %s", str(e))
+        return error_response(str(e), 500)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # 加 BOM 讓 Excel 以 UTF-8 打開中文
+        buffer.write('\ufeff')
+        writer.writerow(PRODUCTION_PLAN_COLUMNS)
+        for row in rows:
+            writer.writerow([row[column] for column in PRODUCTION_PLAN_COLUMNS])
+            if buffer.tell() >= 8192:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_json():
+        yield '{"status": "success", "data": ['
+        first = True
+        for row in rows:
+            yield ('' if first else ',') + json.dumps(row, ensure_ascii=False)
+            first = False
+        yield ']}'
+
+    if output_format == 'csv':
+        filename = f"production_plan_{start_date:%Y%m%d}_{end_date:%Y%m%d}.csv"
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv; charset=utf-8')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    else:
+        response = Response(stream_with_context(generate_json()), mimetype='application/json')
+    return response
+
 @order_bp.route('/orders/update-confirmed', methods=['POST'])
 def update_order_confirmed():
     try:
@@ -934,6 +1203,7 @@ def update_order_confirmed():
                 return error_response('訂單更新失敗', 400)
 
             conn.commit()
+            notify_order_status(data['order_number'])
 
             # 準備郵件數據
             email_data = {
@@ -1040,6 +1310,7 @@ def update_order_shipped():
                     ).start()
 
                 conn.commit()
+                notify_order_status(data['order_number'])
                 
                 return jsonify({
                     'status': 'success',
@@ -1340,6 +1611,7 @@ def delete_order(order_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @order_bp.route('/orders/batch-update-status', methods=['POST'])
+@query_budget(25)
 def batch_update_order_status():
     """批量更新多个订单产品的状态"""
     try:
@@ -1349,13 +1621,8 @@ def batch_update_order_status():
         # 验证管理员身份
         admin_id = session.get('admin_id')
         if not admin_id:
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                try:
-                    admin_id = int(auth_header.split(' ')[1])
-                except (IndexError, ValueError):
-                    return error_response('未授權的訪問', 401)
-            else:
+            admin_id = get_token_admin_id()
+            if not admin_id:
                 return error_response('未授權的訪問', 401)
 
         order_number = data.get('order_number')
@@ -1378,18 +1645,11 @@ def batch_update_order_status():
             # 收集所有产品变更信息用于日志记录
             all_product_changes = []
             
-            # 处理每个产品的状态更新
-            for product in products:
-                detail_id = product.get('detail_id')
-                status = product.get('status')
-                shipping_date = product.get('shipping_date')
-                supplier_note = product.get('supplier_note', '')
-                quantity = product.get('quantity')
-                
-                if not detail_id or not status:
-                    continue  # 跳过无效的产品数据
-                    
-                # 获取原始订单产品信息用于日志记录
+            # 一次获取所有待更新产品的原始信息用于日志记录
+            detail_ids = [product.get('detail_id') for product in products
+                          if product.get('detail_id') and product.get('status')]
+            original_products = {}
+            if detail_ids:
                 cursor.execute("""
                     SELECT 
                         od.id,
@@ -1401,10 +1661,22 @@ def batch_update_order_status():
                         p.name as product_name
                     FROM order_details od
                     JOIN products p ON od.product_id = p.id
-                    WHERE od.id = %s
-                """, (detail_id,))
+                    WHERE od.id = ANY(%s)
+                """, ([int(detail_id) for detail_id in detail_ids],))
+                original_products = {row[0]: row for row in cursor.fetchall()}
+            
+            # 处理每个产品的状态更新
+            for product in products:
+                detail_id = product.get('detail_id')
+                status = product.get('status')
+                shipping_date = product.get('shipping_date')
+                supplier_note = product.get('supplier_note', '')
+                quantity = product.get('quantity')
                 
-                result = cursor.fetchone()
+                if not detail_id or not status:
+                    continue  # 跳过无效的产品数据
+                    
+                result = original_products.get(int(detail_id))
                 if not result:
                     continue  # 跳过不存在的产品
                     
@@ -1513,6 +1785,8 @@ def batch_update_order_status():
                 )
             
             conn.commit()
+            if any('status' in product['changes'] for product in all_product_changes):
+                notify_order_status(order_number)
             return success_response(message='批量更新訂單成功')
             
     except Exception as e:
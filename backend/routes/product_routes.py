@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app, abort, session, make_response, redirect
+from flask import Blueprint, request, jsonify, send_from_directory, current_app, abort, session, redirect, Response
 from backend.config.database import get_db_connection
 from backend.utils.file_handlers import (
     create_product_folder, 
@@ -7,28 +7,65 @@ from backend.utils.file_handlers import (
     UPLOAD_FOLDER,
     save_file,
     delete_file,
-    get_product_files,
+    schedule_image_derivatives,
     USE_AZURE_STORAGE
 )
 from werkzeug.utils import secure_filename
 import os
 import uuid
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta
 from backend.services.product_service import ProductService
 from backend.services.log_service import LogService
 from backend.services.log_service_registry import LogServiceRegistry
+from backend.services.file_metadata_service import (
+    record_uploaded_file, lookup_original_filename, is_unique_stored_name, get_stored_name,
+    extract_original_filename, IMMUTABLE_CACHE_CONTROL
+)
 import json
 import time
 import shutil
 import urllib.parse
 from backend.utils.scheduler import run_clean_task_manually
 import logging
+import jwt
+from backend.utils.auth_utils import require_permission
+from backend.utils.token_utils import create_upload_ticket, decode_token
+from backend.utils.image_derivatives import enqueue_image_derivatives, build_srcset
+from backend.utils.locked_dates_cache import locked_dates_cache
+from backend.utils.query_inspector import query_budget
+from backend.utils.file_cleanup import (
+    schedule_file_deletion,
+    schedule_folder_deletion,
+    schedule_replaced_files_deletion
+)
+from backend.utils.azure_storage import (
+    container_name,
+    generate_upload_sas_url,
+    get_blob_properties,
+    get_blob_service_client,
+    get_content_type_from_filename,
+    set_blob_content_type,
+    AZURE_MAX_BLOCK_SIZE,
+    AZURE_UPLOAD_MAX_CONCURRENCY
+)
 
 logger = logging.getLogger(__name__)
 
 product_bp = Blueprint('product', __name__)
 
+# Azure 文件下載默認經應用流式轉發；設為 true 時改為重定向到短時效 SAS URL
+AZURE_BLOB_DOWNLOAD_REDIRECT = os.getenv('AZURE_BLOB_DOWNLOAD_REDIRECT', 'false').lower() == 'true'
+AZURE_BLOB_SAS_EXPIRY_MINUTES = int(os.getenv('AZURE_BLOB_SAS_EXPIRY_MINUTES', 5))
+
+# 瀏覽器直傳：不小於此大小的文件改為直傳 Blob，小文件仍經應用上傳
+DIRECT_UPLOAD_MIN_SIZE = int(os.getenv('DIRECT_UPLOAD_MIN_SIZE', 8 * 1024 * 1024))
+DIRECT_UPLOAD_MAX_SIZE = int(os.getenv('DIRECT_UPLOAD_MAX_SIZE', 200 * 1024 * 1024))
+DIRECT_UPLOAD_SAS_EXPIRY_MINUTES = int(os.getenv('DIRECT_UPLOAD_SAS_EXPIRY_MINUTES', 15))
+
+# 批量鎖定日期一次最多處理的天數
+BULK_LOCK_MAX_DAYS = int(os.getenv('BULK_LOCK_MAX_DAYS', 366))
+
 # 上传文件夹配置
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'uploads')
 
@@ -43,52 +80,8 @@ def create_dual_filename(original_filename):
     safe_part = f"{uuid.uuid4()}"
     return f"{safe_part}___{encoded_original}{file_ext}"
 
-def extract_original_filename(dual_filename):
-    """从双轨文件名中提取原始文件名"""
-    try:
-        # 分离文件名和扩展名
-        file_name, file_ext = os.path.splitext(dual_filename)
-        # 分离UUID和编码部分
-        parts = file_name.split('___')
-        if len(parts) > 1:
-            # 解码原始文件名
-            original_name = base64.urlsafe_b64decode(parts[1].encode()).decode()
-            return f"{original_name}{file_ext}"
-        return dual_filename
-    except:
-        return dual_filename  # 如果解析失败，返回原文件名
-
-def remove_product_folder(product_folder):
-    """删除产品相关的上传文件夹
-    
-    Args:
-        product_folder: 产品名称或文件夹名称
-    
-    Returns:
-        bool: 是否成功删除
-    """
-    try:
-        # 安全起见，检查文件夹名称合法性
-        folder_name = secure_filename(product_folder)
-        if not folder_name:
-            logger.warning("产品文件夹名称无效")
-            return False
-            
-        # 检查该名称的文件夹是否存在
-        folder_path = os.path.join(UPLOAD_FOLDER, folder_name)
-        if os.path.exists(folder_path) and os.path.isdir(folder_path):
-            # 删除文件夹及其内容
-            shutil.rmtree(folder_path)
-            logger.info(f"已删除产品文件夹: {folder_path}")
-            return True
-        else:
-            logger.warning(f"产品文件夹不存在: {folder_path}")
-            return False
-    except Exception as e:
-        logger.error(f"删除产品文件夹时出错: {str(e)}")
-        return False
-
 @product_bp.route('/products/list', methods=['POST'])
+@query_budget(3)
 def get_products():
     try:
         # 獲取請求數據
@@ -158,26 +151,19 @@ def get_products():
             # 目前ProductService中没有专门针对客户的方法，所以使用通用方法
             products = product_service.get_product_list(limit=100, offset=0)
             
-            # 處理每個產品的文件URL，確保包含原始文件名
-            cursor = conn.cursor()
+            # 處理每個產品的文件URL，確保包含原始文件名（已隨列表查詢一併取出）
             for product in products:
-                if product.get('id'):
-                    # 直接從資料庫中獲取原始文件名
-                    cursor.execute("""
-                        SELECT image_original_filename, dm_original_filename 
-                        FROM products 
-                        WHERE id = %s
-                    """, (product['id'],))
-                    
-                    result = cursor.fetchone()
-                    if result:
-                        if result[0]:  # 圖片原始文件名
-                            product['original_image_filename'] = result[0]
-                            product['image_original_filename'] = result[0]
-                        
-                        if result[1]:  # 文檔原始文件名
-                            product['original_dm_filename'] = result[1]
-                            product['dm_original_filename'] = result[1]
+                if product.get('image_original_filename'):
+                    product['original_image_filename'] = product['image_original_filename']
+                if product.get('dm_original_filename'):
+                    product['original_dm_filename'] = product['dm_original_filename']
+                
+                # 衍生圖尚未生成或舊產品沒有衍生圖時，前端使用 image_url 原圖
+                variants = product.get('image_variants')
+                product['image_srcset'] = {
+                    'webp': build_srcset(variants, 'webp'),
+                    'jpeg': build_srcset(variants, 'jpeg')
+                } if variants else None
                 
                 # 如果數據庫中沒有原始文件名，嘗試從文件名中提取
                 if product.get('image_url') and not product.get('original_image_filename'):
@@ -694,39 +680,16 @@ def delete_product(product_id):
             if not product_folder and product.get('name'):
                 product_folder = product.get('name')
             
-            # 嘗試刪除uploads文件夾
+            # 產品文件（本地文件夾或 Azure 前綴下的 blob）在同一事務中登記，由調度任務批量刪除
             if product_folder:
                 try:
-                    logger.info(f"嘗試刪除產品文件夾: {product_folder}")
-                    # 使用產品名稱作為文件夾名稱
-                    folder_name = secure_filename(product_folder)
-                    
-                    if USE_AZURE_STORAGE:
-                        # 對於Azure存儲，需要列出並刪除所有blob
-                        from backend.utils.azure_storage import list_product_files
-                        product_files = list_product_files(folder_name)
-                        if product_files:
-                            logger.info(f"找到Azure存儲中的{len(product_files)}個文件需要刪除")
-                            for file_info in product_files:
-                                try:
-                                    # 從文件URL中提取blob路徑
-                                    blob_name = file_info.get('name')
-                                    if blob_name:
-                                        logger.info(f"刪除Azure blob: {blob_name}")
-                                        delete_file(blob_name, product_name=product_folder)
-                                except Exception as e:
-                                    logger.error(f"刪除Azure blob時出錯: {str(e)}")
-                            logger.info("已刪除所有產品相關的Azure存儲文件")
-                        else:
-                            logger.warning(f"Azure存儲中找不到產品文件夾: {folder_name}")
-                    else:
-                        # 本地存儲刪除
-                        delete_folder_result = remove_product_folder(folder_name)
-                        logger.info(f"刪除產品文件夾結果: {delete_folder_result}")
+                    count = schedule_folder_deletion(product_folder, conn)
+                    logger.info(f"已登記刪除產品文件夾: {product_folder}（{count} 個文件）")
                 except Exception as e:
-                    logger.error(f"刪除產品文件夾時出錯: {str(e)}")
-            
-            # 刪除產品（軟刪除或硬刪除）
+                    logger.error(f"登記刪除產品文件夾時出錯: {str(e)}")
+                    conn.rollback()
+
+            # 刪除產品（軟刪除或硬刪除），提交時一併提交刪除登記
             result = product_service.delete_product(product_id, soft_delete=soft_delete)
             logger.info(f"刪除產品結果: {result}")
             
@@ -793,15 +756,6 @@ def upload_image():
             
             if USE_AZURE_STORAGE:
                 # 使用Azure Blob存儲
-                # 刪除之前的圖片
-                existing_files = get_product_files(product_name, is_image=True)
-                for existing_file in existing_files:
-                    try:
-                        delete_file(existing_file['name'])
-                        logger.info(f"已刪除舊圖片文件: {existing_file['filename']}")
-                    except Exception as e:
-                        logger.error(f"刪除舊圖片時出錯: {str(e)}")
-                
                 # 保存新上傳的文件到Azure
                 logger.info(f"開始上傳圖片到Azure，產品名: {product_name}")
                 file_path = save_file(file, product_name, is_image=True)
@@ -813,6 +767,9 @@ def upload_image():
                     }), 500
                 
                 logger.info(f"圖片上傳成功，Azure路徑: {file_path}，原始文件名: {original_filename}")
+                record_uploaded_file(file_path, original_filename, 'image', product_name)
+                # 之前的圖片由調度任務在後台刪除
+                schedule_replaced_files_deletion(product_name, True, get_stored_name(file_path))
                 return jsonify({
                     'status': 'success',
                     'data': {
@@ -825,24 +782,18 @@ def upload_image():
                 product_folder = create_product_folder(product_name)
                 filepath = os.path.join(product_folder, safe_filename)
                 
-                # 删除文件夹中所有现有的图片文件
-                image_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.webp']
-                for existing_file in os.listdir(product_folder):
-                    file_ext = os.path.splitext(existing_file)[1].lower()
-                    if file_ext in image_extensions:
-                        try:
-                            os.remove(os.path.join(product_folder, existing_file))
-                            logger.info(f"已刪除舊圖片文件: {existing_file}")
-                        except Exception as e:
-                            logger.error(f"刪除舊圖片時出錯: {str(e)}")
-                
                 # 保存新上传的文件
                 file.save(filepath)
                 
+                # 文件夹中之前的图片由调度任务在后台删除
+                schedule_replaced_files_deletion(product_name, True, safe_filename)
+                
                 # 确保返回的路径包含安全文件名（用于存储）
                 relative_path = os.path.join('uploads', secure_filename(product_name), safe_filename)
+                schedule_image_derivatives(file, f'/{relative_path.replace(os.sep, "/")}', filepath)
                 
                 logger.info(f"圖片上傳成功，完整路徑: {relative_path}，原始文件名: {original_filename}")
+                record_uploaded_file(f'/{relative_path.replace(os.sep, "/")}', original_filename, 'image', product_name)
                 return jsonify({
                     'status': 'success',
                     'data': {
@@ -895,20 +846,6 @@ def upload_document():
             
             if USE_AZURE_STORAGE:
                 # 使用Azure Blob存儲
-                # 刪除產品之前的DM文件，確保更新產品時能正確刪除舊文件
-                existing_files = get_product_files(product_name, is_image=False)
-                delete_count = 0
-                for existing_file in existing_files:
-                    try:
-                        result = delete_file(existing_file['name'], product_name=product_name, is_image=False)
-                        if result:
-                            delete_count += 1
-                            logger.info(f"已刪除舊DM文件: {existing_file['filename']}")
-                    except Exception as e:
-                        logger.error(f"刪除舊DM文件時出錯: {str(e)}")
-                
-                logger.info(f"已刪除 {delete_count} 個舊DM文件")
-                
                 # 保存新上傳的文件到Azure
                 file_path = save_file(file, product_name, is_image=False)
                 
@@ -919,6 +856,9 @@ def upload_document():
                     }), 500
                 
                 logger.info(f"文檔上傳成功，Azure路徑: {file_path}，原始文件名: {original_filename}")
+                record_uploaded_file(file_path, original_filename, 'document', product_name)
+                # 產品之前的DM文件由調度任務在後台刪除
+                schedule_replaced_files_deletion(product_name, False, get_stored_name(file_path))
                 return jsonify({
                     'status': 'success',
                     'data': {
@@ -931,28 +871,17 @@ def upload_document():
                 product_folder = create_product_folder(product_name)
                 filepath = os.path.join(product_folder, safe_filename)
                 
-                # 刪除現有的文檔文件（與圖片處理類似）
-                doc_extensions = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt']
-                delete_count = 0
-                for existing_file in os.listdir(product_folder):
-                    file_ext = os.path.splitext(existing_file)[1].lower()
-                    if file_ext in doc_extensions:
-                        try:
-                            os.remove(os.path.join(product_folder, existing_file))
-                            delete_count += 1
-                            logger.info(f"已刪除舊文檔文件: {existing_file}")
-                        except Exception as e:
-                            logger.error(f"刪除舊文檔文件時出錯: {str(e)}")
-                            
-                logger.info(f"已刪除 {delete_count} 個舊文檔文件")
-                            
                 # 保存新上傳的文件
                 file.save(filepath)
                 
+                # 現有的文檔文件由調度任務在後台刪除（與圖片處理類似）
+                schedule_replaced_files_deletion(product_name, False, safe_filename)
+                
                 # 返回相对路径
                 relative_path = os.path.join('uploads', secure_filename(product_name), safe_filename)
                 
                 logger.info(f"文件上傳成功，完整路徑: {relative_path}，原始文件名: {original_filename}")
+                record_uploaded_file(f'/{relative_path.replace(os.sep, "/")}', original_filename, 'document', product_name)
                 return jsonify({
                     'status': 'success',
                     'data': {
@@ -972,65 +901,168 @@ def upload_document():
             'message': str(e)
         }), 500
 
+@product_bp.route('/upload/sas', methods=['POST'])
+@require_permission('can_add_product')
+def request_direct_upload():
+    """申請瀏覽器直傳 Azure Blob 的短時效寫入 SAS
+
+    小於 DIRECT_UPLOAD_MIN_SIZE 的文件或未使用 Azure 存儲時返回 direct=False，
+    前端繼續使用 /upload/image、/upload/document。
+    """
+    try:
+        data = request.get_json() or {}
+        product_name = data.get('productName')
+        original_filename = data.get('filename')
+        file_type = data.get('fileType', 'document')
+        size = int(data.get('size') or 0)
+        
+        if not product_name or not original_filename or file_type not in ('image', 'document'):
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing product name, filename or file type'
+            }), 400
+        
+        is_image = file_type == 'image'
+        allowed = is_allowed_image(original_filename) if is_image else is_allowed_document(original_filename)
+        if not allowed:
+            return jsonify({
+                'status': 'error',
+                'message': f'不支持的文件類型: {original_filename}'
+            }), 400
+        
+        if size > DIRECT_UPLOAD_MAX_SIZE:
+            return jsonify({
+                'status': 'error',
+                'message': '文件過大'
+            }), 400
+        
+        if not USE_AZURE_STORAGE or size < DIRECT_UPLOAD_MIN_SIZE:
+            return jsonify({
+                'status': 'success',
+                'data': {'direct': False}
+            })
+        
+        # 與 upload_file_to_blob 相同的命名規則：產品名/安全處理後的雙軌文件名
+        blob_path = f"{secure_filename(product_name)}/{secure_filename(create_dual_filename(original_filename))}"
+        upload_url, blob_url = generate_upload_sas_url(blob_path, DIRECT_UPLOAD_SAS_EXPIRY_MINUTES)
+        ticket = create_upload_ticket(
+            blob_path, original_filename, file_type, product_name,
+            DIRECT_UPLOAD_SAS_EXPIRY_MINUTES * 60
+        )
+        
+        logger.info(f"簽發直傳SAS，產品名稱: {product_name}, blob: {blob_path}, 大小: {size}")
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'direct': True,
+                'upload_url': upload_url,
+                'blob_url': blob_url,
+                'content_type': get_content_type_from_filename(blob_path),
+                'upload_ticket': ticket,
+                'expires_in': DIRECT_UPLOAD_SAS_EXPIRY_MINUTES * 60,
+                'block_size': AZURE_MAX_BLOCK_SIZE,
+                'max_concurrency': AZURE_UPLOAD_MAX_CONCURRENCY
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error in request_direct_upload: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@product_bp.route('/upload/commit', methods=['POST'])
+@require_permission('can_add_product')
+def commit_direct_upload():
+    """確認直傳完成：校驗 blob、替換產品舊文件並記錄元數據"""
+    try:
+        data = request.get_json() or {}
+        ticket = data.get('uploadTicket')
+        if not ticket:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing upload ticket'
+            }), 400
+        
+        try:
+            claims = decode_token(ticket, expected_type='upload')
+        except jwt.InvalidTokenError as e:
+            logger.warning(f"直傳憑證無效: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': '上傳憑證無效或已過期'
+            }), 400
+        
+        blob_path = claims['blob']
+        original_filename = claims['ofn']
+        product_name = claims['prd']
+        is_image = claims['ftp'] == 'image'
+        
+        properties = get_blob_properties(container_name, blob_path)
+        if properties is None:
+            return jsonify({
+                'status': 'error',
+                'message': '文件尚未上傳完成'
+            }), 409
+        if properties.size > DIRECT_UPLOAD_MAX_SIZE:
+            schedule_file_deletion(blob_path)
+            return jsonify({
+                'status': 'error',
+                'message': '文件過大'
+            }), 400
+        
+        content_type = get_content_type_from_filename(blob_path)
+        if properties.content_settings.content_type != content_type:
+            set_blob_content_type(blob_path, content_type)
+        
+        blob_url = get_blob_service_client().get_blob_client(container=container_name, blob=blob_path).url
+        record_uploaded_file(blob_url, original_filename, 'image' if is_image else 'document', product_name)
+        if is_image:
+            enqueue_image_derivatives(None, blob_url)
+        # 與普通上傳一致：產品之前的同類文件由調度任務在後台刪除
+        schedule_replaced_files_deletion(product_name, is_image, os.path.basename(blob_path))
+        
+        logger.info(f"直傳上傳完成，Azure路徑: {blob_url}，原始文件名: {original_filename}，大小: {properties.size}")
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'file_path': blob_url,
+                'original_filename': original_filename
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error in commit_direct_upload: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @product_bp.route('/file/<path:filename>')
 def serve_product_file(filename):
     """处理产品相关文件的访问，支持显示原始文件名"""
+    # 分离目录和文件名
+    directory = os.path.dirname(filename)
+    basename = os.path.basename(filename)
+    response = send_from_directory(
+        os.path.join(UPLOAD_FOLDER, directory) if directory else UPLOAD_FOLDER,
+        basename
+    )
     try:
-        # 分离目录和文件名
-        directory = os.path.dirname(filename)
-        basename = os.path.basename(filename)
-        
-        # 尝试从数据库中获取原始文件名
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 尝试查找匹配的图片
-            cursor.execute("SELECT image_original_filename FROM products WHERE image_url LIKE %s", (f'%{basename}%',))
-            result = cursor.fetchone()
-            
-            if result and result[0]:
-                original_filename = result[0]
-                response = send_from_directory(
-                    os.path.join(UPLOAD_FOLDER, directory) if directory else UPLOAD_FOLDER,
-                    basename
-                )
-                response.headers["Content-Disposition"] = f"inline; filename=\"{original_filename}\""
-                logger.debug(f"从数据库获取图片原始文件名: {original_filename}")
-                return response
-                
-            # 尝试查找匹配的文档
-            cursor.execute("SELECT dm_original_filename FROM products WHERE dm_url LIKE %s", (f'%{basename}%',))
-            result = cursor.fetchone()
-            
-            if result and result[0]:
-                original_filename = result[0]
-                response = send_from_directory(
-                    os.path.join(UPLOAD_FOLDER, directory) if directory else UPLOAD_FOLDER,
-                    basename
-                )
-                response.headers["Content-Disposition"] = f"inline; filename=\"{original_filename}\""
-                logger.debug(f"从数据库获取文档原始文件名: {original_filename}")
-                return response
-                
-        # 如果数据库中没有找到，尝试从文件名中提取
-        original_filename = extract_original_filename(basename)
+        # 按存储文件名做索引等值查询（带进程内缓存），未记录时从文件名中提取
+        original_filename = lookup_original_filename(basename) or extract_original_filename(basename)
         
         if original_filename and original_filename != basename:
-            response = send_from_directory(
-                os.path.join(UPLOAD_FOLDER, directory) if directory else UPLOAD_FOLDER,
-                basename
-            )
-            response.headers["Content-Disposition"] = f"inline; filename=\"{original_filename}\""
-            logger.debug(f"从文件名提取原始文件名: {original_filename}")
-            return response
+            encoded_filename = urllib.parse.quote(original_filename)
+            response.headers["Content-Disposition"] = f"inline; filename=\"{encoded_filename}\"; filename*=UTF-8''{encoded_filename}"
+            logger.debug(f"原始文件名: {original_filename}")
+        
+        # 带 UUID 的存储文件名内容不会变化，允许长期缓存
+        if is_unique_stored_name(basename):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
     except Exception as e:
         logger.error(f"处理文件访问出错: {str(e)}")
     
-    # 默认返回
-    return send_from_directory(
-        os.path.join(UPLOAD_FOLDER, directory) if directory else UPLOAD_FOLDER,
-        basename
-    )
+    return response
 
 @product_bp.route('/products/viewable', methods=['POST'])
 def get_viewable_products():
@@ -1072,26 +1104,41 @@ def get_viewable_products():
             'message': str(e)
         }), 500
 
+def _parse_date_param(value):
+    """解析 YYYY-MM-DD 日期參數，未提供時返回 None"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _locked_dates_response(start, end):
+    """從緩存返回區間內的鎖定日期，帶 ETag，未變化時返回 304"""
+    version, dates = locked_dates_cache.get_range(start, end)
+    etag = f"ld{version}-{start or ''}-{end or ''}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            "status": "success",
+            "data": dates,
+            "version": version
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @product_bp.route('/products/locked-dates', methods=['POST'])
 def get_locked_dates():
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, locked_date, created_at
-                FROM locked_dates
-                ORDER BY locked_date ASC
-            """)
-            
-            columns = [desc[0] for desc in cursor.description]
-            dates = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
-            cursor.close()
-            
+        data = request.get_json(silent=True) or {}
+        try:
+            start = _parse_date_param(data.get('from'))
+            end = _parse_date_param(data.get('to'))
+        except ValueError:
             return jsonify({
-                "status": "success",
-                "data": dates
-            })
+                "status": "error",
+                "message": "日期格式應為 YYYY-MM-DD"
+            }), 400
+        return _locked_dates_response(start, end)
             
     except Exception as e:
         logger.error(f"Error in get_locked_dates: {str(e)}")
@@ -1100,6 +1147,27 @@ def get_locked_dates():
             "message": str(e)
         }), 500
 
+@product_bp.route('/products/locked-dates/range', methods=['GET'])
+def get_locked_dates_range():
+    """按區間查詢鎖定日期：?from=YYYY-MM-DD&to=YYYY-MM-DD，支持 If-None-Match"""
+    try:
+        try:
+            start = _parse_date_param(request.args.get('from'))
+            end = _parse_date_param(request.args.get('to'))
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "日期格式應為 YYYY-MM-DD"
+            }), 400
+        return _locked_dates_response(start, end)
+            
+    except Exception as e:
+        logger.error(f"Error in get_locked_dates_range: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
 @product_bp.route('/products/lock-date', methods=['POST'])
 def lock_date():
     try:
@@ -1142,6 +1210,7 @@ def lock_date():
             new_id = result[0]
             locked_date = result[1]
             conn.commit()
+            locked_dates_cache.invalidate()
             
             # 记录操作日誌
             try:
@@ -1237,6 +1306,7 @@ def unlock_date():
             """, (data['date_id'],))
             
             conn.commit()
+            locked_dates_cache.invalidate()
             
             # 记录操作日誌
             try:
@@ -1276,6 +1346,103 @@ def unlock_date():
             'message': str(e)
         }), 500
 
+@product_bp.route('/products/lock-dates/bulk', methods=['POST'])
+@require_permission('can_close_order_dates')
+def bulk_lock_dates():
+    """批量鎖定/解鎖日期（例如整段假期），在一個事務中完成
+
+    需要 can_close_order_dates 權限；請求體：action=lock|unlock，以及 from/to 區間或 dates 列表
+    """
+    try:
+        data = request.json or {}
+        action = data.get('action')
+        if action not in ('lock', 'unlock'):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid action'
+            }), 400
+        
+        try:
+            if data.get('dates'):
+                days = sorted({_parse_date_param(value) for value in data['dates']})
+            else:
+                start = _parse_date_param(data.get('from'))
+                end = _parse_date_param(data.get('to'))
+                if not start or not end or start > end:
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'Missing or invalid from/to parameters'
+                    }), 400
+                days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': '日期格式應為 YYYY-MM-DD'
+            }), 400
+        
+        if len(days) > BULK_LOCK_MAX_DAYS:
+            return jsonify({
+                'status': 'error',
+                'message': f'一次最多處理 {BULK_LOCK_MAX_DAYS} 天'
+            }), 400
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if action == 'lock':
+                # 已鎖定的日期跳過
+                cursor.execute("""
+                    INSERT INTO locked_dates (locked_date, created_at)
+                    SELECT d, CURRENT_TIMESTAMP
+                    FROM unnest(%s::date[]) AS d
+                    WHERE NOT EXISTS (SELECT 1 FROM locked_dates ld WHERE ld.locked_date = d)
+                    RETURNING id, locked_date
+                """, (days,))
+            else:
+                cursor.execute("""
+                    DELETE FROM locked_dates
+                    WHERE locked_date = ANY(%s::date[])
+                    RETURNING id, locked_date
+                """, (days,))
+            changed = cursor.fetchall()
+            conn.commit()
+            locked_dates_cache.invalidate()
+            
+            changed_dates = [row[1].strftime('%Y-%m-%d') for row in changed]
+            
+            # 记录操作日誌
+            try:
+                admin_id = get_admin_id_from_session()
+                if admin_id and changed:
+                    summary = {'locked_dates': changed_dates, 'record_type': '锁定日期'}
+                    log_service = LogServiceRegistry.get_service(conn, 'products')
+                    log_service.log_operation(
+                        table_name='products',
+                        operation_type='新增' if action == 'lock' else '刪除',
+                        record_id=changed[0][0],
+                        old_data=None if action == 'lock' else summary,
+                        new_data=summary if action == 'lock' else None,
+                        performed_by=admin_id,
+                        user_type='管理員'
+                    )
+            except Exception as log_error:
+                logger.error(f"記錄批量鎖定日期日誌時出錯: {str(log_error)}")
+            
+            cursor.close()
+            
+            logger.info(f"批量{'鎖定' if action == 'lock' else '解鎖'}日期 {len(changed)} 個")
+            return jsonify({
+                'status': 'success',
+                'message': f"已{'鎖定' if action == 'lock' else '解鎖'} {len(changed)} 個日期",
+                'data': changed_dates
+            })
+            
+    except Exception as e:
+        logger.error(f"Error in bulk_lock_dates: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @product_bp.route('/products/clean-expired-dates', methods=['POST'])
 def clean_expired_dates_route():
     """手动触发清理过期锁定日期的API"""
@@ -1437,69 +1604,103 @@ def download_azure_blob():
         
         logger.info(f"解析後的容器: {container}, Blob路徑: {blob_path}")
         
-        # 連接到Azure服務
-        from backend.utils.azure_storage import get_blob_service_client
+        # 根據文件類型設定正確的Content-Type
+        content_type = 'application/octet-stream'
+        disposition = 'attachment'  # 默認為下載
+        if original_filename.lower().endswith('.pdf'):
+            content_type = 'application/pdf'
+            disposition = 'inline'  # PDF使用inline在瀏覽器中預覽
+        elif original_filename.lower().endswith(('.doc', '.docx')):
+            content_type = 'application/msword'
+        elif original_filename.lower().endswith(('.jpg', '.jpeg')):
+            content_type = 'image/jpeg'
+            disposition = 'inline'
+        elif original_filename.lower().endswith('.png'):
+            content_type = 'image/png'
+            disposition = 'inline'
+        
+        # 針對非ASCII字符的文件名進行處理
+        # 使用RFC 5987編碼方式以支持UTF-8文件名，對所有文件類型都適用
+        ascii_filename = original_filename.encode('ascii', 'ignore').decode()
+        encoded_filename = quote(original_filename)
+        content_disposition = f'{disposition}; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
+        
+        from backend.utils.azure_storage import generate_sas_url, get_blob_properties, iter_blob_chunks
         
         try:
-            client = get_blob_service_client()
-            blob_client = client.get_blob_client(container=container, blob=blob_path)
-            
-            # 檢查blob是否存在
-            if not blob_client.exists():
+            # SAS 重定向模式：由瀏覽器直接從 Blob 下載，不佔用應用 worker
+            if AZURE_BLOB_DOWNLOAD_REDIRECT or request.args.get('redirect') == '1':
+                try:
+                    sas_url = generate_sas_url(
+                        blob_path,
+                        container=container,
+                        expiry_minutes=AZURE_BLOB_SAS_EXPIRY_MINUTES,
+                        content_disposition=content_disposition,
+                        content_type=content_type
+                    )
+                    return redirect(sas_url)
+                except Exception as sas_error:
+                    # 例如使用 SAS 連接字符串時沒有帳戶密鑰，退回到流式下載
+                    logger.warning(f"生成SAS URL失敗，改為流式下載: {str(sas_error)}")
+            
+            # 一次請求獲取大小、ETag 與最後修改時間，同時判斷是否存在
+            properties = get_blob_properties(container, blob_path)
+            if properties is None:
                 logger.warning(f"文件不存在，嘗試使用未進行URL編碼的路徑")
-                # 嘗試使用未進行URL編碼的路徑
                 blob_path = unquote(blob_path)
-                blob_client = client.get_blob_client(container=container, blob=blob_path)
-                
-                if not blob_client.exists():
+                properties = get_blob_properties(container, blob_path)
+                if properties is None:
                     logger.warning(f"blob不存在: {container}/{blob_path}")
                     return jsonify({
                         'status': 'error',
                         'message': 'File not found'
                     }), 404
             
-            # 獲取Blob數據
-            logger.info(f"開始下載blob: {container}/{blob_path}")
-            blob_data = blob_client.download_blob()
+            etag = properties.etag.strip('"')
+            last_modified = properties.last_modified.replace(microsecond=0)
+            size = properties.size
             
-            # 創建響應
-            response = make_response(blob_data.readall())
+            # 條件請求：ETag 優先於 If-Modified-Since
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since:
+                not_modified = last_modified <= request.if_modified_since
             
-            # 設置Content-Type和Content-Disposition標頭
-            content_type = 'application/octet-stream'
-            disposition = 'attachment'  # 默認為下載
-            
-            # 根據文件類型設定正確的Content-Type
-            if original_filename.lower().endswith('.pdf'):
-                content_type = 'application/pdf'
-                disposition = 'inline'  # PDF使用inline在瀏覽器中預覽
-            elif original_filename.lower().endswith(('.doc', '.docx')):
-                content_type = 'application/msword'
-            elif original_filename.lower().endswith(('.jpg', '.jpeg')):
-                content_type = 'image/jpeg'
-                disposition = 'inline'
-            elif original_filename.lower().endswith('.png'):
-                content_type = 'image/png'
-                disposition = 'inline'
-            
-            logger.debug(f"文件類型: {content_type}, 處理方式: {disposition}")
-            
-            # 針對非ASCII字符的文件名進行處理
-            # 使用RFC 5987編碼方式以支持UTF-8文件名，對所有文件類型都適用
-            ascii_filename = original_filename.encode('ascii', 'ignore').decode()
-            encoded_filename = quote(original_filename)
-            
-            # 不管是inline還是attachment，都設置filename*參數確保原始檔名可用
-            if disposition == 'inline':
-                # 預覽模式 - 確保下載時也有正確檔名
-                response.headers['Content-Disposition'] = f'inline; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
+            if not_modified:
+                response = Response(status=304)
             else:
-                # 下載模式
-                response.headers['Content-Disposition'] = f'attachment; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename}'
-            
-            response.headers['Content-Type'] = content_type
+                # Range 請求：只支持單段範圍；If-Range 不匹配時返回完整文件
+                byte_range = None
+                if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1:
+                    if_range = request.if_range
+                    if (not if_range.etag and not if_range.date) \
+                            or if_range.etag == etag \
+                            or (if_range.date and last_modified <= if_range.date):
+                        byte_range = request.range.range_for_length(size)
+                        if byte_range is None:
+                            response = Response(status=416)
+                            response.headers['Content-Range'] = f'bytes */{size}'
+                            return response
+                
+                if byte_range:
+                    start, stop = byte_range
+                    body = iter_blob_chunks(container, blob_path, offset=start, length=stop - start, etag=properties.etag)
+                    response = Response(body, status=206, mimetype=content_type, direct_passthrough=True)
+                    response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+                    response.content_length = stop - start
+                else:
+                    body = iter_blob_chunks(container, blob_path, etag=properties.etag) if size else iter(())
+                    response = Response(body, mimetype=content_type, direct_passthrough=True)
+                    response.content_length = size
+                
+                response.headers['Content-Type'] = content_type
+                response.headers['Content-Disposition'] = content_disposition
+                response.headers['Accept-Ranges'] = 'bytes'
             
-            logger.debug(f"文件下載響應頭: {response.headers}")
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            logger.debug(f"文件下載響應: {container}/{blob_path}, 狀態: {response.status_code}")
             return response
             
         except Exception as blob_error:
@@ -0,0 +1,138 @@
+import os
+import re
+import base64
+import logging
+from typing import Optional
+from urllib.parse import urlparse, unquote
+from backend.config.database import get_db_connection
+from backend.utils.lru_cache import LRUCache
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 存儲文件名到原始文件名的緩存；存儲文件名含 UUID，映射寫入後不會改變，因此不設過期
+FILE_METADATA_CACHE_SIZE = int(os.getenv('FILE_METADATA_CACHE_SIZE', 4096))
+_original_filename_cache = LRUCache(maxsize=FILE_METADATA_CACHE_SIZE)
+# 未記錄的文件名以空字符串短期緩存，避免舊文件反復查庫；本進程上傳時會直接覆蓋
+FILE_METADATA_MISS_TTL = int(os.getenv('FILE_METADATA_MISS_TTL', 60))
+
+# 帶 UUID 的存儲文件名內容不變，可讓瀏覽器與 CDN 緩存一年
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 雙軌文件名：uuid___base64名稱.擴展名
+_DUAL_FILENAME = re.compile(r'^[0-9a-fA-F\-]{32,36}___')
+# 衍生圖：原圖主體__尺寸.擴展名，沒有元數據記錄
+_DERIVATIVE_SUFFIX = re.compile(r'__(?:thumb|card|full)\.(?:webp|jpg)$')
+
+def get_stored_name(file_path: str) -> str:
+    """從 URL 或本地路徑取出存儲文件名"""
+    if not file_path:
+        return ''
+    if '://' in file_path:
+        file_path = urlparse(file_path).path
+    return unquote(os.path.basename(file_path.replace('\\', '/')))
+
+def extract_original_filename(dual_filename: str) -> str:
+    """从双轨文件名中提取原始文件名"""
+    try:
+        # 衍生圖保留尺寸後綴：原始文件名主體__尺寸.擴展名
+        derivative = _DERIVATIVE_SUFFIX.search(dual_filename)
+        if derivative:
+            file_name, file_ext = dual_filename[:derivative.start()], derivative.group(0)
+        else:
+            # 分离文件名和扩展名
+            file_name, file_ext = os.path.splitext(dual_filename)
+        # 分离UUID和编码部分
+        parts = file_name.split('___')
+        if len(parts) > 1:
+            # 解码原始文件名
+            original_name = base64.urlsafe_b64decode(parts[1].encode()).decode()
+            return f"{original_name}{file_ext}"
+        return dual_filename
+    except Exception:
+        return dual_filename  # 如果解析失败，返回原文件名
+
+def is_unique_stored_name(stored_name: str) -> bool:
+    """是否為帶 UUID 前綴的存儲文件名（內容不會被覆蓋，可長期緩存）"""
+    return bool(_DUAL_FILENAME.match(stored_name or ''))
+
+def is_derivative_name(stored_name: str) -> bool:
+    """是否為衍生圖文件名（原文件名可直接從文件名中提取，不需查庫）"""
+    return bool(_DERIVATIVE_SUFFIX.search(stored_name or ''))
+
+class FileMetadataService:
+    """上傳文件元數據服務，維護存儲文件名與原始文件名的對照"""
+
+    def __init__(self, db_connection):
+        """初始化文件元數據服務
+
+        Args:
+            db_connection: 數據庫連接對象
+        """
+        self.db_connection = db_connection
+
+    def record_file(self, file_path: str, original_filename: str, file_type: str,
+                    product_name: Optional[str] = None) -> None:
+        """記錄新上傳的文件
+
+        Args:
+            file_path: 文件 URL 或本地路徑
+            original_filename: 用戶上傳時的原始文件名
+            file_type: 'image' 或 'document'
+            product_name: 產品名稱
+        """
+        stored_name = get_stored_name(file_path)
+        if not stored_name or not original_filename:
+            return
+
+        cursor = self.db_connection.cursor()
+        cursor.execute("""
+            INSERT INTO product_files (stored_name, original_filename, file_url, file_type, product_name)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (stored_name) DO UPDATE
+            SET original_filename = EXCLUDED.original_filename,
+                file_url = EXCLUDED.file_url
+        """, (stored_name, original_filename, file_path, file_type, product_name))
+        self.db_connection.commit()
+        _original_filename_cache.set(stored_name, original_filename)
+
+    def get_original_filename(self, stored_name: str) -> Optional[str]:
+        """按存儲文件名查詢原始文件名（唯一索引等值查詢）"""
+        cached = _original_filename_cache.get(stored_name)
+        if cached is not None:
+            return cached or None
+
+        cursor = self.db_connection.cursor()
+        cursor.execute(
+            "SELECT original_filename FROM product_files WHERE stored_name = %s",
+            (stored_name,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            # 未命中只短期緩存：文件可能剛由其他進程上傳、記錄稍後寫入
+            _original_filename_cache.set(stored_name, '', ttl=FILE_METADATA_MISS_TTL)
+            return None
+        _original_filename_cache.set(stored_name, row[0])
+        return row[0]
+
+def record_uploaded_file(file_path, original_filename, file_type, product_name=None):
+    """上傳成功後記錄文件元數據，失敗只記錄日誌，不影響上傳結果"""
+    try:
+        with get_db_connection() as conn:
+            FileMetadataService(conn).record_file(file_path, original_filename, file_type, product_name)
+    except Exception as e:
+        logger.error("記錄文件元數據失敗: %s", str(e))
+
+def lookup_original_filename(stored_name):
+    """查詢原始文件名，先查緩存，未命中時再查資料庫；衍生圖沒有記錄，直接返回 None"""
+    if is_derivative_name(stored_name):
+        return None
+    cached = _original_filename_cache.get(stored_name)
+    if cached is not None:
+        return cached or None
+    try:
+        with get_db_connection() as conn:
+            return FileMetadataService(conn).get_original_filename(stored_name)
+    except Exception as e:
+        logger.error("查詢文件元數據失敗: %s", str(e))
+        return None
@@ -0,0 +1,112 @@
+import datetime
+import logging
+from typing import Dict, Any, List
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 摘要分組
+BUCKET_ALL = 'all'
+BUCKET_PENDING = 'pending'
+BUCKET_CONFIRMED = 'confirmed'
+BUCKET_SHIPPED = 'shipped'
+BUCKETS = (BUCKET_ALL, BUCKET_PENDING, BUCKET_CONFIRMED, BUCKET_SHIPPED)
+
+class OrderSummaryService:
+    """客戶訂單摘要服務，讀取由觸發器維護的 customer_order_summary
+
+    摘要只保存訂單數與最新訂單的編號、時間和狀態，商品明細在讀取時按訂單 ID 查詢，
+    商品改名或明細修改後不需要重算摘要。
+    """
+
+    def __init__(self, db_connection):
+        """初始化訂單摘要服務
+
+        Args:
+            db_connection: 數據庫連接對象
+        """
+        self.db_connection = db_connection
+
+    def get_bucket(self, customer_id: int, bucket: str) -> Dict[str, Any]:
+        """讀取客戶某個分組的摘要（主鍵單行查詢）
+
+        Returns:
+            {'order_count': 訂單數, 'latest_orders': 最近訂單列表}；沒有訂單時為空摘要
+        """
+        order_count, latest_orders = self._read_bucket(customer_id, bucket)
+        self._attach_product_details(latest_orders)
+        return {'order_count': order_count, 'latest_orders': latest_orders}
+
+    def get_summary(self, customer_id: int) -> Dict[str, Dict[str, Any]]:
+        """讀取客戶所有分組的摘要"""
+        cursor = self.db_connection.cursor()
+        cursor.execute("""
+            SELECT bucket, order_count, latest_orders, last_order_at
+            FROM customer_order_summary
+            WHERE customer_id = %s
+        """, (customer_id,))
+        summary = {bucket: {'order_count': 0, 'latest_orders': [], 'last_order_at': None} for bucket in BUCKETS}
+        for bucket, order_count, latest_orders, last_order_at in cursor.fetchall():
+            summary[bucket] = {
+                'order_count': order_count,
+                'latest_orders': latest_orders or [],
+                'last_order_at': last_order_at.strftime('%Y-%m-%d %H:%M:%S') if last_order_at else None
+            }
+        self._attach_product_details([order for item in summary.values() for order in item['latest_orders']])
+        return summary
+
+    def get_recent_orders(self, customer_id: int, days: int = 14) -> List[Dict[str, Any]]:
+        """最近幾天內的最新訂單
+
+        摘要中按建立時間倒序保存最新 N 筆訂單，過濾掉超出時間範圍的即為區間內最新的訂單。
+        """
+        since = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+        _, latest_orders = self._read_bucket(customer_id, BUCKET_ALL)
+        recent_orders = [order for order in latest_orders if order['created_at'] >= since]
+        self._attach_product_details(recent_orders)
+        return recent_orders
+
+    def _read_bucket(self, customer_id: int, bucket: str):
+        """讀取摘要行（主鍵單行查詢），返回 (訂單數, 最近訂單列表)"""
+        cursor = self.db_connection.cursor()
+        cursor.execute("""
+            SELECT order_count, latest_orders
+            FROM customer_order_summary
+            WHERE customer_id = %s AND bucket = %s
+        """, (customer_id, bucket))
+        row = cursor.fetchone()
+        if not row:
+            return 0, []
+        return row[0], row[1] or []
+
+    def _attach_product_details(self, orders: List[Dict[str, Any]]) -> None:
+        """為摘要中的訂單補上商品明細文本，一次查詢所有訂單"""
+        order_ids = list({order['order_id'] for order in orders})
+        if not order_ids:
+            return
+        cursor = self.db_connection.cursor()
+        cursor.execute("""
+            SELECT od.order_id,
+                   string_agg(
+                       p.name || ' x' || od.product_quantity || od.product_unit ||
+                       ' (' || od.order_status || ')' ||
+                       CASE
+                           WHEN od.remark IS NOT NULL AND od.remark != ''
+                           THEN E'\\n客戶備註: ' || od.remark
+                           ELSE ''
+                       END ||
+                       CASE
+                           WHEN od.supplier_note IS NOT NULL AND od.supplier_note != ''
+                           THEN E'\\n供應商備註: ' || od.supplier_note
+                           ELSE ''
+                       END,
+                       E'\\n' ORDER BY od.id
+                   )
+            FROM order_details od
+            JOIN products p ON od.product_id = p.id
+            WHERE od.order_id = ANY(%s)
+            GROUP BY od.order_id
+        """, (order_ids,))
+        product_details = dict(cursor.fetchall())
+        for order in orders:
+            order['product_details'] = product_details.get(order['order_id'])
@@ -0,0 +1,165 @@
+import logging
+from typing import Dict, Any, Optional
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 管理端行格式，與 /orders/all 一致
+_ADMIN_LINES_SQL = """
+    SELECT
+        o.id,
+        o.order_number,
+        o.created_at as date,
+        c.company_name as customer,
+        od.id as detail_id,
+        p.name as item,
+        od.product_quantity as quantity,
+        od.product_unit as unit,
+        od.order_status as status,
+        od.shipping_date,
+        od.remark,
+        od.supplier_note
+    FROM orders o
+    JOIN order_details od ON o.id = od.order_id
+    JOIN customers c ON o.customer_id = c.id
+    JOIN products p ON od.product_id = p.id
+    WHERE (od.id = ANY(%s) OR o.id = ANY(%s))
+"""
+
+# 客戶端行格式，與 /orders/list 的商品字段一致並帶上所屬訂單
+_CUSTOMER_LINES_SQL = """
+    SELECT
+        o.id as order_id,
+        o.order_number,
+        o.created_at,
+        od.id,
+        od.product_id,
+        p.name as product_name,
+        od.product_quantity,
+        od.product_unit,
+        od.order_status,
+        od.shipping_date,
+        od.remark,
+        od.supplier_note
+    FROM orders o
+    JOIN order_details od ON o.id = od.order_id
+    JOIN products p ON od.product_id = p.id
+    WHERE (od.id = ANY(%s) OR o.id = ANY(%s)) AND o.customer_id = %s
+"""
+
+class InvalidSyncToken(ValueError):
+    """同步令牌格式錯誤"""
+
+class OrderSyncService:
+    """訂單增量同步服務
+
+    同步令牌是資料庫快照的 xmin（最早仍在進行的事務 ID）。小於 xmin 的事務都已提交或回滾，
+    因此兩個令牌之間 txid 落在 [since, 新令牌) 的變更日誌就是這段時間內所有已提交的變更，
+    不會因事務提交順序與序列號順序不一致而漏掉。
+    """
+
+    def __init__(self, db_connection):
+        """初始化訂單同步服務
+
+        Args:
+            db_connection: 數據庫連接對象
+        """
+        self.db_connection = db_connection
+
+    def current_token(self) -> str:
+        """當前快照的同步令牌；全量查詢前獲取，查詢後返回給客戶端"""
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return str(cursor.fetchone()[0])
+
+    @staticmethod
+    def parse_token(token) -> int:
+        try:
+            value = int(token)
+        except (TypeError, ValueError):
+            raise InvalidSyncToken('無效的同步令牌')
+        if value < 0:
+            raise InvalidSyncToken('無效的同步令牌')
+        return value
+
+    def get_changes(self, since: str, customer_id: Optional[int] = None) -> Dict[str, Any]:
+        """獲取令牌之後新增、修改或刪除的訂單行
+
+        Args:
+            since: 上次返回的同步令牌
+            customer_id: 客戶ID；為空時返回所有客戶的變更（管理端格式）
+
+        Returns:
+            {
+                'reset': 令牌已過期時為 True，客戶端需全量重新加載,
+                'sync_token': 新令牌,
+                'changes': 新增或修改的訂單行（最新內容）,
+                'deleted_details': 已刪除的訂單明細 ID,
+                'deleted_orders': 已刪除的訂單 ID
+            }
+        """
+        since_txid = self.parse_token(since)
+        cursor = self.db_connection.cursor()
+        token = self.current_token()
+
+        result = {'reset': False, 'sync_token': token, 'changes': [],
+                  'deleted_details': [], 'deleted_orders': []}
+
+        cursor.execute("SELECT purged_txid FROM order_sync_state WHERE name = 'order_change_events'")
+        row = cursor.fetchone()
+        if row and since_txid <= row[0]:
+            result['reset'] = True
+            return result
+
+        sql = """
+            SELECT DISTINCT table_name, order_id, detail_id
+            FROM order_change_events
+            WHERE txid >= %s AND txid < %s
+        """
+        params = [since_txid, int(token)]
+        if customer_id is not None:
+            sql += " AND customer_id = %s"
+            params.append(customer_id)
+        cursor.execute(sql, params)
+
+        detail_ids = set()
+        order_ids = set()
+        for table_name, order_id, detail_id in cursor.fetchall():
+            if table_name == 'orders':
+                order_ids.add(order_id)
+            else:
+                detail_ids.add(detail_id)
+        if not detail_ids and not order_ids:
+            return result
+
+        if customer_id is None:
+            cursor.execute(_ADMIN_LINES_SQL, (list(detail_ids), list(order_ids)))
+        else:
+            cursor.execute(_CUSTOMER_LINES_SQL, (list(detail_ids), list(order_ids), customer_id))
+        columns = [desc[0] for desc in cursor.description]
+        changes = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        detail_key = 'detail_id' if customer_id is None else 'id'
+        order_key = 'id' if customer_id is None else 'order_id'
+        date_key = 'date' if customer_id is None else 'created_at'
+        for line in changes:
+            if line[date_key]:
+                line[date_key] = line[date_key].strftime('%Y-%m-%d %H:%M:%S')
+            if line['shipping_date']:
+                line['shipping_date'] = line['shipping_date'].strftime('%Y-%m-%d')
+        result['changes'] = changes
+
+        # 變更過但已查不到的行即為刪除
+        existing_details = {line[detail_key] for line in changes}
+        existing_orders = {line[order_key] for line in changes}
+        result['deleted_details'] = sorted(detail_ids - existing_details)
+        missing_orders = order_ids - existing_orders
+        if missing_orders:
+            # 沒有明細的訂單不會出現在結果中，需要確認主訂單是否仍存在
+            cursor.execute("SELECT id FROM orders WHERE id = ANY(%s)", (list(missing_orders),))
+            missing_orders -= {row[0] for row in cursor.fetchall()}
+        result['deleted_orders'] = sorted(missing_orders)
+
+        logger.debug("增量同步 since=%s: %s 行變更，%s 個明細刪除，%s 個訂單刪除",
+                     since, len(changes), len(result['deleted_details']), len(result['deleted_orders']))
+        return result
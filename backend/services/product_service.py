@@ -166,14 +166,19 @@ class ProductService:
             logger.info("正在獲取產品列表，limit: %s, offset: %s", limit, offset)
             
             # 確保使用適合PostgreSQL的SQL
+            # 衍生圖映射按存儲文件名關聯 product_files（唯一索引）
             query = """
                 SELECT 
-                    id, name, description, image_url, dm_url, 
-                    min_order_qty, max_order_qty, product_unit, 
-                    shipping_time, special_date, created_at, updated_at
-                FROM products 
-                WHERE status = 'active'
-                ORDER BY created_at DESC
+                    p.id, p.name, p.description, p.image_url, p.dm_url, 
+                    p.min_order_qty, p.max_order_qty, p.product_unit, 
+                    p.shipping_time, p.special_date, p.created_at, p.updated_at,
+                    p.image_original_filename, p.dm_original_filename,
+                    pf.derivatives AS image_variants
+                FROM products p
+                LEFT JOIN product_files pf
+                    ON pf.stored_name = regexp_replace(p.image_url, '^.*/', '')
+                WHERE p.status = 'active'
+                ORDER BY p.created_at DESC
                 LIMIT %s OFFSET %s
             """
             
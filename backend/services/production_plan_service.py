@@ -0,0 +1,59 @@
+import logging
+from typing import Dict, Any, Iterator, Optional
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 輸出列順序（CSV 表頭與 JSON 字段一致）
+PRODUCTION_PLAN_COLUMNS = (
+    'shipping_date', 'product_id', 'product_name', 'product_unit',
+    'total_quantity', 'unshipped_quantity', 'line_count', 'order_count'
+)
+
+class ProductionPlanService:
+    """生產計劃服務，讀取由觸發器維護的 production_plan_rollup"""
+
+    def __init__(self, db_connection):
+        """初始化生產計劃服務
+
+        Args:
+            db_connection: 數據庫連接對象
+        """
+        self.db_connection = db_connection
+
+    def iter_rows(self, start_date, end_date, product_id: Optional[int] = None,
+                  batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """按出貨日、商品、單位逐行返回匯總
+
+        Args:
+            start_date: 起始出貨日（含）
+            end_date: 結束出貨日（含）
+            product_id: 只返回指定商品
+            batch_size: 每次從資料庫讀取的行數
+        """
+        sql = """
+            SELECT r.shipping_date, r.product_id, p.name, r.product_unit,
+                   r.total_quantity, r.unshipped_quantity, r.line_count, r.order_count
+            FROM production_plan_rollup r
+            JOIN products p ON p.id = r.product_id
+            WHERE r.shipping_date BETWEEN %s AND %s
+        """
+        params = [start_date, end_date]
+        if product_id is not None:
+            sql += " AND r.product_id = %s"
+            params.append(product_id)
+        sql += " ORDER BY r.shipping_date, p.name, r.product_unit"
+
+        cursor = self.db_connection.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                item = dict(zip(PRODUCTION_PLAN_COLUMNS, row))
+                item['shipping_date'] = item['shipping_date'].strftime('%Y-%m-%d')
+                item['total_quantity'] = float(item['total_quantity'])
+                item['unshipped_quantity'] = float(item['unshipped_quantity'])
+                yield item
+        cursor.close()
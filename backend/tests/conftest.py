@@ -0,0 +1,29 @@
+"""測試環境：backend.config.database 在導入時建立連接池，這裡先替換為不連接資料庫的連接池"""
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+class OfflineConnectionPool:
+    """只記錄連接參數的連接池，取連接時報錯；需要連接的測試自行替換 connection_pool"""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._args = args
+        self._kwargs = kwargs
+        self._pool = []
+        self._used = {}
+
+    def getconn(self, key=None):
+        raise psycopg2.OperationalError('測試環境不連接資料庫')
+
+    def putconn(self, conn, key=None, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+if psycopg2 is not None:
+    psycopg2.pool.SimpleConnectionPool = OfflineConnectionPool
@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from backend.utils import orphan_gc
+
+_MODIFIED = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+class _FakeCursor:
+    """按 SQL 中的排序規則過濾引用路徑：COLLATE "C" 為字節序，否則模擬不區分大小寫的語言排序"""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.itersize = None
+        self.rows = []
+
+    def execute(self, sql, params):
+        start_after = params[-1]
+        if 'path COLLATE "C" >= %s' in sql:
+            selected = [path for path in self.paths if path >= start_after]
+        else:
+            selected = [path for path in self.paths if path.lower() >= start_after.lower()]
+        self.rows = [(path,) for path in sorted(selected)]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class _FakeConnection:
+    def __init__(self, paths):
+        self.paths = paths
+
+    def cursor(self, name=None):
+        return _FakeCursor(self.paths)
+
+def test_resume_after_uppercase_folder_keeps_lowercase_references(monkeypatch):
+    storage = ['Zed/a.jpg', 'Zed/b.jpg', 'apple2/a.jpg', 'apple2/a__thumb.webp', 'apple2/old.jpg']
+    references = ['Zed/a.jpg', 'apple2/a.jpg']
+
+    def list_storage(start_after, limit):
+        for path in sorted(storage):
+            if path > start_after:
+                yield path, 1, _MODIFIED
+
+    monkeypatch.setattr(orphan_gc, 'USE_AZURE_STORAGE', False)
+    monkeypatch.setattr(orphan_gc, '_list_storage', list_storage)
+
+    orphans, state = orphan_gc.find_orphans(_FakeConnection(references), start_after='Zed/a.jpg', limit=10)
+
+    assert [path for path, _, _ in orphans] == ['Zed/b.jpg', 'apple2/old.jpg']
+    assert state['last_path'] == 'apple2/old.jpg'
@@ -0,0 +1,96 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+pytest.importorskip('psycopg2')
+
+from backend.config import database
+from backend.config.database import get_db_connection
+from backend.utils import query_inspector
+from backend.utils.query_inspector import query_budget, finish_query_inspection
+from backend.utils.access_log import start_access_log
+from backend.utils.request_stats import get_request_stats
+
+pytest_plugins = ['pytester']
+
+class _FakeCursor:
+    def execute(self, query, vars=None):
+        pass
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+class _FakeConnection:
+    closed = 0
+
+    def cursor(self, *args, **kwargs):
+        return _FakeCursor()
+
+class _FakePool:
+    def getconn(self, key=None):
+        return _FakeConnection()
+
+    def putconn(self, conn, key=None, close=False):
+        pass
+
+def _make_app(monkeypatch):
+    """查詢經 get_db_connection 交出的 InstrumentedCursor 執行，計數方式與 app.py 的請求鉤子相同"""
+    monkeypatch.setattr(database, 'connection_pool', _FakePool())
+    app = flask.Flask(__name__)
+
+    @app.route('/hot')
+    @query_budget(2)
+    def hot():
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for customer_id in range(3):
+                cursor.execute("SELECT * FROM line_users WHERE customer_id = %s", (customer_id,))
+                cursor.fetchall()
+        return 'ok'
+
+    app.before_request(start_access_log)
+
+    @app.after_request
+    def inspect(response):
+        finish_query_inspection(app, get_request_stats()['db_queries'])
+        return response
+
+    return app
+
+@pytest.fixture
+def query_inspection():
+    query_inspector.enable_query_inspection()
+    query_inspector.pop_violations()
+    yield
+    query_inspector.disable_query_inspection()
+
+def test_route_over_budget_is_reported(monkeypatch, query_inspection):
+    _make_app(monkeypatch).test_client().get('/hot')
+
+    problems = query_inspector.pop_violations()
+    assert [p['kind'] for p in problems] == ['budget']
+    assert problems[0]['count'] == 3
+    assert problems[0]['budget'] == 2
+
+def test_route_within_budget_is_not_reported(monkeypatch, query_inspection):
+    query_inspector.set_override_budget(5)
+    try:
+        _make_app(monkeypatch).test_client().get('/hot')
+    finally:
+        query_inspector.set_override_budget(None)
+
+    assert query_inspector.pop_violations() == []
+
+def test_plugin_fails_test_over_budget(pytester):
+    pytester.makepyfile(test_hot="""
+        from backend.tests.test_query_budget import _make_app
+
+        def test_hot(monkeypatch):
+            _make_app(monkeypatch).test_client().get('/hot')
+    """)
+    result = pytester.runpytest('-p', 'backend.utils.query_budget_plugin')
+    # 預算在 fixture 收尾時檢查，失敗記為 teardown 錯誤
+    result.assert_outcomes(passed=1, errors=1)
+    result.stdout.fnmatch_lines(['*SQL 查詢超出預算*'])
@@ -0,0 +1,110 @@
+import os
+import json
+import random
+import logging
+from urllib.parse import parse_qsl, urlencode
+from flask import request
+from backend.utils.request_stats import start_request_stats, get_request_stats, get_request_latency
+
+# 訪問日誌使用獨立的 logger，由 app.setup_logging 接到隊列監聽器上
+access_logger = logging.getLogger('access')
+
+# 默認採樣率，1.0 表示全部記錄
+DEFAULT_SAMPLE_RATE = float(os.getenv('ACCESS_LOG_SAMPLE_RATE', '1.0'))
+# 超過此耗時（毫秒）的請求一律記錄
+SLOW_REQUEST_MS = float(os.getenv('ACCESS_LOG_SLOW_MS', '1000'))
+
+# 需要遮蔽的查詢參數
+REDACTED_KEYS = {'password', 'token', 'access_token', 'refresh_token', 'code', 'state', 'sig', 'se', 'secret'}
+
+def _parse_sample_rates(raw):
+    """解析 ACCESS_LOG_SAMPLE_RATES，例如 "static=0,product.get_locked_dates=0.1,/uploads/=0.05"
+
+    鍵可以是 Flask endpoint 名稱，或以 / 開頭的路徑前綴。
+    """
+    endpoint_rates = {}
+    prefix_rates = []
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        try:
+            rate = float(value)
+        except ValueError:
+            continue
+        key = key.strip()
+        if key.startswith('/'):
+            prefix_rates.append((key, rate))
+        else:
+            endpoint_rates[key] = rate
+    # 最長前綴優先
+    prefix_rates.sort(key=lambda item: len(item[0]), reverse=True)
+    return endpoint_rates, prefix_rates
+
+ENDPOINT_SAMPLE_RATES, PREFIX_SAMPLE_RATES = _parse_sample_rates(
+    os.getenv('ACCESS_LOG_SAMPLE_RATES', 'serve_static_files=0.1,metrics=0.01,/uploads/=0.1')
+)
+
+def get_sample_rate(endpoint, path):
+    """獲取指定路由的採樣率"""
+    if endpoint in ENDPOINT_SAMPLE_RATES:
+        return ENDPOINT_SAMPLE_RATES[endpoint]
+    for prefix, rate in PREFIX_SAMPLE_RATES:
+        if path.startswith(prefix):
+            return rate
+    return DEFAULT_SAMPLE_RATE
+
+def redact_query_string(query_string):
+    """遮蔽查詢字符串中的敏感參數"""
+    if not query_string:
+        return ''
+    pairs = parse_qsl(query_string, keep_blank_values=True)
+    return urlencode([
+        (key, '***' if key.lower() in REDACTED_KEYS else value)
+        for key, value in pairs
+    ])
+
+def start_access_log():
+    """在 before_request 最開始調用，記錄開始時間並初始化 DB 計數器"""
+    start_request_stats()
+
+def write_access_log(response):
+    """在 after_request 中調用，每個請求最多輸出一行結構化日誌
+
+    錯誤響應和慢請求不受採樣影響，始終記錄。
+    """
+    stats = get_request_stats()
+    if stats is None:
+        return response
+
+    latency_ms = get_request_latency() * 1000
+    status = response.status_code
+    endpoint = request.endpoint or ''
+
+    if status < 400 and latency_ms < SLOW_REQUEST_MS:
+        rate = get_sample_rate(endpoint, request.path)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return response
+
+    if not access_logger.isEnabledFor(logging.INFO):
+        return response
+
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': status,
+        'latency_ms': round(latency_ms, 2),
+        'db_queries': stats['db_queries'],
+        'db_time_ms': round(stats['db_time'] * 1000, 2),
+        'db_rows': stats['db_rows'],
+        'pool_wait_ms': round(stats['pool_wait'] * 1000, 2),
+        'remote_addr': request.headers.get('X-Forwarded-For', request.remote_addr),
+        'bytes': response.content_length
+    }
+    query = redact_query_string(request.query_string.decode('utf-8', 'replace'))
+    if query:
+        entry['query'] = query
+
+    access_logger.info(json.dumps(entry, ensure_ascii=False))
+    return response
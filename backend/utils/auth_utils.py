@@ -1,7 +1,8 @@
 from functools import wraps
-from flask import session, jsonify, request
+from flask import session, jsonify, request, g
 from backend.models.admin import Admin
 from backend.config.database import get_db_connection
+from backend.utils.token_utils import get_token_admin_id, get_token_permissions
 import logging
 
 # 獲取 logger
@@ -15,18 +16,22 @@ def require_permission(permission):
             logger.debug("當前 session: %s", dict(session))
             logger.debug("請求 headers: %s", dict(request.headers))
             
-            # 首先从 session 中获取 admin_id
-            admin_id = session.get('admin_id')
-            
-            # 如果 session 中没有，则尝试从 Authorization header 中获取
-            auth_from_header = False
-            if not admin_id:
-                auth_header = request.headers.get('Authorization')
-                if auth_header and auth_header.startswith('Bearer '):
-                    admin_id = auth_header.split(' ')[1]
-                    auth_from_header = True
-                    logger.debug("從 Authorization header 獲取 admin_id: %s", admin_id)
-            
+            # 優先使用已驗證的 access token，權限直接從 token 位元集解出，零資料庫查詢
+            admin_id = get_token_admin_id()
+            permissions = get_token_permissions()
+
+            if admin_id is None:
+                token_error = getattr(g, 'token_error', None)
+                if token_error:
+                    logger.warning("access token 無效: %s", token_error)
+                    return jsonify({
+                        'status': 'error',
+                        'code': token_error,
+                        'message': '登入已過期，請重新整理憑證'
+                    }), 401
+                admin_id = session.get('admin_id')
+                permissions = session.get('permissions')
+
             if not admin_id:
                 logger.warning("未找到 admin_id")
                 return jsonify({
@@ -34,16 +39,13 @@ def require_permission(permission):
                     'message': '請先登入'
                 }), 401
 
-            # 如果使用Authorization头部或session中没有权限信息，则从数据库获取
-            permissions = session.get('permissions')
-            if auth_from_header or not permissions:
+            # 舊格式憑證或 session 中沒有權限信息時才從數據庫獲取
+            if not permissions:
                 admin_info = Admin.get_by_id(admin_id)
                 if admin_info and admin_info.get('permissions'):
                     permissions = admin_info['permissions']
-                    # 如果是通过session认证，将权限信息存入session
-                    if not auth_from_header:
-                        session['admin_id'] = admin_id
-                        session['permissions'] = permissions
+                    session['admin_id'] = admin_id
+                    session['permissions'] = permissions
                     logger.debug("從數據庫獲取權限: %s", permissions)
             
             if not permissions:
@@ -82,13 +84,10 @@ def check_permission(permission):
             if 'admin_id' in session:
                 admin_id = session['admin_id']
 
-            # 如果 session 中沒有，嘗試從 Authorization header 獲取
-            if not admin_id and 'Authorization' in request.headers:
-                try:
-                    admin_id = int(request.headers['Authorization'])
-                    logger.debug("從 Authorization header 獲取 admin_id: %s", admin_id)
-                except (ValueError, TypeError):
-                    pass
+            # 如果 session 中沒有，嘗試從已驗證的 access token 獲取
+            if not admin_id:
+                admin_id = get_token_admin_id()
+                logger.debug("從 access token 獲取 admin_id: %s", admin_id)
 
             if not admin_id:
                 logger.warning("未找到 admin_id")
@@ -1,7 +1,13 @@
 import os
 import logging
+import threading
+import requests
 from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, generate_blob_sas
+from azure.storage.blob import (
+    BlobServiceClient, BlobClient, ContainerClient, BlobSasPermissions, ContentSettings, generate_blob_sas
+)
+from azure.core import MatchConditions
+from azure.core.pipeline.transport import RequestsTransport
 from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 import uuid
 from werkzeug.utils import secure_filename
@@ -11,16 +17,70 @@ from urllib.parse import urlparse
 connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
 container_name = os.getenv('AZURE_STORAGE_CONTAINER', 'uploads')
 
+# HTTP 連接池大小，應不小於 worker 內的並發請求數 × 上傳並發數
+AZURE_HTTP_POOL_SIZE = int(os.getenv('AZURE_HTTP_POOL_SIZE', 20))
+AZURE_CONNECTION_TIMEOUT = int(os.getenv('AZURE_CONNECTION_TIMEOUT', 10))
+AZURE_READ_TIMEOUT = int(os.getenv('AZURE_READ_TIMEOUT', 60))
+# 大文件分塊上傳：超過 MAX_SINGLE_PUT_SIZE 時按 MAX_BLOCK_SIZE 分塊，並發上傳塊數
+AZURE_UPLOAD_MAX_CONCURRENCY = int(os.getenv('AZURE_UPLOAD_MAX_CONCURRENCY', 4))
+AZURE_MAX_BLOCK_SIZE = int(os.getenv('AZURE_MAX_BLOCK_SIZE', 4 * 1024 * 1024))
+AZURE_MAX_SINGLE_PUT_SIZE = int(os.getenv('AZURE_MAX_SINGLE_PUT_SIZE', 8 * 1024 * 1024))
+# 流式下載每塊大小
+AZURE_MAX_CHUNK_GET_SIZE = int(os.getenv('AZURE_MAX_CHUNK_GET_SIZE', 4 * 1024 * 1024))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+# 已確認存在的容器，每個進程只檢查一次
+_existing_containers = set()
+
+def create_blob_service_client(conn_str=None):
+    """創建帶連接池的Blob服務客戶端"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=AZURE_HTTP_POOL_SIZE,
+        pool_maxsize=AZURE_HTTP_POOL_SIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    transport = RequestsTransport(
+        session=session,
+        session_owner=False,
+        connection_timeout=AZURE_CONNECTION_TIMEOUT,
+        read_timeout=AZURE_READ_TIMEOUT
+    )
+    return BlobServiceClient.from_connection_string(
+        conn_str or connection_string,
+        transport=transport,
+        max_block_size=AZURE_MAX_BLOCK_SIZE,
+        max_single_put_size=AZURE_MAX_SINGLE_PUT_SIZE,
+        max_chunk_get_size=AZURE_MAX_CHUNK_GET_SIZE
+    )
+
 def get_blob_service_client():
-    """獲取Blob服務客戶端"""
-    try:
-        return BlobServiceClient.from_connection_string(connection_string)
-    except Exception as e:
-        logging.error(f"無法連接到Azure Blob存儲: {str(e)}")
-        raise
+    """獲取進程內共用的Blob服務客戶端
+    
+    gunicorn fork 出的 worker 不能共用父進程的連接，按進程號重新創建。
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            try:
+                _client = create_blob_service_client()
+                _client_pid = pid
+                _existing_containers.clear()
+            except Exception as e:
+                logging.error(f"無法連接到Azure Blob存儲: {str(e)}")
+                raise
+    return _client
 
 def ensure_container_exists():
-    """確保容器存在，如果不存在則創建"""
+    """確保容器存在，如果不存在則創建（每個進程只檢查一次）"""
+    if container_name in _existing_containers and _client_pid == os.getpid():
+        return
     try:
         client = get_blob_service_client()
         container_client = client.get_container_client(container_name)
@@ -30,8 +90,14 @@ def ensure_container_exists():
             container_client.get_container_properties()
         except ResourceNotFoundError:
             # 容器不存在，創建它
-            container_client.create_container(public_access="blob")
-            logging.info(f"創建了容器: {container_name}")
+            try:
+                container_client.create_container(public_access="blob")
+                logging.info(f"創建了容器: {container_name}")
+            except ResourceExistsError:
+                # 其他 worker 已同時創建
+                pass
+        
+        _existing_containers.add(container_name)
     
     except Exception as e:
         logging.error(f"確保容器存在時出錯: {str(e)}")
@@ -129,7 +195,8 @@ def upload_file_to_blob(file, filename, product_name, is_image=True):
         blob_client.upload_blob(
             file, 
             overwrite=True,
-            content_type=content_type
+            content_type=content_type,
+            max_concurrency=AZURE_UPLOAD_MAX_CONCURRENCY
         )
         
         # 打印詳細信息以便調試
@@ -142,6 +209,28 @@ def upload_file_to_blob(file, filename, product_name, is_image=True):
         logging.error(f"上傳文件到Azure Blob時出錯: {str(e)}")
         raise
 
+def upload_bytes_to_blob(blob_path, data, content_type, cache_control=None):
+    """上傳內存中的數據到指定blob路徑（用於後台生成的衍生圖）"""
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container_name, blob=blob_path)
+    blob_client.upload_blob(
+        data,
+        overwrite=True,
+        content_settings=ContentSettings(
+            content_type=content_type,
+            cache_control=cache_control or 'public, max-age=31536000, immutable'
+        ),
+        max_concurrency=AZURE_UPLOAD_MAX_CONCURRENCY
+    )
+    return blob_client.url
+
+def get_blob_path_from_url(blob_url):
+    """從完整blob URL中取出容器內的blob路徑"""
+    path_parts = urlparse(blob_url).path.lstrip('/').split('/')
+    if len(path_parts) < 2:
+        raise ValueError(f"無法從URL中提取有效的blob路徑: {blob_url}")
+    return '/'.join(path_parts[1:])
+
 def get_content_type_from_filename(filename):
     """根據文件名獲取內容類型"""
     file_ext = os.path.splitext(filename)[1].lower()
@@ -214,28 +303,41 @@ def delete_blob(blob_path):
     
     return True
 
-def generate_sas_url(blob_path, expiry_hours=1):
+def generate_sas_url(blob_path, expiry_hours=1, container=None, expiry_minutes=None,
+                     content_disposition=None, content_type=None):
     """生成SAS URL，用於有時限的訪問私有blob
     
     Args:
         blob_path: blob的完整路徑，例如 'product_name/filename.jpg'
         expiry_hours: SAS令牌的有效期（小時）
+        container: 容器名稱，默認為配置的容器
+        expiry_minutes: SAS令牌的有效期（分鐘），設置時優先於 expiry_hours
+        content_disposition: 覆蓋下載時的 Content-Disposition 響應頭
+        content_type: 覆蓋下載時的 Content-Type 響應頭
     
     Returns:
         sas_url: 帶有SAS令牌的完整URL
     """
     try:
+        container = container or container_name
         client = get_blob_service_client()
-        blob_client = client.get_blob_client(container=container_name, blob=blob_path)
+        blob_client = client.get_blob_client(container=container, blob=blob_path)
+        
+        if expiry_minutes is not None:
+            expiry = datetime.utcnow() + timedelta(minutes=expiry_minutes)
+        else:
+            expiry = datetime.utcnow() + timedelta(hours=expiry_hours)
         
         # 生成SAS令牌
         sas_token = generate_blob_sas(
             account_name=blob_client.account_name,
-            container_name=container_name,
+            container_name=container,
             blob_name=blob_path,
             account_key=client.credential.account_key,
             permission="r",  # 讀取權限
-            expiry=datetime.utcnow() + timedelta(hours=expiry_hours)
+            expiry=expiry,
+            content_disposition=content_disposition,
+            content_type=content_type
         )
         
         # 返回帶有SAS令牌的URL
@@ -245,6 +347,71 @@ def generate_sas_url(blob_path, expiry_hours=1):
         logging.error(f"生成SAS URL時出錯: {str(e)}")
         raise
 
+def generate_upload_sas_url(blob_path, expiry_minutes):
+    """生成只允許創建/寫入單個blob的短時效SAS URL，供瀏覽器直傳
+    
+    瀏覽器按塊上傳（Put Block）後提交塊列表（Put Block List），
+    存儲帳戶需配置允許前端來源的 PUT 跨域規則。
+    """
+    ensure_container_exists()
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container_name, blob=blob_path)
+    sas_token = generate_blob_sas(
+        account_name=blob_client.account_name,
+        container_name=container_name,
+        blob_name=blob_path,
+        account_key=client.credential.account_key,
+        permission=BlobSasPermissions(create=True, write=True),
+        expiry=datetime.utcnow() + timedelta(minutes=expiry_minutes)
+    )
+    return f"{blob_client.url}?{sas_token}", blob_client.url
+
+def set_blob_content_type(blob_path, content_type):
+    """設置blob的Content-Type（瀏覽器直傳時未必設置正確）"""
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container_name, blob=blob_path)
+    blob_client.set_http_headers(content_settings=ContentSettings(content_type=content_type))
+
+def get_blob_properties(container, blob_path):
+    """獲取blob屬性（大小、ETag、最後修改時間、內容類型）
+    
+    Returns:
+        BlobProperties，blob不存在時返回 None
+    """
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container, blob=blob_path)
+    try:
+        return blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+
+def iter_blob_chunks(container, blob_path, offset=None, length=None, etag=None):
+    """按塊流式讀取blob，不把整個文件讀入內存
+    
+    Args:
+        container: 容器名稱
+        blob_path: blob路徑
+        offset: 起始字節
+        length: 讀取字節數
+        etag: 指定時要求blob仍為此版本，避免讀取過程中文件被替換
+    
+    Returns:
+        生成器，逐塊產出 bytes
+    """
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container, blob=blob_path)
+    kwargs = {}
+    if etag:
+        kwargs['etag'] = etag
+        kwargs['match_condition'] = MatchConditions.IfNotModified
+    downloader = blob_client.download_blob(offset=offset, length=length, **kwargs)
+    
+    def generate():
+        for chunk in downloader.chunks():
+            yield chunk
+    
+    return generate()
+
 def list_product_files(product_name):
     """列出特定產品的所有文件
     
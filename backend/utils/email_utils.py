@@ -9,6 +9,7 @@ import traceback
 import base64
 import re
 import logging
+from backend.utils.metrics import EMAIL_QUEUE_DEPTH, EMAILS_SENT
 
 # 加載環境變數
 load_dotenv()
@@ -75,6 +76,19 @@ class EmailSender:
         return cleaned
 
     def _send_email(self, recipient_email, subject, title, content_data, is_order_items=True, show_notes=False, show_status=False):
+        """發送郵件並記錄隊列深度與發送結果指標"""
+        EMAIL_QUEUE_DEPTH.inc()
+        try:
+            result, message = self._deliver_email(
+                recipient_email, subject, title, content_data,
+                is_order_items, show_notes, show_status
+            )
+            EMAILS_SENT.inc(labels=('success' if result else 'failure',))
+            return result, message
+        finally:
+            EMAIL_QUEUE_DEPTH.dec()
+
+    def _deliver_email(self, recipient_email, subject, title, content_data, is_order_items=True, show_notes=False, show_status=False):
         # 模擬模式檢查
         if self.dummy_mode:
             logger.info("📧 [模擬模式] 模擬發送郵件到: %s，主題: %s", recipient_email, subject)
@@ -0,0 +1,309 @@
+import os
+import logging
+import datetime
+from werkzeug.utils import secure_filename
+from backend.config.database import get_db_connection
+from backend.utils.file_handlers import (
+    UPLOAD_FOLDER,
+    USE_AZURE_STORAGE,
+    is_allowed_image,
+    is_allowed_document
+)
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 每批處理的待刪除記錄數
+FILE_DELETION_BATCH_SIZE = int(os.getenv('FILE_DELETION_BATCH_SIZE', 100))
+# 失敗後最多重試次數，超過後保留記錄供人工排查
+FILE_DELETION_MAX_ATTEMPTS = int(os.getenv('FILE_DELETION_MAX_ATTEMPTS', 8))
+# Azure 批量刪除單次請求上限為 256 個 blob
+AZURE_DELETE_BATCH_SIZE = 256
+
+# 刪除類型
+KIND_FILE = 'file'        # 單個文件：target 為 blob 路徑或 uploads 下的相對路徑
+KIND_FOLDER = 'folder'    # 產品目錄：target 為安全處理後的產品名稱（舊記錄；新登記改為逐個文件）
+KIND_REPLACE = 'replace'  # 替換上傳：刪除產品目錄下同類舊文件，保留 keep_name 及其衍生圖
+
+def _storage():
+    return 'azure' if USE_AZURE_STORAGE else 'local'
+
+def _enqueue(rows, conn=None):
+    """寫入待刪除記錄；傳入 conn 時只在調用方的事務中寫入，由調用方提交"""
+    if not rows:
+        return
+    sql = """
+        INSERT INTO pending_file_deletions (storage, kind, target, file_kind, keep_name)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    if conn is not None:
+        cursor = conn.cursor()
+        cursor.executemany(sql, rows)
+        return
+    with get_db_connection() as own_conn:
+        cursor = own_conn.cursor()
+        cursor.executemany(sql, rows)
+        own_conn.commit()
+
+def schedule_file_deletion(target, conn=None):
+    """登記刪除單個文件
+
+    Args:
+        target: blob 路徑/URL，或本地 uploads 下的路徑
+        conn: 可選，沿用調用方的資料庫連接
+    """
+    if not target:
+        return
+    if not USE_AZURE_STORAGE:
+        target = _relative_local_path(target)
+    _enqueue([(_storage(), KIND_FILE, target, None, None)], conn)
+
+def _list_folder_files(folder_name):
+    """列出產品目錄下現有的全部文件（本地為 uploads 下的相對路徑，Azure 為 blob 名稱）"""
+    if USE_AZURE_STORAGE:
+        from backend.utils.azure_storage import get_blob_service_client, container_name
+        container_client = get_blob_service_client().get_container_client(container_name)
+        return [blob.name for blob in container_client.list_blobs(name_starts_with=f"{folder_name}/")]
+
+    folder_path = _safe_local_path(folder_name)
+    files = []
+    for root, _, filenames in os.walk(folder_path):
+        for filename in filenames:
+            files.append(os.path.relpath(os.path.join(root, filename), UPLOAD_FOLDER).replace(os.sep, '/'))
+    return files
+
+def schedule_folder_deletion(product_name, conn=None):
+    """登記刪除產品目錄下現有的文件（本地文件夾或 Azure 前綴）
+
+    登記時列出文件並逐個登記，延後執行時不會刪除之後同名產品上傳的新文件。
+
+    Returns:
+        int: 登記的文件數
+    """
+    folder_name = secure_filename(product_name or '')
+    if not folder_name:
+        logger.warning("产品文件夹名称无效")
+        return 0
+    files = _list_folder_files(folder_name)
+    _enqueue([(_storage(), KIND_FILE, path, None, None) for path in files], conn)
+    return len(files)
+
+def schedule_replaced_files_deletion(product_name, is_image, keep_name, conn=None):
+    """登記刪除產品目錄下被新上傳文件替換的同類舊文件
+
+    只刪除登記時間之前的文件，避免延後執行時誤刪之後的新上傳。
+    """
+    folder_name = secure_filename(product_name or '')
+    if not folder_name:
+        return
+    file_kind = 'image' if is_image else 'document'
+    _enqueue([(_storage(), KIND_REPLACE, folder_name, file_kind, keep_name)], conn)
+
+def _relative_local_path(path):
+    """把 /uploads/... 或絕對路徑轉為 uploads 下的相對路徑"""
+    path = path.replace('\\', '/')
+    upload_root = UPLOAD_FOLDER.replace('\\', '/').rstrip('/') + '/'
+    if path.startswith(upload_root):
+        return path[len(upload_root):]
+    if '/uploads/' in path:
+        return path.split('/uploads/', 1)[1]
+    return path.lstrip('/')
+
+def _safe_local_path(relative_path):
+    """拼接本地路徑並確保不會跳出 uploads 目錄"""
+    full_path = os.path.abspath(os.path.join(UPLOAD_FOLDER, relative_path))
+    if not full_path.startswith(os.path.abspath(UPLOAD_FOLDER) + os.sep):
+        raise ValueError(f"非法路徑: {relative_path}")
+    return full_path
+
+def _matches_kind(filename, file_kind):
+    if file_kind == 'image':
+        return is_allowed_image(filename)
+    return not is_allowed_image(filename) and is_allowed_document(filename)
+
+def _is_kept(filename, keep_name):
+    """保留新上傳的文件及其衍生圖（同一主體名稱）"""
+    if not keep_name:
+        return False
+    return filename == keep_name or filename.startswith(os.path.splitext(keep_name)[0] + '__')
+
+def _local_replace_targets(row):
+    folder_path = _safe_local_path(row['target'])
+    if not os.path.isdir(folder_path):
+        return []
+    cutoff = row['created_at'].replace(tzinfo=datetime.timezone.utc).timestamp()
+    targets = []
+    for filename in os.listdir(folder_path):
+        file_path = os.path.join(folder_path, filename)
+        if (_matches_kind(filename, row['file_kind']) and not _is_kept(filename, row['keep_name'])
+                and os.path.getmtime(file_path) <= cutoff):
+            targets.append(file_path)
+    return targets
+
+def _local_folder_targets(row):
+    """舊的目錄刪除記錄：只刪除登記時間之前的文件"""
+    folder_path = _safe_local_path(row['target'])
+    cutoff = row['created_at'].replace(tzinfo=datetime.timezone.utc).timestamp()
+    targets = []
+    for root, _, filenames in os.walk(folder_path):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            if os.path.getmtime(file_path) <= cutoff:
+                targets.append(file_path)
+    return targets
+
+def _remove_empty_folder(folder_path):
+    """刪除已清空的產品目錄；目錄中仍有文件時 rmdir 失敗，保留目錄"""
+    if os.path.abspath(folder_path) == os.path.abspath(UPLOAD_FOLDER):
+        return
+    try:
+        if not os.listdir(folder_path):
+            os.rmdir(folder_path)
+            logger.info("已删除产品文件夹: %s", folder_path)
+    except OSError:
+        pass
+
+def _process_local(row):
+    if row['kind'] == KIND_FILE:
+        targets = [_safe_local_path(row['target'])]
+    elif row['kind'] == KIND_FOLDER:
+        targets = _local_folder_targets(row)
+    else:
+        targets = _local_replace_targets(row)
+
+    for file_path in targets:
+        try:
+            os.remove(file_path)
+            logger.info("已刪除文件: %s", file_path)
+        except FileNotFoundError:
+            pass
+
+    if targets and row['kind'] != KIND_REPLACE:
+        _remove_empty_folder(os.path.dirname(targets[0]))
+
+def _azure_targets(container_client, row):
+    """解析 Azure 刪除記錄對應的 blob 名稱列表"""
+    from backend.utils.azure_storage import get_blob_path_from_url
+
+    if row['kind'] == KIND_FILE:
+        target = row['target']
+        return [get_blob_path_from_url(target) if target.startswith('http') else target]
+
+    prefix = f"{row['target']}/"
+    cutoff = row['created_at'].replace(tzinfo=datetime.timezone.utc)
+    names = []
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        # 登記之後寫入的文件（例如同名新產品的上傳）不刪除
+        if blob.last_modified > cutoff:
+            continue
+        if row['kind'] == KIND_REPLACE:
+            filename = blob.name[len(prefix):]
+            if not _matches_kind(filename, row['file_kind']) or _is_kept(filename, row['keep_name']):
+                continue
+        names.append(blob.name)
+    return names
+
+def _delete_blobs(container_client, names):
+    """批量刪除 blob，已不存在的視為成功
+
+    Returns:
+        list: 刪除失敗的 blob 名稱
+    """
+    failed = []
+    for start in range(0, len(names), AZURE_DELETE_BATCH_SIZE):
+        chunk = names[start:start + AZURE_DELETE_BATCH_SIZE]
+        responses = container_client.delete_blobs(*chunk, raise_on_any_failure=False)
+        for name, response in zip(chunk, responses):
+            if response.status_code not in (200, 202, 404):
+                failed.append(name)
+    return failed
+
+def _process_azure_rows(rows):
+    """處理一批 Azure 記錄，所有 blob 合併為批量刪除請求
+
+    Returns:
+        dict: {記錄 id: 錯誤信息}
+    """
+    from backend.utils.azure_storage import get_blob_service_client, container_name
+
+    container_client = get_blob_service_client().get_container_client(container_name)
+    errors = {}
+    owners = {}
+    for row in rows:
+        try:
+            for name in _azure_targets(container_client, row):
+                owners.setdefault(name, []).append(row['id'])
+        except Exception as e:
+            errors[row['id']] = str(e)
+
+    if owners:
+        try:
+            for name in _delete_blobs(container_client, list(owners)):
+                for row_id in owners[name]:
+                    errors[row_id] = f"刪除失敗: {name}"
+        except Exception as e:
+            for row_ids in owners.values():
+                for row_id in row_ids:
+                    errors.setdefault(row_id, str(e))
+    return errors
+
+def process_pending_file_deletions(batch_size=None):
+    """執行一批到期的待刪除文件
+
+    使用 FOR UPDATE SKIP LOCKED 領取記錄，多個進程同時執行時不會重複處理。
+    成功的記錄直接刪除；失敗的記錄按指數退避延後重試。
+
+    Returns:
+        int: 成功處理的記錄數
+    """
+    batch_size = batch_size or FILE_DELETION_BATCH_SIZE
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, storage, kind, target, file_kind, keep_name, created_at, attempts
+            FROM pending_file_deletions
+            WHERE next_attempt_at <= NOW() AND attempts < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (FILE_DELETION_MAX_ATTEMPTS, batch_size))
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if not rows:
+            conn.commit()
+            return 0
+
+        errors = {}
+        azure_rows = [row for row in rows if row['storage'] == 'azure']
+        if azure_rows:
+            if USE_AZURE_STORAGE:
+                errors.update(_process_azure_rows(azure_rows))
+            else:
+                for row in azure_rows:
+                    errors[row['id']] = '未配置 Azure 存儲'
+
+        for row in rows:
+            if row['storage'] != 'local':
+                continue
+            try:
+                _process_local(row)
+            except Exception as e:
+                errors[row['id']] = str(e)
+
+        done_ids = [row['id'] for row in rows if row['id'] not in errors]
+        if done_ids:
+            cursor.execute("DELETE FROM pending_file_deletions WHERE id = ANY(%s)", (done_ids,))
+        for row_id, error in errors.items():
+            logger.warning("文件刪除失敗，稍後重試 (id=%s): %s", row_id, error)
+            cursor.execute("""
+                UPDATE pending_file_deletions
+                SET attempts = attempts + 1,
+                    last_error = %s,
+                    next_attempt_at = NOW() + make_interval(secs => 60 * power(2, attempts))
+                WHERE id = %s
+            """, (error[:1000], row_id))
+        conn.commit()
+
+    if done_ids:
+        logger.info("已完成 %s 條待刪除文件記錄，失敗 %s 條", len(done_ids), len(errors))
+    return len(done_ids)
@@ -4,6 +4,7 @@ import mimetypes
 from werkzeug.utils import secure_filename
 import logging
 from .azure_storage import upload_file_to_blob, delete_blob, list_product_files
+from .image_derivatives import enqueue_image_derivatives
 
 # 獲取 logger
 logger = logging.getLogger(__name__)
@@ -36,6 +37,14 @@ def is_allowed_document(filename):
     """檢查是否為允許的文檔類型"""
     return get_file_extension(filename) in ALLOWED_DOC_EXTENSIONS
 
+def schedule_image_derivatives(file, file_url, local_path=None):
+    """讀出已保存圖片的內容並提交衍生圖生成任務"""
+    try:
+        file.seek(0)
+        enqueue_image_derivatives(file.read(), file_url, local_path)
+    except Exception as e:
+        logger.error("提交衍生圖任務失敗: %s", str(e))
+
 def save_file(file, product_name, is_image=True):
     """儲存文件（到本地或Azure）
     
@@ -101,12 +110,18 @@ def save_file(file, product_name, is_image=True):
                     logger.warning("檔名看起來像URL，已重新生成: %s", filename)
             
             # 上傳到Azure
-            return upload_file_to_blob(file, filename, safe_product_name, is_image)
+            blob_url = upload_file_to_blob(file, filename, safe_product_name, is_image)
+            # 上傳失敗時沒有原圖，不生成衍生圖
+            if is_image and blob_url:
+                schedule_image_derivatives(file, blob_url)
+            return blob_url
         else:
             # 使用本地存儲
             folder_path = create_product_folder(product_name)
             file_path = os.path.join(folder_path, filename)
             file.save(file_path)
+            if is_image:
+                schedule_image_derivatives(file, f"/uploads/{secure_filename(product_name)}/{filename}", file_path)
             return file_path
 
     except Exception as e:
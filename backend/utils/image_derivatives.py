@@ -0,0 +1,161 @@
+import io
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安裝時不生成衍生圖，原圖照常使用
+    Image = None
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 衍生圖尺寸（最長邊像素）：列表縮略圖、卡片、詳情大圖
+IMAGE_DERIVATIVE_SIZES = {
+    'thumb': int(os.getenv('IMAGE_THUMB_SIZE', 160)),
+    'card': int(os.getenv('IMAGE_CARD_SIZE', 480)),
+    'full': int(os.getenv('IMAGE_FULL_SIZE', 1280)),
+}
+# (格式名, Pillow 格式, 擴展名, Content-Type, 保存參數)
+IMAGE_DERIVATIVE_FORMATS = (
+    ('webp', 'WEBP', '.webp', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', '.jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', 2))
+IMAGE_DERIVATIVES_ENABLED = os.getenv('IMAGE_DERIVATIVES_ENABLED', 'true').lower() == 'true'
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """獲取當前進程的線程池（gunicorn fork 後重新創建）"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    with _executor_lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_DERIVATIVE_WORKERS,
+                thread_name_prefix='image-derivatives'
+            )
+            _executor_pid = pid
+    return _executor
+
+def derivative_name(stored_name, size_name, extension):
+    """衍生圖文件名：原文件名主體__尺寸.擴展名，保留 UUID 前綴以便長期緩存"""
+    stem = os.path.splitext(stored_name)[0]
+    return f"{stem}__{size_name}{extension}"
+
+def _replace_basename(path_or_url, new_name):
+    head, _ = path_or_url.rsplit('/', 1) if '/' in path_or_url else ('', path_or_url)
+    return f"{head}/{new_name}" if head else new_name
+
+def _render(image, max_size, pil_format, options):
+    resized = image.copy()
+    resized.thumbnail((max_size, max_size), Image.LANCZOS)
+    if pil_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', resized.size, (255, 255, 255))
+        background.paste(resized, mask=resized.convert('RGBA').split()[-1])
+        resized = background
+    buffer = io.BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue(), resized.size
+
+def build_srcset(derivatives, fmt):
+    """將衍生圖映射轉為 srcset 字符串"""
+    if not derivatives:
+        return None
+    entries = []
+    for size_name in IMAGE_DERIVATIVE_SIZES:
+        variant = derivatives.get(size_name)
+        if variant and variant.get(fmt):
+            entries.append(f"{variant[fmt]} {variant['width']}w")
+    return ', '.join(entries) or None
+
+def generate_derivatives(data, original_url, local_path=None):
+    """生成全部尺寸與格式的衍生圖並保存到原圖旁邊
+
+    Args:
+        data: 原圖字節
+        original_url: 原圖 URL（Azure 為 blob URL，本地為 /uploads/... 路徑）
+        local_path: 本地存儲時原圖的磁盤路徑
+
+    Returns:
+        dict: {尺寸名: {'width': 寬, 'height': 高, 'webp': url, 'jpeg': url}}
+    """
+    from backend.utils.file_handlers import USE_AZURE_STORAGE
+    from backend.utils.azure_storage import upload_bytes_to_blob, get_blob_path_from_url
+
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+
+    stored_name = os.path.basename(original_url)
+    derivatives = {}
+    for size_name, max_size in IMAGE_DERIVATIVE_SIZES.items():
+        variant = {}
+        for fmt, pil_format, extension, content_type, options in IMAGE_DERIVATIVE_FORMATS:
+            body, (width, height) = _render(image, max_size, pil_format, options)
+            name = derivative_name(stored_name, size_name, extension)
+            if USE_AZURE_STORAGE:
+                blob_path = _replace_basename(get_blob_path_from_url(original_url), name)
+                upload_bytes_to_blob(blob_path, body, content_type)
+            else:
+                with open(os.path.join(os.path.dirname(local_path), name), 'wb') as f:
+                    f.write(body)
+            variant[fmt] = _replace_basename(original_url, name)
+            variant['width'], variant['height'] = width, height
+        derivatives[size_name] = variant
+    return derivatives
+
+def _store_derivatives(original_url, derivatives):
+    """把衍生圖映射寫入 product_files；上傳記錄可能尚未寫入，因此使用 upsert"""
+    from backend.config.database import get_db_connection
+    from backend.services.file_metadata_service import get_stored_name, extract_original_filename
+
+    stored_name = get_stored_name(original_url)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO product_files (stored_name, original_filename, file_url, file_type, derivatives)
+            VALUES (%s, %s, %s, 'image', %s)
+            ON CONFLICT (stored_name) DO UPDATE SET derivatives = EXCLUDED.derivatives
+        """, (stored_name, extract_original_filename(stored_name), original_url, json.dumps(derivatives)))
+        conn.commit()
+
+def _download_blob(blob_url):
+    from backend.utils.azure_storage import get_blob_service_client, get_blob_path_from_url, container_name
+    client = get_blob_service_client()
+    blob_client = client.get_blob_client(container=container_name, blob=get_blob_path_from_url(blob_url))
+    return blob_client.download_blob().readall()
+
+def _process(data, original_url, local_path):
+    try:
+        if data is None:
+            # 瀏覽器直傳的圖片不經過應用，在後台線程中下載原圖
+            data = _download_blob(original_url)
+        derivatives = generate_derivatives(data, original_url, local_path)
+        _store_derivatives(original_url, derivatives)
+        logger.info("已生成衍生圖: %s", os.path.basename(original_url))
+    except Exception as e:
+        logger.error("生成衍生圖失敗 %s: %s", original_url, str(e))
+
+def enqueue_image_derivatives(data, original_url, local_path=None):
+    """提交後台任務生成衍生圖，不阻塞上傳請求
+
+    Args:
+        data: 原圖字節（請求結束後上傳文件流會關閉，需提前讀出）；
+              為 None 時在後台從 Blob 下載
+        original_url: 原圖 URL 或 /uploads/... 路徑
+        local_path: 本地存儲時原圖的磁盤路徑
+    """
+    if not IMAGE_DERIVATIVES_ENABLED or not original_url:
+        return None
+    if Image is None:
+        logger.warning("未安裝 Pillow，跳過衍生圖生成")
+        return None
+    return _get_executor().submit(_process, data, original_url, local_path)
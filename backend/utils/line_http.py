@@ -0,0 +1,149 @@
+"""LINE API 的共享 HTTP 會話
+
+LINE Login（OAuth 令牌、用戶資料）與 Messaging API（LineBotApi 的 reply/push）共用
+一個帶連接池的 requests.Session，避免每次調用重新建立 TCP/TLS 連接，並統一設置：
+
+- 連接與讀取超時
+- 連接失敗時重試（請求尚未送達，任何方法都可安全重試）
+- 5xx 響應按指數退避重試：GET 總是重試，POST 需調用方聲明可重試
+- 按端點記錄請求數與耗時
+
+Messaging API 客戶端 line_bot_api 也在這裡創建，路由與後台通知共用同一個實例。
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from linebot import LineBotApi
+from linebot.http_client import HttpClient, RequestsHttpResponse
+from backend.utils.metrics import LINE_HTTP_REQUESTS, LINE_HTTP_LATENCY
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+LINE_HTTP_POOL_SIZE = int(os.getenv('LINE_HTTP_POOL_SIZE', 10))
+LINE_HTTP_CONNECT_TIMEOUT = float(os.getenv('LINE_HTTP_CONNECT_TIMEOUT', 3))
+LINE_HTTP_READ_TIMEOUT = float(os.getenv('LINE_HTTP_READ_TIMEOUT', 10))
+LINE_HTTP_RETRIES = int(os.getenv('LINE_HTTP_RETRIES', 3))
+# 重試間隔：backoff * 2^(第幾次重試 - 1) 秒
+LINE_HTTP_BACKOFF = float(os.getenv('LINE_HTTP_BACKOFF', 0.5))
+
+LINE_HTTP_TIMEOUT = (LINE_HTTP_CONNECT_TIMEOUT, LINE_HTTP_READ_TIMEOUT)
+
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+# LINE Messaging API 地址，測試時可指向本地模擬服務
+LINE_API_ENDPOINT = os.getenv('LINE_API_ENDPOINT', 'https://api.line.me')
+
+# 指標標籤中把用戶、群組、聊天室 ID 替換為佔位符
+_ID_SEGMENT = re.compile(r'/[UCR][0-9a-f]{32}')
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_line_session():
+    """獲取當前進程的 LINE 會話（gunicorn fork 後重新創建）"""
+    global _session, _session_pid
+    pid = os.getpid()
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=LINE_HTTP_POOL_SIZE,
+                # 只在連接階段重試；5xx 由 line_request 按方法決定
+                max_retries=Retry(
+                    total=LINE_HTTP_RETRIES,
+                    connect=LINE_HTTP_RETRIES,
+                    read=0,
+                    status=0,
+                    backoff_factor=LINE_HTTP_BACKOFF
+                )
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+            _session_pid = pid
+    return _session
+
+def _endpoint_label(url):
+    path = requests.utils.urlparse(url).path
+    return _ID_SEGMENT.sub('/{id}', path) or '/'
+
+def line_request(method, url, retry_on_5xx=None, timeout=None, **kwargs):
+    """通過共享會話調用 LINE API
+
+    Args:
+        method: HTTP 方法
+        url: 完整 URL
+        retry_on_5xx: 5xx 時是否重試；默認只重試 GET
+        timeout: 超時，默認 (LINE_HTTP_CONNECT_TIMEOUT, LINE_HTTP_READ_TIMEOUT)
+        kwargs: 傳給 requests 的其他參數
+
+    Returns:
+        requests.Response
+    """
+    method = method.upper()
+    if retry_on_5xx is None:
+        retry_on_5xx = method == 'GET'
+    endpoint = _endpoint_label(url)
+    session = get_line_session()
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout or LINE_HTTP_TIMEOUT, **kwargs)
+        except requests.RequestException:
+            LINE_HTTP_REQUESTS.inc(labels=(endpoint, method, 'error'))
+            raise
+        finally:
+            LINE_HTTP_LATENCY.observe(time.perf_counter() - started, labels=(endpoint, method))
+        LINE_HTTP_REQUESTS.inc(labels=(endpoint, method, response.status_code))
+
+        if response.status_code < 500 or not retry_on_5xx or attempt >= LINE_HTTP_RETRIES:
+            return response
+        attempt += 1
+        delay = LINE_HTTP_BACKOFF * (2 ** (attempt - 1))
+        logger.warning("LINE API %s %s 返回 %s，%.1f 秒後重試（第 %s 次）",
+                       method, endpoint, response.status_code, delay, attempt)
+        response.close()
+        time.sleep(delay)
+
+class LineSessionHttpClient(HttpClient):
+    """供 LineBotApi 使用的 HttpClient，請求經過共享會話"""
+
+    def __init__(self, timeout=LINE_HTTP_TIMEOUT):
+        super().__init__(timeout)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = line_request('GET', url, headers=headers, params=params, stream=stream,
+                                timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        # reply/push 不是冪等操作，5xx 時不重試，避免用戶收到重複消息
+        response = line_request('POST', url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = line_request('DELETE', url, retry_on_5xx=True, headers=headers, data=data,
+                                timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        response = line_request('PUT', url, retry_on_5xx=True, headers=headers, data=data,
+                                timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+# 使用共享連接池、超時與重試的 Messaging API 客戶端
+line_bot_api = LineBotApi(
+    LINE_CHANNEL_ACCESS_TOKEN,
+    endpoint=LINE_API_ENDPOINT,
+    timeout=LINE_HTTP_TIMEOUT,
+    http_client=LineSessionHttpClient
+)
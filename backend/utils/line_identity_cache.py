@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+from backend.config.database import get_db_connection
+from backend.utils.lru_cache import LRUCache
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 緩存的 LINE 身份數
+LINE_IDENTITY_CACHE_SIZE = int(os.getenv('LINE_IDENTITY_CACHE_SIZE', 4096))
+# 已綁定身份的緩存秒數（版本號變更時會提前清空）
+LINE_IDENTITY_CACHE_TTL = float(os.getenv('LINE_IDENTITY_CACHE_TTL', 600))
+# 未綁定身份的緩存秒數，用戶完成綁定後最遲在此時間後生效
+LINE_IDENTITY_NEGATIVE_TTL = float(os.getenv('LINE_IDENTITY_NEGATIVE_TTL', 60))
+# 向資料庫確認綁定版本號的間隔（秒）；版本號由 line_users/line_groups/customers 上的觸發器維護
+LINE_IDENTITY_VERSION_CHECK = float(os.getenv('LINE_IDENTITY_VERSION_CHECK', 5))
+
+KIND_USER = 'user'
+KIND_GROUP = 'group'
+
+_UNBOUND = ()
+
+_RESOLVE_SQL = {
+    KIND_USER: """
+        SELECT c.id, c.company_name
+        FROM customers c
+        JOIN line_users lu ON c.id = lu.customer_id
+        WHERE lu.line_user_id = %s AND c.status = 'active'
+    """,
+    KIND_GROUP: """
+        SELECT c.id, c.company_name
+        FROM customers c
+        JOIN line_groups lg ON c.id = lg.customer_id
+        WHERE lg.line_group_id = %s AND c.status = 'active'
+    """
+}
+
+class LineIdentityCache:
+    """LINE 用戶/群組 ID 到綁定客戶的進程內緩存
+
+    未綁定的結果也會緩存（較短的過期時間），群組中的閒聊不會每條消息查詢一次資料庫。
+    其他進程修改綁定後，本進程最遲在 LINE_IDENTITY_VERSION_CHECK 秒後清空緩存。
+    """
+
+    def __init__(self, maxsize=LINE_IDENTITY_CACHE_SIZE, ttl=LINE_IDENTITY_CACHE_TTL,
+                 negative_ttl=LINE_IDENTITY_NEGATIVE_TTL, version_check=LINE_IDENTITY_VERSION_CHECK):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.version_check = version_check
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def _check_version(self):
+        """按間隔讀取綁定版本號，變更時清空緩存"""
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.version_check:
+                return
+            self._checked_at = time.monotonic()
+        try:
+            with get_db_connection() as conn:
+                version = self._fetch_version(conn.cursor())
+        except Exception as e:
+            # 讀取失敗時清空，寧可多查詢也不使用可能過期的綁定
+            logger.error("讀取 LINE 綁定緩存版本失敗: %s", str(e))
+            self._cache.clear()
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.debug("LINE 綁定版本變更 %s -> %s，清空緩存", self._version, version)
+                self._cache.clear()
+                self._version = version
+
+    @staticmethod
+    def _fetch_version(cursor):
+        cursor.execute("SELECT version FROM cache_versions WHERE name = 'line_bindings'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def resolve(self, kind, line_id):
+        """查詢 LINE 身份綁定的客戶
+
+        Args:
+            kind: KIND_USER 或 KIND_GROUP
+            line_id: line_user_id 或 line_group_id
+
+        Returns:
+            (customer_id, company_name)，未綁定時為 None
+        """
+        if not line_id:
+            return None
+        self._check_version()
+        key = (kind, line_id)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_RESOLVE_SQL[kind], (line_id,))
+            row = cursor.fetchone()
+        if row:
+            result = (row[0], row[1])
+            self._cache.set(key, result)
+            return result
+        self._cache.set(key, _UNBOUND, ttl=self.negative_ttl)
+        return None
+
+    def invalidate(self, kind=None, line_id=None):
+        """本進程修改綁定後調用；不帶參數時清空全部"""
+        if kind is None or line_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop((kind, line_id))
+
+    def invalidate_customer(self, customer_id, line_user_ids=(), line_group_ids=()):
+        """本進程修改客戶或其綁定後調用，只移除受影響的條目
+
+        Args:
+            customer_id: 客戶ID，移除所有綁定到該客戶的條目（名稱、狀態或綁定可能已變更）
+            line_user_ids: 新綁定的 LINE 用戶ID，移除其未綁定緩存
+            line_group_ids: 新綁定的 LINE 群組ID，移除其未綁定緩存
+        """
+        customer_id = int(customer_id)
+        self._cache.pop_where(lambda key, value: bool(value) and value[0] == customer_id)
+        for line_id in line_user_ids:
+            self._cache.pop((KIND_USER, line_id))
+        for line_id in line_group_ids:
+            self._cache.pop((KIND_GROUP, line_id))
+
+line_identity_cache = LineIdentityCache()
@@ -0,0 +1,200 @@
+"""訂單狀態變更的 LINE 主動推送
+
+訂單確認、出貨或批量修改狀態後調用 notify_order_status，訂單號先進入進程內的待發送集合，
+同一訂單在合併窗口內的多次變更只發送一條消息（內容取發送時的最新狀態）。
+後台線程按客戶分組，私聊用戶使用 multicast 一次發送給所有綁定用戶，群組逐個 push，
+所有請求都經過限速。
+"""
+import os
+import time
+import logging
+import threading
+
+from linebot.models import TextSendMessage
+from backend.config.database import get_db_connection
+from backend.utils.metrics import LINE_PUSH_REQUESTS, LINE_NOTIFY_PENDING
+from backend.utils.line_http import line_bot_api
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+LINE_ORDER_NOTIFY_ENABLED = os.getenv('LINE_ORDER_NOTIFY_ENABLED', 'true').lower() == 'true'
+# 合併窗口（秒）：訂單第一次變更後等待此時間再發送，期間的後續變更合併為一條消息
+LINE_NOTIFY_COALESCE_SECONDS = float(os.getenv('LINE_NOTIFY_COALESCE_SECONDS', 10))
+# 每秒最多發送的 LINE API 請求數
+LINE_PUSH_RATE_PER_SECOND = float(os.getenv('LINE_PUSH_RATE_PER_SECOND', 10))
+# multicast 單次最多 500 個用戶；每次請求最多 5 條消息
+LINE_MULTICAST_MAX_RECIPIENTS = 500
+LINE_MAX_MESSAGES_PER_REQUEST = 5
+LINE_TEXT_MAX_LENGTH = 5000
+
+_ORDERS_SQL = """
+    SELECT o.order_number, o.customer_id, o.order_confirmed, o.order_shipped,
+           string_agg(
+               p.name || ' x' || od.product_quantity || od.product_unit ||
+               ' (' || od.order_status || ')' ||
+               CASE WHEN od.shipping_date IS NOT NULL
+                    THEN ' 出貨日: ' || to_char(od.shipping_date, 'YYYY-MM-DD')
+                    ELSE '' END,
+               E'\\n' ORDER BY od.id
+           ) AS product_details,
+           bool_and(od.order_status = '已取消') AS all_cancelled
+    FROM orders o
+    JOIN order_details od ON o.id = od.order_id
+    JOIN products p ON od.product_id = p.id
+    JOIN customers c ON o.customer_id = c.id
+    WHERE o.order_number = ANY(%s) AND c.status = 'active'
+    GROUP BY o.id, o.order_number, o.customer_id, o.order_confirmed, o.order_shipped
+"""
+
+_RECIPIENTS_SQL = """
+    SELECT customer_id, 'user' AS kind, line_user_id FROM line_users WHERE customer_id = ANY(%s)
+    UNION ALL
+    SELECT customer_id, 'group' AS kind, line_group_id FROM line_groups WHERE customer_id = ANY(%s)
+"""
+
+class _RateLimiter:
+    """令牌桶限速"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+def _order_status_text(row):
+    if row['order_shipped']:
+        return '已出貨'
+    if row['order_confirmed']:
+        return '已駁回' if row['all_cancelled'] else '已確認'
+    return '處理中'
+
+def _build_message(row):
+    text = (
+        "📦 訂單狀態更新\n\n"
+        f"訂單編號：{row['order_number']}\n"
+        f"狀態：{_order_status_text(row)}\n"
+        f"訂購商品：\n{row['product_details']}"
+    )
+    # 文字消息上限 5000 字
+    return TextSendMessage(text=text[:LINE_TEXT_MAX_LENGTH])
+
+class OrderStatusNotifier:
+    """合併訂單狀態變更並批量推送到客戶綁定的 LINE 用戶與群組"""
+
+    def __init__(self, coalesce_seconds=LINE_NOTIFY_COALESCE_SECONDS, rate=LINE_PUSH_RATE_PER_SECOND):
+        self.coalesce_seconds = coalesce_seconds
+        self._limiter = _RateLimiter(rate)
+        self._pending = {}  # 訂單號 -> 第一次變更的時間
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def _ensure_started(self):
+        """啟動當前進程的發送線程（gunicorn fork 後重新創建）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._pending = {}
+        threading.Thread(target=self._run, name='line-order-notifier', daemon=True).start()
+
+    def notify(self, order_number):
+        """登記訂單狀態已變更，不阻塞請求"""
+        if not LINE_ORDER_NOTIFY_ENABLED or not order_number:
+            return
+        with self._condition:
+            self._ensure_started()
+            self._pending.setdefault(order_number, time.monotonic())
+            LINE_NOTIFY_PENDING.set(len(self._pending))
+            self._condition.notify()
+
+    def _take_due(self):
+        """等待並取出已過合併窗口的訂單號"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [number for number, since in self._pending.items()
+                       if now - since >= self.coalesce_seconds]
+                if due:
+                    for number in due:
+                        del self._pending[number]
+                    LINE_NOTIFY_PENDING.set(len(self._pending))
+                    return due
+                if self._pending:
+                    oldest = min(self._pending.values())
+                    self._condition.wait(max(0.0, oldest + self.coalesce_seconds - now))
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            order_numbers = self._take_due()
+            try:
+                self._send(order_numbers)
+            except Exception as e:
+                logger.exception("推送訂單狀態通知失敗: %s", str(e))
+
+    def _load(self, order_numbers):
+        """一次查詢所有訂單的最新狀態與客戶的 LINE 綁定"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_ORDERS_SQL, (order_numbers,))
+            columns = [desc[0] for desc in cursor.description]
+            orders = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            customer_ids = list({order['customer_id'] for order in orders})
+            recipients = {}
+            if customer_ids:
+                cursor.execute(_RECIPIENTS_SQL, (customer_ids, customer_ids))
+                for customer_id, kind, line_id in cursor.fetchall():
+                    entry = recipients.setdefault(customer_id, {'user': [], 'group': []})
+                    entry[kind].append(line_id)
+        return orders, recipients
+
+    def _send(self, order_numbers):
+        orders, recipients = self._load(order_numbers)
+        messages_by_customer = {}
+        for order in orders:
+            messages_by_customer.setdefault(order['customer_id'], []).append(_build_message(order))
+
+        for customer_id, messages in messages_by_customer.items():
+            targets = recipients.get(customer_id)
+            if not targets:
+                continue
+            for start in range(0, len(messages), LINE_MAX_MESSAGES_PER_REQUEST):
+                batch = messages[start:start + LINE_MAX_MESSAGES_PER_REQUEST]
+                users = targets['user']
+                for index in range(0, len(users), LINE_MULTICAST_MAX_RECIPIENTS):
+                    chunk = users[index:index + LINE_MULTICAST_MAX_RECIPIENTS]
+                    if len(chunk) == 1:
+                        self._call('push', line_bot_api.push_message, chunk[0], batch)
+                    else:
+                        self._call('multicast', line_bot_api.multicast, chunk, batch)
+                # 群組不支持 multicast，逐個推送
+                for group_id in targets['group']:
+                    self._call('push', line_bot_api.push_message, group_id, batch)
+
+        logger.info("已推送 %s 個訂單的狀態通知", len(orders))
+
+    def _call(self, kind, func, to, messages):
+        self._limiter.acquire()
+        try:
+            func(to, messages)
+            LINE_PUSH_REQUESTS.inc(labels=(kind, 'success'))
+        except Exception as e:
+            LINE_PUSH_REQUESTS.inc(labels=(kind, 'error'))
+            logger.error("LINE %s 失敗 (%s): %s", kind, to, str(e))
+
+order_status_notifier = OrderStatusNotifier()
+
+def notify_order_status(order_number):
+    """訂單狀態變更後調用，合併後推送給客戶綁定的 LINE 用戶與群組"""
+    order_status_notifier.notify(order_number)
@@ -0,0 +1,258 @@
+"""LINE webhook 事件的後台處理
+
+callback 只驗證簽名並把事件放入進程內的有界隊列，立即返回 200；
+事件由工作線程調用 WebhookHandler 上註冊的處理函數。
+
+- 同一來源（用戶、群組、聊天室）的事件固定分配給同一個工作線程，保證按順序處理
+- 按 webhookEventId 在 line_webhook_events 表中去重，LINE 重新投遞或多個 worker
+  收到同一事件時只處理一次，並記錄投遞次數
+- 隊列已滿時 callback 返回 503，由 LINE 的重新投遞機制稍後重試
+"""
+import os
+import time
+import zlib
+import queue
+import logging
+import threading
+
+from linebot.models import MessageEvent
+from backend.config.database import get_db_connection
+from backend.utils.scheduler import register_job
+from backend.utils.metrics import (
+    LINE_WEBHOOK_EVENTS,
+    LINE_WEBHOOK_REDELIVERIES,
+    LINE_WEBHOOK_QUEUE_DEPTH,
+    LINE_WEBHOOK_EVENT_LAG
+)
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 工作線程數
+LINE_WEBHOOK_WORKERS = int(os.getenv('LINE_WEBHOOK_WORKERS', 4))
+# 等待處理的事件總數上限（平均分配給各工作線程）
+LINE_WEBHOOK_QUEUE_SIZE = int(os.getenv('LINE_WEBHOOK_QUEUE_SIZE', 1000))
+# 處理中的記錄超過此時間（秒）仍未完成，視為進程已退出，允許重新投遞的事件再次處理
+LINE_WEBHOOK_CLAIM_TIMEOUT = int(os.getenv('LINE_WEBHOOK_CLAIM_TIMEOUT', 300))
+# 去重記錄保留天數
+LINE_WEBHOOK_EVENT_RETENTION_DAYS = int(os.getenv('LINE_WEBHOOK_EVENT_RETENTION_DAYS', 7))
+
+def _source_key(event):
+    """事件來源標識：群組、聊天室或用戶"""
+    source = getattr(event, 'source', None)
+    if source is None:
+        return ''
+    return (getattr(source, 'group_id', None) or getattr(source, 'room_id', None)
+            or getattr(source, 'user_id', None) or '')
+
+def _event_type(event):
+    return getattr(event, 'type', None) or event.__class__.__name__
+
+def _is_redelivery(event):
+    context = getattr(event, 'delivery_context', None)
+    return bool(context and getattr(context, 'is_redelivery', False))
+
+def _claim_event(event):
+    """登記事件並判斷是否由本次投遞處理
+
+    Returns:
+        bool: True 表示應處理；False 表示已處理過或正由其他進程處理
+    """
+    event_id = getattr(event, 'webhook_event_id', None)
+    if not event_id:
+        return True
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO line_webhook_events (webhook_event_id, event_type, source_id, is_redelivery)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (webhook_event_id) DO UPDATE
+            SET deliveries = line_webhook_events.deliveries + 1,
+                is_redelivery = line_webhook_events.is_redelivery OR EXCLUDED.is_redelivery
+            RETURNING (xmax = 0) AS inserted
+        """, (event_id, _event_type(event), _source_key(event) or None, _is_redelivery(event)))
+        claimed = cursor.fetchone()[0]
+        if not claimed:
+            # 只接管處理超時（原進程可能已退出）的記錄
+            cursor.execute("""
+                UPDATE line_webhook_events
+                SET received_at = NOW()
+                WHERE webhook_event_id = %s
+                  AND status = 'processing'
+                  AND received_at < NOW() - make_interval(secs => %s)
+            """, (event_id, LINE_WEBHOOK_CLAIM_TIMEOUT))
+            claimed = cursor.rowcount == 1
+        conn.commit()
+    return claimed
+
+def _finish_event(event, error=None):
+    event_id = getattr(event, 'webhook_event_id', None)
+    if not event_id:
+        return
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE line_webhook_events
+                SET status = %s, processed_at = NOW(), last_error = %s
+                WHERE webhook_event_id = %s
+            """, ('failed' if error else 'processed', error[:1000] if error else None, event_id))
+            conn.commit()
+    except Exception as e:
+        logger.error("更新 LINE 事件狀態失敗 %s: %s", event_id, str(e))
+
+def clean_webhook_events():
+    """刪除超過保留期的去重記錄"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM line_webhook_events WHERE received_at < NOW() - make_interval(days => %s)",
+            (LINE_WEBHOOK_EVENT_RETENTION_DAYS,)
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+    return deleted
+
+class LineEventDispatcher:
+    """把 LINE 事件分派到按來源分片的工作線程"""
+
+    def __init__(self, handler, workers=LINE_WEBHOOK_WORKERS, queue_size=LINE_WEBHOOK_QUEUE_SIZE):
+        """初始化事件分派器
+
+        Args:
+            handler: 已註冊處理函數的 linebot.WebhookHandler
+            workers: 工作線程數
+            queue_size: 等待處理的事件總數上限
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = max(self.workers, queue_size)
+        self._queues = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """啟動當前進程的工作線程（gunicorn fork 後重新創建）"""
+        pid = os.getpid()
+        with self._lock:
+            if self._queues is not None and self._pid == pid:
+                return self._queues
+            per_worker = self.queue_size // self.workers
+            self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+            self._pid = pid
+            for index, work_queue in enumerate(self._queues):
+                threading.Thread(
+                    target=self._run,
+                    args=(work_queue,),
+                    name=f'line-webhook-{index}',
+                    daemon=True
+                ).start()
+            return self._queues
+
+    def submit(self, payload):
+        """把已驗證簽名的事件放入隊列，不阻塞
+
+        Args:
+            payload: WebhookParser.parse(..., as_payload=True) 的返回值
+
+        Returns:
+            bool: 全部事件都已入隊時為 True；有事件因隊列已滿被拒絕時為 False
+        """
+        queues = self._ensure_started()
+        accepted = True
+        for event in payload.events:
+            event_type = _event_type(event)
+            key = _source_key(event)
+            work_queue = queues[zlib.crc32(key.encode('utf-8')) % len(queues)]
+            try:
+                work_queue.put_nowait((event, payload.destination))
+            except queue.Full:
+                LINE_WEBHOOK_EVENTS.inc(labels=(event_type, 'rejected'))
+                logger.warning("LINE 事件隊列已滿，拒絕事件 %s", getattr(event, 'webhook_event_id', None))
+                accepted = False
+                continue
+            LINE_WEBHOOK_QUEUE_DEPTH.inc()
+            LINE_WEBHOOK_EVENTS.inc(labels=(event_type, 'queued'))
+        return accepted
+
+    def _run(self, work_queue):
+        while True:
+            event, destination = work_queue.get()
+            LINE_WEBHOOK_QUEUE_DEPTH.dec()
+            try:
+                self._process(event, destination)
+            except Exception as e:
+                logger.exception("處理 LINE 事件時發生未預期錯誤: %s", str(e))
+            finally:
+                work_queue.task_done()
+
+    def _process(self, event, destination):
+        event_type = _event_type(event)
+        if _is_redelivery(event):
+            LINE_WEBHOOK_REDELIVERIES.inc(labels=(event_type,))
+
+        try:
+            claimed = _claim_event(event)
+        except Exception as e:
+            # 去重表不可用時仍然處理，寧可重複也不丟事件
+            logger.error("登記 LINE 事件失敗，跳過去重: %s", str(e))
+            claimed = True
+        if not claimed:
+            LINE_WEBHOOK_EVENTS.inc(labels=(event_type, 'duplicate'))
+            logger.info("跳過重複的 LINE 事件 %s", event.webhook_event_id)
+            return
+
+        timestamp = getattr(event, 'timestamp', None)
+        if timestamp:
+            LINE_WEBHOOK_EVENT_LAG.observe(max(0.0, time.time() - timestamp / 1000), labels=(event_type,))
+
+        func = self._find_handler(event)
+        if func is None:
+            _finish_event(event)
+            return
+        try:
+            self._invoke(func, event, destination)
+        except Exception as e:
+            LINE_WEBHOOK_EVENTS.inc(labels=(event_type, 'failed'))
+            logger.exception("LINE 事件處理失敗 %s: %s", event_type, str(e))
+            _finish_event(event, str(e))
+            return
+        LINE_WEBHOOK_EVENTS.inc(labels=(event_type, 'processed'))
+        _finish_event(event)
+
+    def _find_handler(self, event):
+        """按 WebhookHandler.handle 的規則查找處理函數"""
+        handlers = self.handler._handlers
+        func = None
+        if isinstance(event, MessageEvent):
+            func = handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = handlers.get(event.__class__.__name__)
+        return func or self.handler._default
+
+    @staticmethod
+    def _invoke(func, event, destination):
+        code = func.__code__
+        if code.co_flags & 0x04 or code.co_argcount == 2:  # 帶 *args 或接收 destination
+            func(event, destination)
+        elif code.co_argcount == 1:
+            func(event)
+        else:
+            func()
+
+    def join(self, timeout=None):
+        """等待隊列中的事件處理完畢（用於測試與平滑退出）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for work_queue in self._queues or []:
+            while work_queue.unfinished_tasks:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+        return True
+
+# 每天清理一次過期的去重記錄
+register_job(
+    'line_webhook_events_cleanup_job', clean_webhook_events,
+    'cron', hour=4, minute=15,
+    name='清理 LINE 事件去重記錄任務'
+)
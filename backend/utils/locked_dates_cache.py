@@ -0,0 +1,82 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from backend.config.database import get_db_connection
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 每隔多少秒向資料庫確認一次版本號；版本號由 locked_dates 上的觸發器維護，
+# 其他 worker 或調度任務修改後，本進程最遲在此間隔後重新加載
+LOCKED_DATES_CACHE_TTL = float(os.getenv('LOCKED_DATES_CACHE_TTL', 5))
+
+class LockedDatesCache:
+    """進程內的鎖定日期緩存
+
+    保存按日期排序的記錄與日期數組，範圍查詢用二分查找，O(log n) 定位區間。
+    """
+
+    def __init__(self, ttl=LOCKED_DATES_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = None
+        self._rows = []
+        self._dates = []
+        self._checked_at = 0.0
+
+    def _fetch_version(self, cursor):
+        cursor.execute("SELECT version FROM cache_versions WHERE name = 'locked_dates'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _refresh(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            version = self._fetch_version(cursor)
+            if version != self._version:
+                cursor.execute("""
+                    SELECT id, locked_date, created_at
+                    FROM locked_dates
+                    ORDER BY locked_date ASC
+                """)
+                columns = [desc[0] for desc in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                self._rows = rows
+                self._dates = [row['locked_date'] for row in rows]
+                self._version = version
+                logger.debug("已重新加載鎖定日期緩存，版本 %s，共 %s 個日期", version, len(rows))
+            cursor.close()
+        self._checked_at = time.monotonic()
+
+    def snapshot(self):
+        """獲取當前版本號、記錄與日期數組（必要時刷新）"""
+        with self._lock:
+            if self._version is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._refresh()
+            return self._version, self._rows, self._dates
+
+    def get_range(self, start=None, end=None):
+        """獲取 [start, end] 區間內的鎖定日期記錄
+
+        Returns:
+            (版本號, 記錄列表)
+        """
+        version, rows, dates = self.snapshot()
+        low = bisect.bisect_left(dates, start) if start else 0
+        high = bisect.bisect_right(dates, end) if end else len(dates)
+        return version, rows[low:high]
+
+    def is_locked(self, day):
+        _, _, dates = self.snapshot()
+        index = bisect.bisect_left(dates, day)
+        return index < len(dates) and dates[index] == day
+
+    def invalidate(self):
+        """本進程內的修改後調用，下次讀取時立即重新加載"""
+        with self._lock:
+            self._version = None
+            self._checked_at = 0.0
+
+locked_dates_cache = LockedDatesCache()
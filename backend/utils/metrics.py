@@ -0,0 +1,259 @@
+import os
+import threading
+from bisect import bisect_left
+
+# 輕量級 Prometheus 指標實現，避免引入額外依賴。
+# 每個 gunicorn worker 各自持有一份指標，可通過 process_worker_pid 區分。
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def header(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}'
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    """單調遞增計數器"""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+class Gauge(_Metric):
+    """可增可減的瞬時值，也可以傳入回調在抓取時計算"""
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def set(self, value, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def value(self, labels=()):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        if self._callback is not None:
+            try:
+                self.set(self._callback())
+            except Exception:
+                pass
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+class Histogram(_Metric):
+    """累積分佈直方圖"""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [各桶計數..., +Inf 桶, 總和]
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def count(self, labels=()):
+        entry = self._values.get(self._key(labels))
+        return sum(entry[:-1]) if entry else 0
+
+    def collect(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        lines = self.header()
+        for key, entry in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), entry[:-1]):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_number(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_number(entry[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    """指標註冊表，負責輸出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+# 當前 worker 進程號，用於區分多個 gunicorn worker 的數據
+REGISTRY.gauge('process_worker_pid', '當前 worker 進程號', callback=os.getpid)
+
+# HTTP 請求指標
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP 請求總數', ('endpoint', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP 請求耗時', ('endpoint', 'method'))
+
+# 資料庫指標
+DB_QUERIES = REGISTRY.counter(
+    'db_queries_total', 'SQL 執行次數', ('endpoint',))
+DB_TIME = REGISTRY.counter(
+    'db_query_seconds_total', 'SQL 執行總耗時', ('endpoint',))
+DB_ROWS = REGISTRY.counter(
+    'db_rows_fetched_total', '讀取的資料行數', ('endpoint',))
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    'db_queries_per_request', '每個請求的 SQL 次數', ('endpoint',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+DB_POOL_CHECKOUTS = REGISTRY.counter(
+    'db_pool_checkouts_total', '連接池取出連接次數')
+DB_POOL_WAIT = REGISTRY.histogram(
+    'db_pool_wait_seconds', '從連接池取出連接的等待時間',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 3.0))
+
+# 郵件指標
+EMAIL_QUEUE_DEPTH = REGISTRY.gauge(
+    'email_queue_depth', '排隊或發送中的郵件數')
+EMAILS_SENT = REGISTRY.counter(
+    'emails_sent_total', '郵件發送結果', ('result',))
+
+# 調度任務指標
+SCHEDULER_JOB_DURATION = REGISTRY.histogram(
+    'scheduler_job_duration_seconds', '調度任務執行耗時', ('job',),
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+SCHEDULER_JOB_FAILURES = REGISTRY.counter(
+    'scheduler_job_failures_total', '調度任務失敗次數', ('job',))
+SCHEDULER_JOB_RUNS = REGISTRY.counter(
+    'scheduler_job_runs_total', '調度任務執行次數', ('job',))
+SCHEDULER_JOB_LAST_SUCCESS = REGISTRY.gauge(
+    'scheduler_job_last_success_timestamp_seconds', '調度任務最近一次成功完成的時間', ('job',))
+SCHEDULER_IS_LEADER = REGISTRY.gauge(
+    'scheduler_is_leader', '本進程是否為執行調度任務的領導者')
+
+# LINE webhook 事件處理指標
+LINE_WEBHOOK_EVENTS = REGISTRY.counter(
+    'line_webhook_events_total', 'LINE webhook 事件數', ('event_type', 'result'))
+LINE_WEBHOOK_REDELIVERIES = REGISTRY.counter(
+    'line_webhook_redeliveries_total', 'LINE 重新投遞的 webhook 事件數', ('event_type',))
+LINE_WEBHOOK_QUEUE_DEPTH = REGISTRY.gauge(
+    'line_webhook_queue_depth', '等待處理的 LINE webhook 事件數')
+LINE_WEBHOOK_EVENT_LAG = REGISTRY.histogram(
+    'line_webhook_event_lag_seconds', 'LINE 事件從發生到開始處理的延遲', ('event_type',))
+LINE_PUSH_REQUESTS = REGISTRY.counter(
+    'line_push_requests_total', 'LINE 主動推送請求數', ('kind', 'result'))
+LINE_NOTIFY_PENDING = REGISTRY.gauge(
+    'line_notify_pending_orders', '等待合併推送的訂單數')
+LINE_HTTP_REQUESTS = REGISTRY.counter(
+    'line_http_requests_total', 'LINE API 請求數', ('endpoint', 'method', 'status'))
+LINE_HTTP_LATENCY = REGISTRY.histogram(
+    'line_http_request_duration_seconds', 'LINE API 請求耗時', ('endpoint', 'method'))
+
+# 訂單變更推送指標
+ORDER_EVENT_SUBSCRIBERS = REGISTRY.gauge(
+    'order_event_subscribers', '當前訂閱訂單變更的 SSE 連接數')
+ORDER_EVENTS_BROADCAST = REGISTRY.counter(
+    'order_events_broadcast_total', '已分發的訂單變更事件數')
+
+# 下單冪等鍵指標
+ORDER_IDEMPOTENCY_REQUESTS = REGISTRY.counter(
+    'order_idempotency_requests_total', '帶冪等鍵的下單請求結果', ('result',))
+
+def observe_request(endpoint, method, status, latency, stats=None):
+    """記錄一個請求的 HTTP 與資料庫指標"""
+    endpoint = endpoint or 'unknown'
+    HTTP_REQUESTS.inc(labels=(endpoint, method, status))
+    HTTP_LATENCY.observe(latency, labels=(endpoint, method))
+    if stats:
+        DB_QUERIES.inc(stats['db_queries'], labels=(endpoint,))
+        DB_TIME.inc(stats['db_time'], labels=(endpoint,))
+        DB_ROWS.inc(stats['db_rows'], labels=(endpoint,))
+        DB_QUERIES_PER_REQUEST.observe(stats['db_queries'], labels=(endpoint,))
@@ -0,0 +1,298 @@
+"""訂單變更事件的 LISTEN/NOTIFY 廣播
+
+每個 worker 只持有一個監聽連接（不佔用連接池），收到 order_changes 通知後批量查詢一次
+游標之後的變更行最新內容，再分發給本進程中所有 SSE 訂閱者。
+
+游標與增量同步令牌相同，是資料庫快照的 xmin：小於游標的事務都已結束，其事件都已送出。
+事件 ID 由序列分配，事務提交順序與 ID 順序不一致，按 ID 續傳會漏掉晚提交的事件。
+
+- SSE 的 id 為游標，訂閱時帶上 Last-Event-ID，先補發之後的事件再接收實時事件
+- 監聽連接斷開後自動重連，並從游標補查斷線期間的變更
+- 訂閱者消費過慢、隊列已滿時斷開該訂閱，由客戶端重新加載後再訂閱
+- 游標附近的事件可能重複送出，客戶端按事件 ID 忽略即可
+"""
+import os
+import time
+import queue
+import select
+import logging
+import threading
+
+from backend.config.database import get_db_connection, create_dedicated_connection
+from backend.utils.scheduler import register_job
+from backend.utils.metrics import ORDER_EVENT_SUBSCRIBERS, ORDER_EVENTS_BROADCAST
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = 'order_changes'
+# 每個訂閱者最多積壓的事件數
+ORDER_EVENTS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv('ORDER_EVENTS_SUBSCRIBER_QUEUE_SIZE', 1000))
+# 續傳時最多補發的事件數，超過時要求客戶端重新加載
+ORDER_EVENTS_MAX_BACKLOG = int(os.getenv('ORDER_EVENTS_MAX_BACKLOG', 2000))
+# 變更日誌保留天數
+ORDER_EVENTS_RETENTION_DAYS = int(os.getenv('ORDER_EVENTS_RETENTION_DAYS', 7))
+# 監聽連接斷開後的重連間隔（秒）
+ORDER_EVENTS_RECONNECT_SECONDS = float(os.getenv('ORDER_EVENTS_RECONNECT_SECONDS', 5))
+
+# 訂單行增量：與 /orders/pending 的字段一致，刪除事件中明細字段為空
+_EVENTS_SQL = """
+    SELECT e.id, e.txid, e.table_name, e.op, e.order_id, e.order_number, e.detail_id, e.customer_id,
+           e.changed_at,
+           o.created_at AS date,
+           o.order_confirmed,
+           o.order_shipped,
+           c.company_name AS customer,
+           p.name AS item,
+           od.product_quantity AS quantity,
+           od.product_unit AS unit,
+           od.order_status AS status,
+           od.shipping_date,
+           od.remark,
+           od.supplier_note
+    FROM order_change_events e
+    LEFT JOIN orders o ON o.id = e.order_id
+    LEFT JOIN customers c ON c.id = o.customer_id
+    LEFT JOIN order_details od ON od.id = e.detail_id
+    LEFT JOIN products p ON p.id = od.product_id
+"""
+
+# 重新加載信號：訂閱者錯過了事件，需要重新獲取完整列表
+RESET = object()
+
+def _format_event(row):
+    event = dict(row)
+    event['deleted'] = event['op'] == 'DELETE' or (event['detail_id'] is not None and event['item'] is None)
+    for key in ('changed_at', 'date'):
+        if event[key]:
+            event[key] = event[key].strftime('%Y-%m-%d %H:%M:%S')
+    if event['shipping_date']:
+        event['shipping_date'] = event['shipping_date'].strftime('%Y-%m-%d')
+    return event
+
+def current_token(cursor):
+    """當前快照的 xmin，與 OrderSyncService.current_token 一致"""
+    cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+    return cursor.fetchone()[0]
+
+def fetch_events(cursor, since_txid, limit=None):
+    """查詢游標之後的變更事件及對應行的最新內容
+
+    先取新游標再查詢：小於新游標的事務在查詢前都已結束，其事件必在結果中；
+    txid 不小於新游標但已提交的事件也會返回，下次查詢時再次出現。
+
+    Args:
+        cursor: 資料庫游標
+        since_txid: 上次的游標，返回 txid 不小於此值的事件
+        limit: 最多返回條數
+
+    Returns:
+        (新游標, 事件列表)；事件超過 limit 條或已被清理時事件列表為 None
+    """
+    token = current_token(cursor)
+    cursor.execute("SELECT purged_txid FROM order_sync_state WHERE name = 'order_change_events'")
+    row = cursor.fetchone()
+    if row and since_txid <= row[0]:
+        return token, None
+
+    limit = limit or ORDER_EVENTS_MAX_BACKLOG
+    cursor.execute(_EVENTS_SQL + " WHERE e.txid >= %s ORDER BY e.id LIMIT %s", (since_txid, limit + 1))
+    columns = [desc[0] for desc in cursor.description]
+    rows = cursor.fetchall()
+    if len(rows) > limit:
+        return token, None
+    return token, [_format_event(dict(zip(columns, row))) for row in rows]
+
+def _with_resume_tokens(events, since_txid, token):
+    """為每個事件附上續傳游標：只有一批中的最後一個事件帶新游標，中途斷線時從舊游標重新補發"""
+    last = len(events) - 1
+    return [dict(event, sync_token=token if i == last else since_txid) for i, event in enumerate(events)]
+
+def clean_order_change_events():
+    """刪除超過保留期的變更日誌，並記錄已清理的最大 txid 供增量同步判斷令牌是否過期"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            WITH purged AS (
+                DELETE FROM order_change_events
+                WHERE changed_at < NOW() - make_interval(days => %s)
+                RETURNING txid
+            ), state AS (
+                INSERT INTO order_sync_state (name, purged_txid, updated_at)
+                SELECT 'order_change_events', max(txid), NOW() FROM purged
+                HAVING max(txid) IS NOT NULL
+                ON CONFLICT (name) DO UPDATE
+                SET purged_txid = GREATEST(order_sync_state.purged_txid, EXCLUDED.purged_txid),
+                    updated_at = NOW()
+            )
+            SELECT count(*) FROM purged
+        """, (ORDER_EVENTS_RETENTION_DAYS,))
+        deleted = cursor.fetchone()[0]
+        conn.commit()
+    return deleted
+
+class Subscription:
+    """單個 SSE 連接的事件隊列"""
+
+    def __init__(self, broadcaster):
+        self._broadcaster = broadcaster
+        self.queue = queue.Queue(maxsize=ORDER_EVENTS_SUBSCRIBER_QUEUE_SIZE)
+        # 收到 RESET 時的游標，客戶端重新加載後從此處續傳
+        self.reset_token = None
+
+    def get(self, timeout):
+        """取下一個事件；超時返回 None，錯過事件時返回 RESET"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+class OrderEventBroadcaster:
+    """每個進程一個監聽線程，把訂單變更分發給所有訂閱者"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cursor = None
+        # 已送出且 txid 不小於游標的事件：event id -> txid，下次補查時跳過
+        self._delivered = {}
+
+    def _ensure_started(self):
+        """啟動當前進程的監聽線程（gunicorn fork 後重新創建）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._subscribers = set()
+        self._cursor = None
+        self._delivered = {}
+        threading.Thread(target=self._run, name='order-events-listener', daemon=True).start()
+
+    def subscribe(self, since_txid=None):
+        """訂閱訂單變更
+
+        Args:
+            since_txid: 客戶端最後收到的游標（Last-Event-ID）；提供時先補發之後的事件
+
+        Returns:
+            (Subscription, 補發的事件列表)；補發事件過多時列表為 [RESET]
+        """
+        subscription = Subscription(self)
+        with self._lock:
+            self._ensure_started()
+            self._subscribers.add(subscription)
+            ORDER_EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+        backlog = []
+        if since_txid is not None:
+            # 先登記訂閱再查詢補發事件，之間到達的事件可能重複，客戶端按 ID 忽略即可
+            with get_db_connection() as conn:
+                token, events = fetch_events(conn.cursor(), since_txid)
+            if events is None:
+                subscription.reset_token = token
+                backlog = [RESET]
+            else:
+                backlog = _with_resume_tokens(events, since_txid, token)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            ORDER_EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+    def _catch_up(self, cursor):
+        """查詢游標之後的事件並分發，跳過已送出的事件"""
+        token, events = fetch_events(cursor, self._cursor)
+        if events is None:
+            self._reset_all(token)
+            return
+        since_txid = self._cursor
+        events = [event for event in events if event['id'] not in self._delivered]
+        for event in events:
+            self._delivered[event['id']] = event['txid']
+        self._delivered = {event_id: txid for event_id, txid in self._delivered.items() if txid >= token}
+        self._cursor = token
+        self._broadcast(_with_resume_tokens(events, since_txid, token))
+
+    def _broadcast(self, events):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # 消費過慢：清空隊列並要求重新加載
+                    self._reset_subscriber(subscription, self._cursor)
+                    break
+        ORDER_EVENTS_BROADCAST.inc(len(events))
+
+    def _reset_all(self, token):
+        """錯過的事件過多，通知所有訂閱者重新加載"""
+        self._cursor = token
+        self._delivered = {}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            self._reset_subscriber(subscription, token)
+
+    @staticmethod
+    def _reset_subscriber(subscription, token):
+        subscription.reset_token = token
+        try:
+            while True:
+                subscription.queue.get_nowait()
+        except queue.Empty:
+            pass
+        subscription.queue.put_nowait(RESET)
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = create_dedicated_connection()
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {ORDER_EVENTS_CHANNEL}")
+                logger.info("進程 %s 開始監聽訂單變更", os.getpid())
+
+                if self._cursor is None:
+                    # 首次啟動：LISTEN 之後取游標，之後提交的事件都會收到通知
+                    self._cursor = current_token(cursor)
+                else:
+                    # 重連後補查斷線期間的變更
+                    self._catch_up(cursor)
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if not conn.notifies:
+                        continue
+                    # 通知內容只作為喚醒信號，按游標查詢，不依賴事件 ID 順序
+                    conn.notifies.clear()
+                    self._catch_up(cursor)
+            except Exception as e:
+                logger.error("訂單變更監聽中斷，%s 秒後重連: %s", ORDER_EVENTS_RECONNECT_SECONDS, str(e))
+            finally:
+                if conn is not None and not conn.closed:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(ORDER_EVENTS_RECONNECT_SECONDS)
+
+order_event_broadcaster = OrderEventBroadcaster()
+
+# 每天清理一次過期的變更日誌
+register_job(
+    'order_change_events_cleanup_job', clean_order_change_events,
+    'cron', hour=4, minute=45,
+    name='清理訂單變更日誌任務'
+)
@@ -0,0 +1,138 @@
+"""下單請求的冪等鍵
+
+客戶端在 Idempotency-Key header 中為每次下單生成唯一的鍵，網絡重試時帶上同一個鍵：
+
+- 第一次請求在下單事務中登記鍵（主鍵唯一約束），提交時一併保存響應
+- 重試請求先查進程內的響應緩存，未命中時按主鍵查詢，直接返回保存的響應，
+  不會重複插入訂單、發送郵件或記錄日誌；兩處都先比對請求內容摘要
+- 同一個鍵的請求仍在處理時立即返回 409，不排隊等待
+"""
+import os
+import json
+import hashlib
+import logging
+
+from backend.config.database import get_db_connection
+from backend.utils.lru_cache import LRUCache
+from backend.utils.scheduler import register_job
+from backend.utils.metrics import ORDER_IDEMPOTENCY_REQUESTS
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+# 進程內響應緩存的秒數，覆蓋客戶端短時間內的連續重試
+ORDER_IDEMPOTENCY_CACHE_TTL = float(os.getenv('ORDER_IDEMPOTENCY_CACHE_TTL', 300))
+ORDER_IDEMPOTENCY_CACHE_SIZE = int(os.getenv('ORDER_IDEMPOTENCY_CACHE_SIZE', 2048))
+# 資料庫中冪等鍵的保留小時數
+ORDER_IDEMPOTENCY_RETENTION_HOURS = int(os.getenv('ORDER_IDEMPOTENCY_RETENTION_HOURS', 24))
+# 同一個鍵並發處理時使用的 advisory lock 鍵
+ORDER_IDEMPOTENCY_LOCK_KEY = 72450004
+
+_response_cache = LRUCache(maxsize=ORDER_IDEMPOTENCY_CACHE_SIZE, ttl=ORDER_IDEMPOTENCY_CACHE_TTL)
+
+class IdempotencyConflict(Exception):
+    """冪等鍵正在使用中或與請求內容不符"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def request_hash(data):
+    """請求內容的摘要，用於識別以同一個鍵提交的不同請求"""
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_cached_response(customer_id, key, req_hash):
+    """進程內緩存的響應，返回 (狀態碼, 響應內容)，未命中時為 None
+
+    Raises:
+        IdempotencyConflict: 鍵已用於不同的請求內容
+    """
+    cached = _response_cache.get((str(customer_id), key))
+    if cached is None:
+        return None
+    stored_hash, status, body = cached
+    if stored_hash != req_hash:
+        ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('mismatch',))
+        raise IdempotencyConflict('冪等鍵已用於其他訂單請求', 422)
+    ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('replayed_cache',))
+    return status, body
+
+def claim(cursor, customer_id, key, req_hash):
+    """在當前事務中登記冪等鍵
+
+    Returns:
+        None 表示首次請求，調用方繼續下單並在提交前調用 complete；
+        已處理過時返回保存的 (狀態碼, 響應內容)
+
+    Raises:
+        IdempotencyConflict: 同一個鍵的請求正在處理，或鍵已用於不同的請求內容
+    """
+    # 不等待持有同一個鍵的事務，立即返回衝突
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))",
+                   (ORDER_IDEMPOTENCY_LOCK_KEY, f"{customer_id}:{key}"))
+    if not cursor.fetchone()[0]:
+        ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('in_progress',))
+        raise IdempotencyConflict('相同的訂單請求正在處理中，請稍後再試', 409)
+
+    cursor.execute("""
+        INSERT INTO order_idempotency_keys (customer_id, idempotency_key, request_hash)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (customer_id, idempotency_key) DO NOTHING
+        RETURNING customer_id
+    """, (customer_id, key, req_hash))
+    if cursor.fetchone():
+        ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('new',))
+        return None
+
+    cursor.execute("""
+        SELECT request_hash, response_status, response_body
+        FROM order_idempotency_keys
+        WHERE customer_id = %s AND idempotency_key = %s
+    """, (customer_id, key))
+    stored_hash, status, body = cursor.fetchone()
+    if stored_hash != req_hash:
+        ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('mismatch',))
+        raise IdempotencyConflict('冪等鍵已用於其他訂單請求', 422)
+    if status is None:
+        # 登記與響應在同一事務中提交，正常不會出現
+        ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('in_progress',))
+        raise IdempotencyConflict('相同的訂單請求正在處理中，請稍後再試', 409)
+
+    ORDER_IDEMPOTENCY_REQUESTS.inc(labels=('replayed',))
+    _response_cache.set((str(customer_id), key), (stored_hash, status, body))
+    return status, body
+
+def complete(cursor, customer_id, key, order_id, status, body):
+    """保存首次請求的響應，與訂單在同一事務中提交"""
+    cursor.execute("""
+        UPDATE order_idempotency_keys
+        SET order_id = %s, response_status = %s, response_body = %s
+        WHERE customer_id = %s AND idempotency_key = %s
+    """, (order_id, status, json.dumps(body, ensure_ascii=False), customer_id, key))
+
+def remember(customer_id, key, req_hash, status, body):
+    """事務提交後把響應與請求摘要放入進程內緩存"""
+    _response_cache.set((str(customer_id), key), (req_hash, status, body))
+
+def clean_idempotency_keys():
+    """刪除超過保留期的冪等鍵"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM order_idempotency_keys WHERE created_at < NOW() - make_interval(hours => %s)",
+            (ORDER_IDEMPOTENCY_RETENTION_HOURS,)
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+    return deleted
+
+# 每小時清理一次過期的冪等鍵
+register_job(
+    'order_idempotency_cleanup_job', clean_idempotency_keys,
+    'interval', hours=1,
+    name='清理下單冪等鍵任務'
+)
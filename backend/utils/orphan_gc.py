@@ -0,0 +1,321 @@
+"""孤立文件回收
+
+把存儲中的文件（本地 uploads 目錄或 Azure 容器）與資料庫中 products.image_url /
+dm_url 引用的路徑比對，超過寬限期且未被引用的文件按配置刪除或移入隔離區。
+
+存儲列表與引用路徑都按字節序排序後做歸併比較，內存只保留當前產品目錄的引用，
+不需要把整個容器或整張表讀入內存。每次執行最多掃描 FILE_GC_PAGE_LIMIT 個文件，
+進度保存在 file_gc_state 表中，下次從斷點繼續。
+
+用法::
+
+    python -m backend.utils.orphan_gc [--dry-run | --apply] [--full] [--action quarantine|delete]
+"""
+import os
+import re
+import sys
+import shutil
+import logging
+import argparse
+import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config.database import get_db_connection
+from backend.utils.file_handlers import UPLOAD_FOLDER, USE_AZURE_STORAGE
+from backend.utils.file_cleanup import schedule_file_deletion
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 文件最後修改時間早於此寬限期才會被視為孤立文件（剛上傳、產品尚未保存的文件不受影響）
+FILE_GC_GRACE_HOURS = float(os.getenv('FILE_GC_GRACE_HOURS', 72))
+# 每次執行最多掃描的文件數
+FILE_GC_PAGE_LIMIT = int(os.getenv('FILE_GC_PAGE_LIMIT', 5000))
+# 處理方式：quarantine 移入隔離區，delete 登記刪除
+FILE_GC_ACTION = os.getenv('FILE_GC_ACTION', 'quarantine')
+# 默認只輸出報告，確認無誤後設為 false
+FILE_GC_DRY_RUN = os.getenv('FILE_GC_DRY_RUN', 'true').lower() == 'true'
+# 報告中列出的孤立文件數上限
+FILE_GC_REPORT_LIMIT = int(os.getenv('FILE_GC_REPORT_LIMIT', 200))
+# 隔離區：本地為 uploads 同級目錄，Azure 為容器內前綴
+FILE_GC_QUARANTINE_FOLDER = os.getenv(
+    'FILE_GC_QUARANTINE_FOLDER', os.path.join(os.path.dirname(UPLOAD_FOLDER), 'uploads_quarantine')
+)
+AZURE_QUARANTINE_PREFIX = '_quarantine/'
+
+# 衍生圖：原圖主體__尺寸.擴展名，隨原圖一起視為被引用
+_DERIVATIVE = re.compile(r'^(?P<stem>.+)__(?:thumb|card|full)\.(?:webp|jpg)$')
+
+def _storage():
+    return 'azure' if USE_AZURE_STORAGE else 'local'
+
+def _referenced_paths(conn, start_after):
+    """按字節序流式讀取被引用的存儲路徑（服務器端游標，分批取回）
+
+    從斷點所在目錄的開頭讀起，以便跨頁時仍能識別該目錄中被引用原圖的衍生圖。
+    """
+    start_after = f"{start_after.rsplit('/', 1)[0]}/" if '/' in start_after else ''
+    if USE_AZURE_STORAGE:
+        path_expr = "regexp_replace({col}, '^https?://[^/]+/[^/]+/', '')"
+        pattern = 'http%'
+    else:
+        path_expr = "regexp_replace({col}, '^.*/uploads/', '')"
+        pattern = '%/uploads/%'
+
+    cursor = conn.cursor(name='file_gc_references')
+    cursor.itersize = 1000
+    cursor.execute(f"""
+        SELECT path FROM (
+            SELECT {path_expr.format(col='image_url')} AS path FROM products WHERE image_url LIKE %s
+            UNION
+            SELECT {path_expr.format(col='dm_url')} AS path FROM products WHERE dm_url LIKE %s
+        ) refs
+        WHERE path COLLATE "C" >= %s
+        ORDER BY path COLLATE "C"
+    """, (pattern, pattern, start_after))
+    for (path,) in cursor:
+        yield path
+
+def _walk_local(folder, prefix=''):
+    """按完整相對路徑的字節序遍歷本地文件
+
+    目錄以「名稱/」參與排序，保證輸出順序與資料庫 COLLATE "C" 排序一致。
+    """
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return
+    keyed = []
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            keyed.append((f"{entry.name}/", entry))
+        elif entry.is_file(follow_symlinks=False):
+            keyed.append((entry.name, entry))
+    keyed.sort(key=lambda item: item[0])
+    for key, entry in keyed:
+        if key.endswith('/'):
+            yield from _walk_local(entry.path, prefix + key)
+        else:
+            stat = entry.stat()
+            modified = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+            yield prefix + key, stat.st_size, modified
+
+def _walk_azure(start_after):
+    """按字節序列出斷點之後的 Blob
+
+    先列出頂層目錄（產品文件夾），斷點之前的目錄直接跳過，其餘目錄用 name_starts_with
+    分別列出，不會每次從容器開頭列出全部文件。
+    """
+    from azure.storage.blob import BlobPrefix
+    from backend.utils.azure_storage import get_blob_service_client, container_name
+    container_client = get_blob_service_client().get_container_client(container_name)
+
+    for item in container_client.walk_blobs(delimiter='/'):
+        if not isinstance(item, BlobPrefix):
+            if item.name > start_after:
+                yield item
+            continue
+        prefix = item.name
+        if prefix == AZURE_QUARANTINE_PREFIX:
+            continue
+        # 目錄中所有路徑都以 prefix 開頭，prefix 在斷點之前且不包含斷點時整個目錄都已掃描過
+        if prefix < start_after and not start_after.startswith(prefix):
+            continue
+        for blob in container_client.list_blobs(name_starts_with=prefix):
+            if blob.name > start_after:
+                yield blob
+
+def _list_storage(start_after, limit):
+    """按字節序列出存儲中的文件，從 start_after 之後開始，最多 limit 個
+
+    Returns:
+        生成器，產出 (路徑, 大小, 最後修改時間)
+    """
+    count = 0
+    if USE_AZURE_STORAGE:
+        for blob in _walk_azure(start_after):
+            yield blob.name, blob.size, blob.last_modified
+            count += 1
+            if count >= limit:
+                return
+    else:
+        for path, size, modified in _walk_local(UPLOAD_FOLDER):
+            if path <= start_after:
+                continue
+            yield path, size, modified
+            count += 1
+            if count >= limit:
+                return
+
+def find_orphans(conn, start_after='', limit=None):
+    """歸併比較存儲列表與引用路徑，找出未被引用的文件
+
+    Returns:
+        (孤立文件生成器, 狀態 dict)。狀態中的 last_path 在生成器耗盡後為本次掃描到的最後一個路徑
+    """
+    limit = limit or FILE_GC_PAGE_LIMIT
+    state = {'scanned': 0, 'last_path': None}
+
+    def generate():
+        references = _referenced_paths(conn, start_after)
+        next_ref = next(references, None)
+        folder = None
+        folder_stems = set()
+
+        for path, size, modified in _list_storage(start_after, limit):
+            state['scanned'] += 1
+            state['last_path'] = path
+
+            current_folder = path.rsplit('/', 1)[0] if '/' in path else ''
+            if current_folder != folder:
+                folder = current_folder
+                folder_stems = set()
+
+            # 推進引用流，記錄當前目錄中被引用文件的主體名，用於匹配衍生圖
+            while next_ref is not None and next_ref < path:
+                if next_ref.startswith(f"{folder}/"):
+                    folder_stems.add(os.path.splitext(next_ref)[0])
+                next_ref = next(references, None)
+
+            if next_ref == path:
+                folder_stems.add(os.path.splitext(path)[0])
+                continue
+
+            derivative = _DERIVATIVE.match(path)
+            if derivative and derivative.group('stem') in folder_stems:
+                continue
+
+            yield path, size, modified
+
+    return generate(), state
+
+def _quarantine(path):
+    """把孤立文件移入隔離區，保留原相對路徑"""
+    if USE_AZURE_STORAGE:
+        from backend.utils.azure_storage import get_blob_service_client, container_name
+        client = get_blob_service_client()
+        source = client.get_blob_client(container=container_name, blob=path)
+        target = client.get_blob_client(container=container_name, blob=AZURE_QUARANTINE_PREFIX + path)
+        copy = target.start_copy_from_url(source.url)
+        # 同一帳戶內複製通常同步完成；未完成時留待下次執行
+        if copy.get('copy_status') != 'success':
+            return False
+        schedule_file_deletion(path)
+        return True
+
+    source = os.path.join(UPLOAD_FOLDER, path)
+    target = os.path.join(FILE_GC_QUARANTINE_FOLDER, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(source, target)
+    return True
+
+def _load_cursor(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT last_path FROM file_gc_state WHERE storage = %s", (_storage(),))
+    row = cursor.fetchone()
+    return row[0] if row else ''
+
+def _save_cursor(conn, last_path):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO file_gc_state (storage, last_path, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (storage) DO UPDATE
+        SET last_path = EXCLUDED.last_path, updated_at = NOW()
+    """, (_storage(), last_path))
+    conn.commit()
+
+def collect_orphaned_files(dry_run=None, full=False, action=None):
+    """執行一輪孤立文件回收
+
+    Args:
+        dry_run: 只統計與報告，不做任何修改；默認取 FILE_GC_DRY_RUN
+        full: 忽略斷點，從頭掃描全部文件
+        action: 'quarantine' 或 'delete'；默認取 FILE_GC_ACTION
+
+    Returns:
+        dict: 本輪報告
+    """
+    dry_run = FILE_GC_DRY_RUN if dry_run is None else dry_run
+    action = action or FILE_GC_ACTION
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=FILE_GC_GRACE_HOURS)
+    report = {
+        'storage': _storage(),
+        'dry_run': dry_run,
+        'action': action,
+        'scanned': 0,
+        'orphans': 0,
+        'orphan_bytes': 0,
+        'in_grace_period': 0,
+        'processed': 0,
+        'failed': 0,
+        'samples': []
+    }
+
+    with get_db_connection() as conn:
+        start_after = '' if full else _load_cursor(conn)
+        # 全量掃描時不分頁
+        orphans, state = find_orphans(conn, start_after, limit=sys.maxsize if full else None)
+
+        for path, size, modified in orphans:
+            if modified > cutoff:
+                report['in_grace_period'] += 1
+                continue
+            report['orphans'] += 1
+            report['orphan_bytes'] += size or 0
+            if len(report['samples']) < FILE_GC_REPORT_LIMIT:
+                report['samples'].append({'path': path, 'size': size, 'last_modified': modified.isoformat()})
+            if dry_run:
+                continue
+            try:
+                if action == 'delete':
+                    schedule_file_deletion(path)
+                    processed = True
+                else:
+                    processed = _quarantine(path)
+                report['processed' if processed else 'failed'] += 1
+            except Exception as e:
+                report['failed'] += 1
+                logger.error("處理孤立文件失敗 %s: %s", path, str(e))
+
+        report['scanned'] = state['scanned']
+        # 引用流使用命名游標，需結束事務才能寫入狀態
+        conn.commit()
+        if not full:
+            # 本頁未掃滿說明已到末尾，下次從頭開始
+            reached_end = state['scanned'] < FILE_GC_PAGE_LIMIT
+            report['next_start_after'] = '' if reached_end else state['last_path']
+            if not dry_run:
+                _save_cursor(conn, report['next_start_after'])
+
+    logger.info(
+        "孤立文件回收%s: 掃描 %s 個，孤立 %s 個（%s 字節），寬限期內 %s 個，已處理 %s 個，失敗 %s 個",
+        '（試運行）' if dry_run else '', report['scanned'], report['orphans'], report['orphan_bytes'],
+        report['in_grace_period'], report['processed'], report['failed']
+    )
+    for sample in report['samples']:
+        logger.info("孤立文件: %s (%s 字節, %s)", sample['path'], sample['size'], sample['last_modified'])
+    return report
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='孤立文件回收')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--dry-run', action='store_true', help='只輸出報告，不做修改')
+    mode.add_argument('--apply', action='store_true', help='實際處理孤立文件（忽略 FILE_GC_DRY_RUN）')
+    parser.add_argument('--full', action='store_true', help='從頭掃描全部文件')
+    parser.add_argument('--action', choices=['quarantine', 'delete'], help='孤立文件的處理方式')
+    args = parser.parse_args(argv)
+
+    dry_run = None
+    if args.dry_run:
+        dry_run = True
+    elif args.apply:
+        dry_run = False
+    collect_orphaned_files(dry_run=dry_run, full=args.full, action=args.action)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""pytest 插件：在測試中檢查路由的 SQL 預算與 N+1 查詢
+
+使用方式::
+
+    pytest -p backend.utils.query_budget_plugin
+
+路由通過 ``@query_budget(n)`` 聲明預算，測試也可以用
+``@pytest.mark.query_budget(n)`` 為該測試中的所有請求指定預算。
+在 pytest.ini 中設置 ``query_budget_fail_on_n_plus_one = true``
+可讓疑似 N+1 的請求同樣導致測試失敗。
+"""
+import pytest
+from backend.utils import query_inspector
+
+def pytest_addoption(parser):
+    parser.addini(
+        'query_budget_fail_on_n_plus_one',
+        '疑似 N+1 查詢時令測試失敗',
+        type='bool',
+        default=False
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'query_budget(max_queries): 限制測試中每個請求的 SQL 次數'
+    )
+    query_inspector.enable_query_inspection()
+
+def pytest_unconfigure(config):
+    query_inspector.disable_query_inspection()
+
+def _format_problem(problem):
+    if problem['kind'] == 'budget':
+        return f"{problem['route']}: 執行了 {problem['count']} 次查詢，預算為 {problem['budget']}"
+    return f"{problem['route']}: {problem['call_site']} 重複執行 {problem['count']} 次: {problem['sql']}"
+
+@pytest.fixture(autouse=True)
+def _query_budget_guard(request):
+    """每個測試前清空記錄，測試結束後根據預算判定失敗"""
+    query_inspector.pop_violations()
+    marker = request.node.get_closest_marker('query_budget')
+    query_inspector.set_override_budget(marker.args[0] if marker else None)
+
+    yield
+
+    query_inspector.set_override_budget(None)
+    fail_on_n_plus_one = request.config.getini('query_budget_fail_on_n_plus_one')
+    failures = [
+        problem for problem in query_inspector.pop_violations()
+        if problem['kind'] == 'budget' or fail_on_n_plus_one
+    ]
+    if failures:
+        pytest.fail('SQL 查詢超出預算:\n' + '\n'.join(_format_problem(p) for p in failures), pytrace=False)
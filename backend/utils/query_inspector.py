@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import logging
+import threading
+from collections import deque
+from flask import g, request, has_request_context
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 開發/CI 環境設置 DB_QUERY_DEBUG=true 啟用，生產環境默認關閉
+QUERY_DEBUG_ENABLED = os.getenv('DB_QUERY_DEBUG', 'false').lower() == 'true'
+# 同一語句形狀在單個請求中重複達到此次數即視為 N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('DB_N_PLUS_ONE_THRESHOLD', 5))
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = (
+    os.path.join(_BACKEND_DIR, 'config', 'database.py'),
+    os.path.abspath(__file__),
+)
+
+# 記錄超出預算或疑似 N+1 的請求，供 pytest 插件讀取，限制長度避免長期運行時無限增長
+_violations = deque(maxlen=1000)
+_violations_lock = threading.Lock()
+
+# pytest 標記設置的預算，優先於路由聲明的預算
+_override_budget = None
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint_sql(query):
+    """將 SQL 歸一化為語句形狀：去除字面量、合併 IN 列表與空白"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed 等對象
+        query = str(query)
+    shape = _STRING_LITERAL.sub('?', query)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip().lower()
+
+def find_call_site():
+    """找到發起 SQL 的業務代碼位置（跳過資料庫封裝層）"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_BACKEND_DIR) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, _BACKEND_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+def query_budget(max_queries):
+    """聲明路由的 SQL 次數預算
+
+    僅作為元數據，在調試模式或 pytest 插件中檢查，不影響生產環境。
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+def _query_listener(cursor, query, vars, duration):
+    """SQL 執行監聽器：按語句形狀統計當前請求的查詢"""
+    if not has_request_context():
+        return
+    shapes = getattr(g, 'query_shapes', None)
+    if shapes is None:
+        shapes = g.query_shapes = {}
+    fingerprint = fingerprint_sql(query)
+    entry = shapes.get(fingerprint)
+    if entry is None:
+        shapes[fingerprint] = {'count': 1, 'call_site': find_call_site(), 'time': duration}
+    else:
+        entry['count'] += 1
+        entry['time'] += duration
+
+def enable_query_inspection():
+    """啟用 N+1 檢測（注册 SQL 監聽器）"""
+    global QUERY_DEBUG_ENABLED
+    from backend.config.database import register_query_listener
+    register_query_listener(_query_listener)
+    QUERY_DEBUG_ENABLED = True
+
+def disable_query_inspection():
+    """停用 N+1 檢測"""
+    global QUERY_DEBUG_ENABLED
+    from backend.config.database import unregister_query_listener
+    unregister_query_listener(_query_listener)
+    QUERY_DEBUG_ENABLED = False
+
+def set_override_budget(max_queries):
+    """設置覆蓋所有路由的 SQL 預算，傳入 None 取消"""
+    global _override_budget
+    _override_budget = max_queries
+
+def _get_route_budget(app):
+    if _override_budget is not None:
+        return _override_budget
+    view = app.view_functions.get(request.endpoint) if request.endpoint else None
+    return getattr(view, 'query_budget', None)
+
+def finish_query_inspection(app, query_count):
+    """在 after_request 中調用，報告重複語句與超出預算的路由"""
+    if not QUERY_DEBUG_ENABLED:
+        return []
+
+    shapes = getattr(g, 'query_shapes', None) or {}
+    route = f"{request.method} {request.path} ({request.endpoint})"
+    problems = []
+
+    for fingerprint, entry in shapes.items():
+        if entry['count'] >= N_PLUS_ONE_THRESHOLD:
+            problems.append({
+                'kind': 'n_plus_one',
+                'route': route,
+                'count': entry['count'],
+                'call_site': entry['call_site'],
+                'sql': fingerprint[:300]
+            })
+            logger.warning(
+                "疑似 N+1 查詢: %s 在 %s 執行了 %s 次相同語句: %s",
+                route, entry['call_site'], entry['count'], fingerprint[:300]
+            )
+
+    budget = _get_route_budget(app)
+    if budget is not None and query_count > budget:
+        problems.append({
+            'kind': 'budget',
+            'route': route,
+            'count': query_count,
+            'budget': budget
+        })
+        logger.warning("路由超出 SQL 預算: %s 執行了 %s 次查詢，預算為 %s", route, query_count, budget)
+
+    if problems:
+        with _violations_lock:
+            _violations.extend(problems)
+    return problems
+
+def pop_violations():
+    """取出並清空已記錄的問題"""
+    with _violations_lock:
+        problems = list(_violations)
+        _violations.clear()
+    return problems
+
+if QUERY_DEBUG_ENABLED:
+    enable_query_inspection()
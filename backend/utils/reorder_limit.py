@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+import threading
+from backend.config.database import get_db_connection
+from backend.utils.lru_cache import LRUCache
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# 緩存的客戶數
+REORDER_LIMIT_CACHE_SIZE = int(os.getenv('REORDER_LIMIT_CACHE_SIZE', 4096))
+# 重複下單限制天數的緩存秒數（版本號變更時會提前清空）
+REORDER_LIMIT_CACHE_TTL = float(os.getenv('REORDER_LIMIT_CACHE_TTL', 600))
+# 向資料庫確認版本號的間隔（秒）；版本號由 customers 上的觸發器維護
+REORDER_LIMIT_VERSION_CHECK = float(os.getenv('REORDER_LIMIT_VERSION_CHECK', 5))
+
+_INACTIVE = ()
+
+# 每個商品只取限制期內最近的一筆有效訂單
+_RECENT_ORDERS_SQL = """
+    SELECT DISTINCT ON (od.product_id)
+           od.product_id, o.order_number, o.created_at
+    FROM orders o
+    JOIN order_details od ON o.id = od.order_id
+    WHERE o.customer_id = %s
+      AND od.product_id = ANY(%s)
+      AND (od.order_status IS NULL OR od.order_status NOT IN ('已取消'))
+      AND o.created_at >= CURRENT_DATE - make_interval(days => %s)
+    ORDER BY od.product_id, o.created_at DESC
+"""
+
+class ReorderLimitCache:
+    """客戶重複下單限制天數的進程內緩存
+
+    停用或不存在的客戶也會緩存，其他進程修改客戶後，本進程最遲在
+    REORDER_LIMIT_VERSION_CHECK 秒後清空緩存。
+    """
+
+    def __init__(self, maxsize=REORDER_LIMIT_CACHE_SIZE, ttl=REORDER_LIMIT_CACHE_TTL,
+                 version_check=REORDER_LIMIT_VERSION_CHECK):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.version_check = version_check
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def _check_version(self, cursor):
+        """按間隔讀取版本號，變更時清空緩存"""
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.version_check:
+                return
+            self._checked_at = time.monotonic()
+        cursor.execute("SELECT version FROM cache_versions WHERE name = 'customer_reorder_limits'")
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.debug("重複下單限制版本變更 %s -> %s，清空緩存", self._version, version)
+                self._cache.clear()
+                self._version = version
+
+    def get(self, customer_id, cursor=None):
+        """獲取 active 客戶的重複下單限制天數
+
+        Args:
+            customer_id: 客戶ID
+            cursor: 可選，調用方已有的資料庫游標，避免另取連接
+
+        Returns:
+            限制天數（0 表示不限制），客戶不存在或已停用時為 None
+        """
+        if cursor is None:
+            with get_db_connection() as conn:
+                return self.get(customer_id, conn.cursor())
+
+        # 請求中的客戶ID可能是字符串，統一為整數，與 invalidate 使用同一個鍵
+        customer_id = int(customer_id)
+        self._check_version(cursor)
+        cached = self._cache.get(customer_id)
+        if cached is not None:
+            return None if cached is _INACTIVE else cached
+
+        cursor.execute("""
+            SELECT reorder_limit_days FROM customers
+            WHERE id = %s AND status = 'active'
+        """, (customer_id,))
+        row = cursor.fetchone()
+        if not row:
+            self._cache.set(customer_id, _INACTIVE)
+            return None
+        limit_days = row[0] or 0
+        self._cache.set(customer_id, limit_days)
+        return limit_days
+
+    def invalidate(self, customer_id=None):
+        """本進程修改客戶後調用；不帶參數時清空全部"""
+        if customer_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(int(customer_id))
+
+reorder_limit_cache = ReorderLimitCache()
+
+def find_recent_orders(cursor, customer_id, product_ids, limit_days):
+    """一次查詢多個商品在限制天數內最近的有效訂單
+
+    Returns:
+        dict: product_id -> (訂單編號, 下單時間)，只包含限制期內訂購過的商品
+    """
+    if limit_days <= 0 or not product_ids:
+        return {}
+    cursor.execute(_RECENT_ORDERS_SQL, (customer_id, list(product_ids), limit_days))
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
@@ -0,0 +1,46 @@
+import time
+from flask import g, has_request_context
+
+def start_request_stats():
+    """在請求開始時初始化計數器"""
+    g.request_stats = {
+        'started_at': time.perf_counter(),
+        'db_queries': 0,
+        'db_time': 0.0,
+        'db_rows': 0,
+        'pool_wait': 0.0
+    }
+    return g.request_stats
+
+def get_request_stats():
+    """獲取當前請求的統計數據，不在請求上下文中（如調度任務）時返回 None"""
+    if not has_request_context():
+        return None
+    return getattr(g, 'request_stats', None)
+
+def get_request_latency():
+    """獲取當前請求已耗費的秒數"""
+    stats = get_request_stats()
+    if stats is None:
+        return None
+    return time.perf_counter() - stats['started_at']
+
+def record_query(duration, rows=0):
+    """累加一次 SQL 執行的耗時與返回行數"""
+    stats = get_request_stats()
+    if stats is not None:
+        stats['db_queries'] += 1
+        stats['db_time'] += duration
+        stats['db_rows'] += rows
+
+def record_rows(rows):
+    """累加 fetch 返回的行數"""
+    stats = get_request_stats()
+    if stats is not None:
+        stats['db_rows'] += rows
+
+def record_pool_wait(duration):
+    """累加從連接池獲取連接的等待時間"""
+    stats = get_request_stats()
+    if stats is not None:
+        stats['pool_wait'] += duration
@@ -1,13 +1,27 @@
+import os
 import logging
+import threading
 import datetime
 import sys
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
 from pytz import timezone
-from backend.config.database import get_db_connection
+from backend.config.database import get_db_connection, create_dedicated_connection
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import psycopg2
+import time
+from functools import wraps
+from backend.utils.metrics import (
+    SCHEDULER_JOB_DURATION,
+    SCHEDULER_JOB_FAILURES,
+    SCHEDULER_JOB_RUNS,
+    SCHEDULER_JOB_LAST_SUCCESS,
+    SCHEDULER_IS_LEADER
+)
+from backend.utils.file_cleanup import process_pending_file_deletions
+from backend.utils.orphan_gc import collect_orphaned_files
+from backend.utils.locked_dates_cache import locked_dates_cache
 
 # 配置日志系统，同时解决编码问题
 logging.basicConfig(
@@ -20,8 +34,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger("date_cleaner")
 
-# 全局调度器
+# 全局调度器（僅在領導者進程中存在）
 scheduler = None
+# 領導者選舉線程
+_elector = None
+
+# 已註冊的周期任務：job_id -> 任務配置
+_job_registry = {}
+_registry_lock = threading.Lock()
+
+# 設為 false 時本進程不參與調度（例如只處理請求的節點）
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+# 所有進程共用的 advisory lock 鍵
+SCHEDULER_LOCK_KEY = int(os.getenv('SCHEDULER_LOCK_KEY', 72450001))
+# 非領導者重試搶鎖、領導者檢查連接的間隔（秒）
+SCHEDULER_LEADER_POLL_SECONDS = int(os.getenv('SCHEDULER_LEADER_POLL_SECONDS', 15))
+
+# 待刪除文件的處理間隔（秒）
+FILE_DELETION_INTERVAL_SECONDS = int(os.getenv('FILE_DELETION_INTERVAL_SECONDS', 60))
+# 孤立文件回收的執行時間（每天，小時）
+FILE_GC_HOUR = int(os.getenv('FILE_GC_HOUR', 3))
 
 def log_retry(retry_state):
     """自定義重試日誌函數"""
@@ -51,12 +83,7 @@ def clean_expired_dates():
                     if conn.closed:
                         raise psycopg2.InterfaceError("資料庫連接已關閉")
                     
-                    # 首先查询所有日期，检查是否有过期日期
-                    cursor.execute("SELECT id, locked_date FROM locked_dates ORDER BY locked_date")
-                    all_dates = cursor.fetchall()
-                    logger.info(f"資料庫中的所有日期: {[row[1].isoformat() for row in all_dates]}")
-                    
-                    # 查询并删除过期的锁定日期（早于今天的日期）
+                    # 查询并删除过期的锁定日期（早于今天的日期），RETURNING 已足夠記錄日誌
                     cursor.execute("""
                         DELETE FROM locked_dates 
                         WHERE locked_date < %s::date
@@ -69,6 +96,9 @@ def clean_expired_dates():
                     # 提交事務
                     conn.commit()
                     logger.info(f"已提交事務，刪除了 {deleted_count} 條記錄")
+                    if deleted_count > 0:
+                        # 其他進程通過 cache_versions 版本號感知變更
+                        locked_dates_cache.invalidate()
                     
                     if deleted_count > 0:
                         deleted_ids = [row[0] for row in deleted_rows]
@@ -97,6 +127,23 @@ def clean_expired_dates():
         
     return deleted_count
 
+def timed_job(job_name, func):
+    """包裝調度任務，記錄執行次數、耗時、失敗次數與最近成功時間"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        SCHEDULER_JOB_RUNS.inc(labels=(job_name,))
+        try:
+            result = func(*args, **kwargs)
+            SCHEDULER_JOB_LAST_SUCCESS.set(time.time(), labels=(job_name,))
+            return result
+        except Exception:
+            SCHEDULER_JOB_FAILURES.inc(labels=(job_name,))
+            raise
+        finally:
+            SCHEDULER_JOB_DURATION.observe(time.perf_counter() - start, labels=(job_name,))
+    return wrapper
+
 def job_listener(event):
     """作業執行監聽器"""
     if event.exception:
@@ -104,89 +151,259 @@ def job_listener(event):
         logger.exception("詳細錯誤信息", exc_info=event.exception)
     else:
         job_id = event.job_id
-        logger.info(f"任務 {job_id} 執行成功，清理了 {event.retval} 個過期日期")
+        # 啟動時執行的一次性任務與周期任務共用同一個結果格式
+        base_id = job_id[:-len('_on_start')] if job_id.endswith('_on_start') else job_id
+        if base_id == 'orphan_file_gc_job':
+            logger.info(f"任務 {job_id} 執行成功，發現 {event.retval['orphans']} 個孤立文件")
+        elif base_id == 'file_deletion_job':
+            if event.retval:
+                logger.info(f"任務 {job_id} 執行成功，刪除了 {event.retval} 條待刪除文件記錄")
+        elif base_id == 'clean_expired_dates_job':
+            logger.info(f"任務 {job_id} 執行成功，清理了 {event.retval} 個過期日期")
+        else:
+            logger.info(f"任務 {job_id} 執行成功")
 
-def initialize_scheduler():
-    """初始化和启动调度器"""
+def register_job(job_id, func, trigger, name=None, metric_name=None, run_on_start=False, **trigger_args):
+    """註冊周期任務
+
+    任務只在當選領導者的進程中執行；調度器已在運行時立即加入。
+
+    Args:
+        job_id: 任務 ID
+        func: 任務函數
+        trigger: APScheduler 觸發器或觸發器名稱（'interval'、'cron' 等）
+        name: 任務說明
+        metric_name: 指標中的 job 標籤，默認為函數名
+        run_on_start: 成為領導者後是否先執行一次
+        trigger_args: 傳給觸發器的參數，例如 seconds=60
+    """
+    job = {
+        'func': func,
+        'trigger': trigger,
+        'trigger_args': trigger_args,
+        'name': name or job_id,
+        'metric_name': metric_name or func.__name__,
+        'run_on_start': run_on_start
+    }
+    with _registry_lock:
+        _job_registry[job_id] = job
+        current = scheduler
+    if current is not None and current.running:
+        _add_job(current, job_id, job)
+
+def _add_job(sched, job_id, job):
+    func = timed_job(job['metric_name'], job['func'])
+    sched.add_job(
+        func,
+        job['trigger'],
+        id=job_id,
+        name=job['name'],
+        replace_existing=True,
+        max_instances=1,  # 確保同一時間只有一個實例在運行
+        **job['trigger_args']
+    )
+    if job['run_on_start']:
+        sched.add_job(
+            func,
+            'date',
+            run_date=datetime.datetime.now(sched.timezone) + datetime.timedelta(seconds=10),
+            id=f"{job_id}_on_start",
+            name=f"{job['name']}（啟動時執行）",
+            replace_existing=True,
+            max_instances=1
+        )
+
+def _start_scheduler():
+    """在當選領導者後創建並啟動調度器，加入所有已註冊的任務"""
     global scheduler
     
-    if scheduler is not None and scheduler.running:
-        logger.info("調度器已經在運行中")
-        return scheduler
-    
     logger.info("初始化調度器")
     
-    try:
-        tz = timezone('Asia/Taipei')
-        logger.info(f"使用時區: {tz.zone}, 當前時間: {datetime.datetime.now(tz).isoformat()}")
-        
-        # 修改調度器配置
-        scheduler = BackgroundScheduler(
-            timezone=tz,
-            job_defaults={
-                'coalesce': True,  # 合併錯過的任務
-                'max_instances': 1,  # 限制同時運行的實例數
-                'misfire_grace_time': 300,  # 錯過執行的寬限時間（秒）
-                'retry': {  # 添加任務重試配置
-                    'max_attempts': 3,
-                    'delay': 30
-                }
+    tz = timezone('Asia/Taipei')
+    logger.info(f"使用時區: {tz.zone}, 當前時間: {datetime.datetime.now(tz).isoformat()}")
+    
+    # 修改調度器配置
+    new_scheduler = BackgroundScheduler(
+        timezone=tz,
+        job_defaults={
+            'coalesce': True,  # 合併錯過的任務
+            'max_instances': 1,  # 限制同時運行的實例數
+            'misfire_grace_time': 300,  # 錯過執行的寬限時間（秒）
+            'retry': {  # 添加任務重試配置
+                'max_attempts': 3,
+                'delay': 30
             }
-        )
-        
-        # 添加任务执行监听器
-        scheduler.add_listener(
-            job_listener, 
-            EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
-        )
-        
-        # 添加定时任务：每天凌晨00:05执行清理
-        scheduler.add_job(
-            clean_expired_dates,
-            CronTrigger(hour=0, minute=5),  # 每天凌晨00:05执行
-            id='clean_expired_dates_job',
-            name='清理過期鎖定日期任務',
-            replace_existing=True,
-            max_instances=1  # 確保同一時間只有一個實例在運行
-        )
-        
-        # 添加任务立即执行一次，确保系统启动时就清理过期日期
-        scheduler.add_job(
-            clean_expired_dates,
-            'date',
-            run_date=datetime.datetime.now(tz) + datetime.timedelta(seconds=10),
-            id='initial_clean_job',
-            name='初始清理過期鎖定日期任務',
-            max_instances=1
-        )
-        
-        # 启动调度器
-        scheduler.start()
-        logger.info("調度器已成功啟動")
-        
-        # 打印已调度的任务
-        for job in scheduler.get_jobs():
-            next_run = job.next_run_time.strftime("%Y-%m-%d %H:%M:%S") if job.next_run_time else "無"
-            logger.info(f"已調度任務: {job.id} ({job.name}), 下次執行時間: {next_run}")
-        
-        return scheduler
-    except Exception as e:
-        logger.error(f"啟動調度器時發生錯誤: {str(e)}")
-        logger.exception("詳細錯誤信息")
-        raise
+        }
+    )
+    
+    # 添加任务执行监听器
+    new_scheduler.add_listener(
+        job_listener, 
+        EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
+    )
+    
+    with _registry_lock:
+        jobs = list(_job_registry.items())
+        scheduler = new_scheduler
+    for job_id, job in jobs:
+        _add_job(new_scheduler, job_id, job)
+    
+    # 启动调度器
+    new_scheduler.start()
+    logger.info("調度器已成功啟動")
+    
+    # 打印已调度的任务
+    for job in new_scheduler.get_jobs():
+        next_run = job.next_run_time.strftime("%Y-%m-%d %H:%M:%S") if job.next_run_time else "無"
+        logger.info(f"已調度任務: {job.id} ({job.name}), 下次執行時間: {next_run}")
 
-def shutdown_scheduler():
-    """关闭调度器"""
+def _stop_scheduler(wait=True):
     global scheduler
-    if scheduler and scheduler.running:
+    with _registry_lock:
+        current = scheduler
+        scheduler = None
+    if current and current.running:
         try:
-            scheduler.shutdown(wait=True)  # 等待所有正在運行的任務完成
+            current.shutdown(wait=wait)  # 等待所有正在運行的任務完成
             logger.info("調度器已正常關閉")
         except Exception as e:
             logger.error(f"關閉調度器時發生錯誤: {str(e)}")
             logger.exception("詳細錯誤信息")
-        finally:
-            scheduler = None
+
+class SchedulerLeaderElector(threading.Thread):
+    """通過 Postgres advisory lock 選出唯一執行調度任務的進程
+
+    每個 gunicorn worker 都運行本線程；搶到鎖的進程啟動調度器，其餘進程定期重試。
+    鎖綁定在獨立連接的會話上，領導者進程退出或連接斷開時由資料庫自動釋放，
+    其他進程在下一次重試時接任。
+    """
+
+    def __init__(self, lock_key=SCHEDULER_LOCK_KEY, poll_seconds=SCHEDULER_LEADER_POLL_SECONDS):
+        super().__init__(name='scheduler-leader-elector', daemon=True)
+        self.lock_key = lock_key
+        self.poll_seconds = poll_seconds
+        self._stop_event = threading.Event()
+        # 搶鎖使用的獨立連接，非領導者重試時復用，斷開後重新建立
+        self._conn = None
+        self._leader = False
+
+    @property
+    def is_leader(self):
+        return self._leader
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = create_dedicated_connection()
+            self._conn.autocommit = True
+        return self._conn
+
+    def _try_acquire(self):
+        try:
+            with self._connection().cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+                acquired = cursor.fetchone()[0]
+        except Exception:
+            self._close()
+            raise
+        self._leader = acquired
+        return acquired
+
+    def _heartbeat(self):
+        """確認持有鎖的連接仍然可用"""
+        with self._conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()  # 會話結束時鎖自動釋放
+            except Exception:
+                pass
+
+    def _release(self):
+        self._leader = False
+        SCHEDULER_IS_LEADER.set(0)
+        self._close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                if not self.is_leader:
+                    if self._try_acquire():
+                        logger.info(f"進程 {os.getpid()} 成為調度領導者")
+                        SCHEDULER_IS_LEADER.set(1)
+                        _start_scheduler()
+                else:
+                    self._heartbeat()
+            except Exception as e:
+                if self.is_leader:
+                    logger.error(f"調度領導者連接失效，停止調度器: {str(e)}")
+                    # 鎖可能已被其他進程接管，不等待正在執行的任務
+                    _stop_scheduler(wait=False)
+                    self._release()
+                else:
+                    logger.warning(f"嘗試成為調度領導者失敗: {str(e)}")
+            self._stop_event.wait(self.poll_seconds)
+
+    def stop(self):
+        """停止選舉並交出領導權"""
+        self._stop_event.set()
+        if self.is_leader:
+            _stop_scheduler(wait=True)
+        self._release()
+
+def initialize_scheduler():
+    """啟動調度領導者選舉，當選的進程才會啟動調度器"""
+    global _elector
+    
+    if not SCHEDULER_ENABLED:
+        logger.info("調度器已通過 SCHEDULER_ENABLED 停用")
+        return None
+    
+    if _elector is not None and _elector.is_alive():
+        logger.info("調度器已經在運行中")
+        return _elector
+    
+    try:
+        _elector = SchedulerLeaderElector()
+        _elector.start()
+        return _elector
+    except Exception as e:
+        logger.error(f"啟動調度器時發生錯誤: {str(e)}")
+        logger.exception("詳細錯誤信息")
+        raise
+
+def shutdown_scheduler():
+    """关闭调度器并释放领导权"""
+    global _elector
+    if _elector is not None:
+        _elector.stop()
+        _elector = None
+    else:
+        _stop_scheduler(wait=True)
+
+# 註冊內置任務
+# 每天凌晨00:05执行清理，並在成為領導者時先執行一次，确保系统启动时就清理过期日期
+register_job(
+    'clean_expired_dates_job', clean_expired_dates,
+    CronTrigger(hour=0, minute=5),
+    name='清理過期鎖定日期任務',
+    run_on_start=True
+)
+# 批量執行登記的文件刪除，失敗的記錄會在之後重試
+register_job(
+    'file_deletion_job', process_pending_file_deletions,
+    'interval', seconds=FILE_DELETION_INTERVAL_SECONDS,
+    name='批量刪除待刪除文件任務'
+)
+# 每天增量掃描一頁存儲，回收未被產品引用的孤立文件
+register_job(
+    'orphan_file_gc_job', collect_orphaned_files,
+    CronTrigger(hour=FILE_GC_HOUR, minute=30),
+    name='孤立文件回收任務'
+)
 
 # 手动执行清理，用于测试
 def run_clean_task_manually():
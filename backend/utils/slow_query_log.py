@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import queue
+import random
+import logging
+import threading
+from collections import deque
+from flask import request, has_request_context
+from backend.config.database import register_query_listener, get_db_connection
+from backend.utils.query_inspector import find_call_site
+
+# 慢查詢使用獨立 logger，方便單獨過濾
+logger = logging.getLogger('slow_query')
+
+# 超過此耗時（毫秒）的語句記為慢查詢，設為 0 停用
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '500'))
+# 慢查詢重新以 EXPLAIN (ANALYZE, BUFFERS) 執行的採樣率，默認關閉
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0'))
+# 環形緩衝區大小（每個 worker 各自保存）
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', 100))
+# 等待 EXPLAIN 的慢查詢數上限，超出時丟棄採樣
+SLOW_QUERY_EXPLAIN_QUEUE_SIZE = int(os.getenv('SLOW_QUERY_EXPLAIN_QUEUE_SIZE', 20))
+# 單次 EXPLAIN ANALYZE 的語句超時（毫秒）
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 30000))
+
+# 有副作用或會改變會話狀態的函數，包含時不重新執行
+_SIDE_EFFECT_FUNCTIONS = re.compile(
+    r'\b(nextval|setval|pg_notify|pg_\w*advisory\w*|pg_sleep\w*|set_config|txid_current|'
+    r'pg_current_xact_id|pg_terminate_backend|pg_cancel_backend|pg_reload_conf|'
+    r'dblink\w*|lo_\w+|pg_stat_reset\w*|pg_logical_emit_message)\s*\(',
+    re.IGNORECASE
+)
+
+_entries = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_entries_lock = threading.Lock()
+
+def _query_text(query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return str(query)
+
+def _is_read_only(sql):
+    """只對純查詢語句執行 EXPLAIN ANALYZE，避免重複執行寫操作或有副作用的函數"""
+    head = ' '.join(sql.split()).lower() + ' '
+    if not (head.startswith('select') or head.startswith('with')):
+        return False
+    if any(keyword in head for keyword in ('insert ', 'update ', 'delete ', 'for update', 'for share', 'into ')):
+        return False
+    return not _SIDE_EFFECT_FUNCTIONS.search(sql)
+
+class _ExplainWorker:
+    """後台線程在獨立連接上執行 EXPLAIN，不佔用請求線程與請求的事務"""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=SLOW_QUERY_EXPLAIN_QUEUE_SIZE)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """啟動當前進程的 EXPLAIN 線程（gunicorn fork 後重新創建）"""
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._queue = queue.Queue(maxsize=SLOW_QUERY_EXPLAIN_QUEUE_SIZE)
+            threading.Thread(target=self._run, name='slow-query-explain', daemon=True).start()
+
+    def submit(self, entry, sql):
+        """排隊執行 EXPLAIN，完成後寫入 entry['plan']；隊列已滿時放棄"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((entry, sql))
+        except queue.Full:
+            logger.debug("EXPLAIN 隊列已滿，跳過採樣")
+
+    def _run(self):
+        while True:
+            entry, sql = self._queue.get()
+            entry['plan'] = _explain(sql)
+
+_explain_worker = _ExplainWorker()
+
+def _explain(sql):
+    """在只讀事務中以 EXPLAIN (ANALYZE, BUFFERS) 重新執行語句，結束後回滾"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # 只讀事務拒絕任何寫入，回滾確保不留下任何狀態
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", (SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) {sql}")
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                conn.rollback()
+                cursor.close()
+    except Exception as e:
+        logger.warning("EXPLAIN 慢查詢失敗: %s", str(e))
+        return None
+
+def _slow_query_listener(cursor, query, vars, duration):
+    duration_ms = duration * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+
+    sql = _query_text(query)
+    route = f"{request.method} {request.endpoint}" if has_request_context() else 'background'
+    call_site = find_call_site()
+
+    # 只記錄參數化的 SQL，不記錄參數值
+    logger.warning(
+        "慢查詢 %.1fms route=%s call_site=%s sql=%s",
+        duration_ms, route, call_site, ' '.join(sql.split())[:2000]
+    )
+
+    entry = {
+        'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'duration_ms': round(duration_ms, 2),
+        'route': route,
+        'call_site': call_site,
+        'sql': sql,
+        'plan': None
+    }
+    with _entries_lock:
+        _entries.append(entry)
+
+    if (SLOW_QUERY_EXPLAIN_SAMPLE_RATE > 0 and _is_read_only(sql)
+            and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE):
+        try:
+            # mogrify 只在客戶端拼接參數，不會訪問資料庫
+            bound_sql = cursor.mogrify(query, vars) if vars is not None else query
+        except Exception as e:
+            logger.debug("無法綁定慢查詢參數: %s", str(e))
+        else:
+            _explain_worker.submit(entry, _query_text(bound_sql))
+
+def get_slow_queries(limit=None):
+    """獲取緩衝區中的慢查詢，最新的在前"""
+    with _entries_lock:
+        entries = list(_entries)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+def clear_slow_queries():
+    with _entries_lock:
+        _entries.clear()
+
+if SLOW_QUERY_THRESHOLD_MS > 0:
+    register_query_listener(_slow_query_listener)
@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+import jwt
+from flask import request, g
+
+# 獲取 logger
+logger = logging.getLogger(__name__)
+
+# JWT 簽名配置，未設置獨立密鑰時沿用 session 密鑰
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY') or os.getenv('SESSION_SECRET_KEY')
+JWT_ALGORITHM = 'HS256'
+ACCESS_TOKEN_EXPIRES = int(os.getenv('ACCESS_TOKEN_EXPIRES', 900))  # 15分鐘
+REFRESH_TOKEN_EXPIRES = int(os.getenv('REFRESH_TOKEN_EXPIRES', 7 * 24 * 3600))  # 7天
+
+# 過渡期間是否接受舊的純數字 admin_id Bearer token
+ALLOW_LEGACY_BEARER = os.getenv('ALLOW_LEGACY_BEARER', 'false').lower() == 'true'
+
+# 權限位元順序，只能在尾部追加，否則已簽發的 token 會解讀錯誤
+PERMISSION_FIELDS = (
+    'can_approve_orders',
+    'can_edit_orders',
+    'can_close_order_dates',
+    'can_add_customer',
+    'can_add_product',
+    'can_add_personnel',
+    'can_view_system_logs',
+    'can_decide_product_view',
+)
+
+USER_TYPE_ADMIN = 'admin'
+USER_TYPE_CUSTOMER = 'customer'
+
+def encode_permissions(permissions):
+    """將權限字典壓縮為整數位元集"""
+    bits = 0
+    for index, field in enumerate(PERMISSION_FIELDS):
+        if permissions and permissions.get(field):
+            bits |= 1 << index
+    return bits
+
+def decode_permissions(bits):
+    """將整數位元集還原為權限字典"""
+    bits = int(bits or 0)
+    return {field: bool(bits & (1 << index)) for index, field in enumerate(PERMISSION_FIELDS)}
+
+def _encode(claims, expires_in):
+    now = int(time.time())
+    payload = dict(claims, iat=now, exp=now + expires_in)
+    token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    # PyJWT 1.x 返回 bytes
+    return token.decode('utf-8') if isinstance(token, bytes) else token
+
+def create_access_token(user_id, user_type, permissions=None, company_name=None):
+    """簽發短期 access token
+
+    Args:
+        user_id: 管理員或客戶ID
+        user_type: 'admin' 或 'customer'
+        permissions: 管理員權限字典，會以位元集形式嵌入
+        company_name: 客戶公司名稱
+
+    Returns:
+        str: 已簽名的 JWT
+    """
+    claims = {'sub': str(user_id), 'typ': 'access', 'utp': user_type}
+    if user_type == USER_TYPE_ADMIN:
+        claims['perm'] = encode_permissions(permissions)
+    if company_name:
+        claims['cmp'] = company_name
+    return _encode(claims, ACCESS_TOKEN_EXPIRES)
+
+def create_refresh_token(user_id, user_type):
+    """簽發長期 refresh token，只用於換取新的 access token"""
+    claims = {'sub': str(user_id), 'typ': 'refresh', 'utp': user_type}
+    return _encode(claims, REFRESH_TOKEN_EXPIRES)
+
+def issue_token_pair(user_id, user_type, permissions=None, company_name=None):
+    """簽發 access/refresh token 組合，供登入與刷新接口返回"""
+    return {
+        'access_token': create_access_token(user_id, user_type, permissions, company_name),
+        'refresh_token': create_refresh_token(user_id, user_type),
+        'token_type': 'Bearer',
+        'expires_in': ACCESS_TOKEN_EXPIRES
+    }
+
+def create_upload_ticket(blob_path, original_filename, file_type, product_name, expires_in):
+    """簽發直傳憑證，提交上傳時據此確認 blob 路徑由後端分配"""
+    claims = {
+        'typ': 'upload',
+        'blob': blob_path,
+        'ofn': original_filename,
+        'ftp': file_type,
+        'prd': product_name
+    }
+    return _encode(claims, expires_in)
+
+def decode_token(token, expected_type='access'):
+    """驗證簽名並解析 token
+
+    Returns:
+        dict: token 中的 claims
+
+    Raises:
+        jwt.InvalidTokenError: 簽名錯誤、過期或類型不符
+    """
+    claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    if claims.get('typ') != expected_type:
+        raise jwt.InvalidTokenError(f"token 類型不符: {claims.get('typ')}")
+    return claims
+
+def get_bearer_token():
+    """從 Authorization header 中取出 Bearer token"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1].strip() or None
+    return None
+
+def load_request_token():
+    """解析當前請求的 access token，結果存放於 g.token_claims / g.token_error
+
+    在 before_request 中調用一次，後續權限檢查直接讀取 g，無需再驗證或查詢資料庫。
+    """
+    g.token_claims = None
+    g.token_error = None
+
+    token = get_bearer_token()
+    if not token:
+        return None
+
+    # 過渡期間支持舊的純數字 admin_id
+    if ALLOW_LEGACY_BEARER and token.isdigit():
+        g.token_claims = {'sub': token, 'typ': 'legacy', 'utp': USER_TYPE_ADMIN}
+        return g.token_claims
+
+    try:
+        g.token_claims = decode_token(token)
+    except jwt.ExpiredSignatureError:
+        g.token_error = 'token_expired'
+    except jwt.InvalidTokenError as e:
+        logger.warning("無效的 access token: %s", str(e))
+        g.token_error = 'token_invalid'
+    return g.token_claims
+
+def get_token_claims():
+    """獲取當前請求已驗證的 token claims"""
+    return getattr(g, 'token_claims', None)
+
+def get_token_admin_id():
+    """從已驗證的 token 中獲取管理員ID，非管理員 token 返回 None"""
+    claims = get_token_claims()
+    if claims and claims.get('utp') == USER_TYPE_ADMIN:
+        try:
+            return int(claims['sub'])
+        except (KeyError, ValueError):
+            return None
+    return None
+
+def get_token_permissions():
+    """從已驗證的 token 中獲取權限字典，舊格式 token 不攜帶權限時返回 None"""
+    claims = get_token_claims()
+    if claims and claims.get('utp') == USER_TYPE_ADMIN and 'perm' in claims:
+        return decode_permissions(claims['perm'])
+    return None